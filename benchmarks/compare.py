@@ -0,0 +1,46 @@
+"""
+Compares two benchmark result files stage by stage.
+
+Usage: python benchmarks/compare.py BASELINE.json CANDIDATE.json [--fail-above 1.2]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+def load(path: Path) -> Dict[Tuple[str, str], float]:
+    data = json.loads(path.read_text())
+    return {(result["scenario"], result["stage"]): result["median"] for result in data["results"]}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument(
+        "--fail-above", type=float, default=None, help="exit with 1 when a stage is slower by more than this ratio"
+    )
+    args = parser.parse_args(argv)
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    regressions = []
+    print(f"{'scenario':32} {'stage':20} {'baseline':>10} {'candidate':>10} {'ratio':>7}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        ratio = candidate[key] / baseline[key] if baseline[key] else float("inf")
+        print(f"{key[0]:32} {key[1]:20} {baseline[key]:9.3f}s {candidate[key]:9.3f}s {ratio:6.2f}x")
+        if args.fail_above is not None and ratio > args.fail_above:
+            regressions.append(key)
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{key[0]:32} {key[1]:20} only in {'baseline' if key in baseline else 'candidate'}")
+
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than {args.fail_above}x the baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""
+Stand-in for `sam build` in the benchmarks: copies the function code and writes
+the built template without the SAM CLI.
+
+Usage: fake_sam.py build --template TEMPLATE --build-dir BUILD_DIR
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from poetry_aws_sam.staging import NativeStaging
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="sam")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--template", required=True)
+    parser.add_argument("--build-dir", required=True)
+    args, _ = parser.parse_known_args(argv)
+
+    NativeStaging(Path(args.template), Path(args.build_dir), excludes=[]).stage()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Times the stages of the build pipeline on synthetic projects and writes the
+results as json.
+
+Usage: python benchmarks/run.py [--functions 1 10] [--packages 10] [--repeat 3] [--output results.json]
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from cleo.io.null_io import NullIO
+from poetry.factory import Factory
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from synthetic import SyntheticProject, generate  # noqa: E402
+
+from poetry_aws_sam.aws import Sam  # noqa: E402
+from poetry_aws_sam.export import ExportLock  # noqa: E402
+from poetry_aws_sam.platforms import group_by_target  # noqa: E402
+from poetry_aws_sam.sam import AwsBuilder  # noqa: E402
+from poetry_aws_sam.template import clear_template_cache  # noqa: E402
+from poetry_aws_sam.wheelhouse import Wheelhouse  # noqa: E402
+
+DEFAULT_FUNCTIONS = [1, 10, 100, 500]
+DEFAULT_PACKAGES = [10, 100]
+INSTALL_MODES = {
+    "link": {"link-dependencies": True},
+    "layer": {"as-layer": True},
+    "per-function": {},
+}
+
+
+def make_options(values: Dict) -> Callable:
+    def option(name, default=None):
+        return values.get(name, default)
+
+    return option
+
+
+def timed(function: Callable) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def fill_wheelhouse(project: SyntheticProject, wheelhouse_dir: Path, sam: Sam) -> None:
+    wheelhouse = Wheelhouse(wheelhouse_dir)
+    for target in group_by_target(sam.lambdas):
+        tag_dir = wheelhouse.tag_dir(target)
+        tag_dir.mkdir(parents=True, exist_ok=True)
+        for wheel in project.wheel_dir.glob("*.whl"):
+            shutil.copy2(wheel, tag_dir / wheel.name)
+
+
+def run_scenario(project: SyntheticProject, install_mode: str, jobs: int) -> Dict[str, float]:
+    """
+    Time each stage once: template parse, lock export, sam build and dependency install.
+    """
+    build_dir = project.root / ".aws-sam" / "build"
+    shutil.rmtree(project.root / ".aws-sam", ignore_errors=True)
+    poetry = Factory().create_poetry(project.root)
+    io = NullIO()
+    options = make_options(
+        {
+            "sam-template": project.template.name,
+            "without-hashes": True,
+            "extras": [],
+            "wheelhouse-dir": str(project.root / "wheelhouse"),
+            "offline": True,
+            "jobs": str(jobs),
+            **INSTALL_MODES[install_mode],
+        }
+    )
+    timings = {}
+
+    clear_template_cache()
+    sams = []
+    timings["template_parse"] = timed(
+        lambda: sams.append(Sam(sam_exec=str(project.sam_exec), template=project.template))
+    )
+    sam = sams[0]
+
+    requirements_file = project.root / "requirements-benchmark.txt"
+    timings["lock_export"] = timed(lambda: ExportLock(options, poetry, io).handle(requirements_file))
+    requirements_file.unlink()
+
+    results = []
+    timings["sam_build"] = timed(lambda: results.append(sam.invoke_sam_build(build_dir=str(build_dir))))
+    if results[0].returncode != 0:
+        raise RuntimeError(f"sam stand-in failed: {results[0].stderr}")
+
+    fill_wheelhouse(project, project.root / "wheelhouse", sam)
+    builder = AwsBuilder(options, poetry, io)
+    if install_mode == "layer":
+        timings["dependency_install"] = timed(lambda: builder.build_layer(sam))
+    else:
+        timings["dependency_install"] = timed(lambda: builder.build_lambdas(sam.lambdas))
+    return timings
+
+
+def git_revision() -> str:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False, cwd=Path(__file__).parent
+    )
+    return result.stdout.strip()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, nargs="+", default=DEFAULT_FUNCTIONS)
+    parser.add_argument("--packages", type=int, nargs="+", default=DEFAULT_PACKAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--install-mode", choices=sorted(INSTALL_MODES), default="link")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="poetry-aws-sam-bench-") as work_dir:
+        for functions in args.functions:
+            for packages in args.packages:
+                scenario = f"{functions}-functions-{packages}-packages"
+                project = generate(Path(work_dir) / scenario, functions, packages)
+                runs = [run_scenario(project, args.install_mode, args.jobs) for _ in range(args.repeat)]
+                for stage in runs[0]:
+                    samples = [run[stage] for run in runs]
+                    results.append(
+                        {
+                            "scenario": scenario,
+                            "functions": functions,
+                            "packages": packages,
+                            "stage": stage,
+                            "min": min(samples),
+                            "median": statistics.median(samples),
+                            "samples": samples,
+                        }
+                    )
+                    print(f"{scenario:32} {stage:20} median {statistics.median(samples):8.3f}s")
+                shutil.rmtree(project.root, ignore_errors=True)
+
+    data = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "revision": git_revision(),
+            "install_mode": args.install_mode,
+            "jobs": args.jobs,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(data, indent=2))
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Generates synthetic poetry-aws-sam projects for the benchmarks: a template with
+any number of functions, a poetry.lock of any number of packages, a local wheel
+index holding those packages and a stand-in for the `sam` executable.
+"""
+
+import base64
+import hashlib
+import stat
+import sys
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+import tomlkit
+from poetry.factory import Factory
+
+BENCHMARKS_DIR = Path(__file__).parent
+PACKAGE_VERSION = "1.0.0"
+# every package depends on the next DEPENDENCY_STRIDE packages of the lock
+DEPENDENCY_STRIDE = 2
+ARCHITECTURES = ["x86_64", "arm64"]
+
+
+@dataclass
+class SyntheticProject:
+    root: Path
+    template: Path
+    wheel_dir: Path
+    sam_exec: Path
+    functions: int
+    packages: int
+
+
+def package_name(index: int) -> str:
+    return f"bench-pkg-{index:04d}"
+
+
+def module_name(index: int) -> str:
+    return f"bench_pkg_{index:04d}"
+
+
+def dependencies(index: int, packages: int) -> List[int]:
+    return [dependency for dependency in range(index + 1, index + 1 + DEPENDENCY_STRIDE) if dependency < packages]
+
+
+def _record_line(path: str, content: bytes) -> str:
+    digest = base64.urlsafe_b64encode(hashlib.sha256(content).digest()).rstrip(b"=").decode()
+    return f"{path},sha256={digest},{len(content)}"
+
+
+def build_wheel(wheel_dir: Path, index: int, packages: int) -> Path:
+    """
+    Write a pure python wheel for the package `index` of the lock.
+    """
+    name, module = package_name(index), module_name(index)
+    dist_info = f"{module}-{PACKAGE_VERSION}.dist-info"
+    requires = "".join(f"Requires-Dist: {package_name(dependency)}\n" for dependency in dependencies(index, packages))
+    files = {
+        f"{module}/__init__.py": f"VALUE = {index}\n".encode(),
+        f"{dist_info}/METADATA": (
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {PACKAGE_VERSION}\n{requires}"
+        ).encode(),
+        f"{dist_info}/WHEEL": b"Wheel-Version: 1.0\nGenerator: poetry-aws-sam-benchmarks\nRoot-Is-Purelib: true\n"
+        b"Tag: py3-none-any\n",
+        f"{dist_info}/top_level.txt": f"{module}\n".encode(),
+    }
+    record = "\n".join(_record_line(path, content) for path, content in files.items())
+    files[f"{dist_info}/RECORD"] = f"{record}\n{dist_info}/RECORD,,\n".encode()
+
+    wheel = wheel_dir / f"{module}-{PACKAGE_VERSION}-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, content in files.items():
+            archive.writestr(path, content)
+    return wheel
+
+
+def _write_template(root: Path, functions: int) -> Path:
+    lines = [
+        "Transform: AWS::Serverless-2016-10-31",
+        "Globals:",
+        "  Function:",
+        "    Runtime: python3.11",
+        "Resources:",
+    ]
+    for index in range(functions):
+        architecture = ARCHITECTURES[index % len(ARCHITECTURES)]
+        lines += [
+            f"  Function{index:04d}:",
+            "    Type: AWS::Serverless::Function",
+            "    Properties:",
+            f"      CodeUri: functions/f{index:04d}",
+            "      Handler: app.handler.handler",
+            "      Architectures:",
+            f"        - {architecture}",
+        ]
+        code_dir = root / "functions" / f"f{index:04d}" / "app"
+        code_dir.mkdir(parents=True)
+        (code_dir / "__init__.py").write_text("")
+        (code_dir / "handler.py").write_text(
+            f"import {module_name(0)}\n\n\ndef handler(event, context):\n    return {index}\n"
+        )
+    template = root / "template.yaml"
+    template.write_text("\n".join(lines) + "\n")
+    return template
+
+
+def _write_project(root: Path, wheel_dir: Path, packages: int) -> None:
+    pyproject = {
+        "tool": {
+            "poetry": {
+                "name": "bench-project",
+                "version": "0.1.0",
+                "description": "",
+                "authors": [],
+                "packages": [],
+                "dependencies": {"python": "^3.10", **{package_name(index): "*" for index in range(packages)}},
+            }
+        }
+    }
+    (root / "pyproject.toml").write_text(tomlkit.dumps(pyproject))
+
+    lock_packages = []
+    for index in range(packages):
+        wheel = build_wheel(wheel_dir, index, packages)
+        package = tomlkit.table()
+        package["name"] = package_name(index)
+        package["version"] = PACKAGE_VERSION
+        package["description"] = ""
+        package["optional"] = False
+        package["python-versions"] = "*"
+        package["files"] = [{"file": wheel.name, "hash": f"sha256:{hashlib.sha256(wheel.read_bytes()).hexdigest()}"}]
+        requires = dependencies(index, packages)
+        if requires:
+            package["dependencies"] = {package_name(dependency): "*" for dependency in requires}
+        lock_packages.append(package)
+
+    poetry = Factory().create_poetry(root)
+    lock = tomlkit.document()
+    lock["package"] = lock_packages
+    lock["metadata"] = {
+        "lock-version": "2.0",
+        "python-versions": "^3.10",
+        "content-hash": poetry.locker._get_content_hash(),
+    }
+    (root / "poetry.lock").write_text(tomlkit.dumps(lock))
+
+
+def _write_sam_exec(root: Path) -> Path:
+    sam_exec = root / "sam"
+    sam_exec.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{BENCHMARKS_DIR / "fake_sam.py"}" "$@"\n')
+    sam_exec.chmod(sam_exec.stat().st_mode | stat.S_IEXEC)
+    return sam_exec
+
+
+def generate(root: Path, functions: int, packages: int) -> SyntheticProject:
+    root.mkdir(parents=True, exist_ok=True)
+    wheel_dir = root / "wheels"
+    wheel_dir.mkdir(exist_ok=True)
+    template = _write_template(root, functions)
+    _write_project(root, wheel_dir, packages)
+    return SyntheticProject(
+        root=root,
+        template=template,
+        wheel_dir=wheel_dir,
+        sam_exec=_write_sam_exec(root),
+        functions=functions,
+        packages=packages,
+    )
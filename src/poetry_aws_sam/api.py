@@ -0,0 +1,161 @@
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Union
+
+from cleo.exceptions import CleoValueError
+from cleo.io.inputs.string_input import StringInput
+from cleo.io.io import IO
+from cleo.io.outputs.null_output import NullOutput
+from cleo.io.outputs.output import Output
+from poetry.factory import Factory
+from poetry.poetry import Poetry
+
+from poetry_aws_sam.export import ExportCache
+from poetry_aws_sam.plugin import SAM_TEMPLATE_TXT, SamCommand
+
+# the statuses and errors are re-exported for the callers of `build`
+from poetry_aws_sam.sam import (
+    CANCELLED,
+    FAILED,
+    SUCCESS,
+    UNCHANGED,
+    AwsBuilder,
+    BuildError,
+    DependencyError,
+    FunctionBuildError,
+    OptionError,
+    PackageError,
+    ReportError,
+    SamBuildError,
+    TemplateError,
+)
+from poetry_aws_sam.slim import tree_size
+from poetry_aws_sam.timings import TimingHook
+
+# options of `poetry sam` that do not return
+UNSUPPORTED_OPTIONS = {"watch"}
+
+
+@dataclass
+class FunctionResult:
+    name: str
+    status: str
+    build_dir: Path
+    # bytes of the build dir, links not counted
+    size: int = 0
+    # wall seconds spent installing its dependencies
+    duration: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class BuildResult:
+    build_dir: Path
+    template: Path
+    duration: float
+    functions: Dict[str, FunctionResult] = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> bool:
+        return all(function.status in (SUCCESS, UNCHANGED) for function in self.functions.values())
+
+    @property
+    def failed(self) -> List[str]:
+        return [function.name for function in self.functions.values() if function.status == FAILED]
+
+
+def _input(options: Mapping[str, Any]) -> StringInput:
+    """
+    The options of `poetry sam` bound as if they were passed on the command line.
+    `jobs=4` and `"with": "docs"` are read as `--jobs 4` and `--with docs`.
+    """
+    definition = SamCommand().definition
+    command_input = StringInput("")
+    command_input.bind(definition)
+    for name, value in options.items():
+        name = name.replace("_", "-")
+        if name in UNSUPPORTED_OPTIONS:
+            raise OptionError(f"The '--{name}' option is not supported by the programmatic API.")
+        if not definition.has_option(name):
+            raise OptionError(f"The option '--{name}' does not exist.")
+        option = definition.option(name)
+        if option.is_list() and not isinstance(value, (list, tuple)):
+            value = [value]
+        if option.is_list():
+            value = [str(item) for item in value]
+        elif not option.is_flag() and value is not None:
+            value = str(value)
+        command_input.set_option(name, value)
+    return command_input
+
+
+def _config(io: IO) -> Callable[..., Any]:
+    # as poetry's Command.option, which the builder is given by the cli
+    def option(name: str, default: Any = None) -> Any:
+        try:
+            return io.input.option(name)
+        except CleoValueError:
+            return default
+
+    return option
+
+
+def _result(builder: AwsBuilder, lambda_names: List[str], started: float) -> BuildResult:
+    durations: Dict[str, float] = {}
+    for event in builder.timings.events:
+        if event.function is not None and event.stage == "build lambda":
+            durations[event.function] = durations.get(event.function, 0.0) + event.wall
+    result = BuildResult(
+        build_dir=builder.sam_build_location,
+        template=builder.sam_build_location / "template.yaml",
+        duration=time.perf_counter() - started,
+    )
+    for name in lambda_names:
+        build_dir = builder.sam_build_location / name
+        result.functions[name] = FunctionResult(
+            name=name,
+            # the functions that were not reached once the build was aborted
+            status=builder.statuses.get(name, CANCELLED),
+            build_dir=build_dir,
+            size=tree_size(build_dir) if build_dir.is_dir() else 0,
+            duration=durations.get(name, 0.0),
+            error=builder.errors.get(name),
+        )
+    return result
+
+
+def build(
+    project: Union[Poetry, Path, str],
+    template: Union[Path, str] = SAM_TEMPLATE_TXT,
+    options: Optional[Mapping[str, Any]] = None,
+    output: Optional[Output] = None,
+    export_cache: Optional[ExportCache] = None,
+    timing_hooks: Optional[List[TimingHook]] = None,
+) -> BuildResult:
+    """
+    Build `template`, relative to the project root, as `poetry sam` does with `options`,
+    which are its long option names. `project` is a Poetry instance or the dir of one.
+
+    The progress is written to `output`, discarded by default. Passing the same Poetry
+    instance and `export_cache` to the builds of several templates of a project exports
+    its poetry.lock once.
+
+    Raises a BuildError subclass instead of exiting, with the result of the functions
+    attached as `result`.
+    """
+    started = time.perf_counter()
+    poetry = project if isinstance(project, Poetry) else Factory().create_poetry(Path(project))
+    output = output or NullOutput()
+    io = IO(_input({**(options or {}), "sam-template": str(template)}), output, output)
+    builder = AwsBuilder(
+        _config(io), poetry, io, timing_hooks=timing_hooks, export_cache=export_cache, raise_errors=True
+    )
+    sam = None
+    try:
+        sam = builder.load_sam()
+        builder.build_standard(sam)
+    except BuildError as error:
+        error.result = _result(builder, [aws_lambda.name for aws_lambda in sam.lambdas] if sam else [], started)
+        raise
+    return _result(builder, [aws_lambda.name for aws_lambda in sam.lambdas], started)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import stat
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SAM_ARTIFACTS_DIR_NAME = ".aws-sam/artifacts"
+ARTIFACTS_MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# earliest time a zip entry can hold
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+FILE_MODE = 0o644
+EXECUTABLE_MODE = 0o755
+COMPRESS_LEVEL = 9
+# resource type: property holding its local code dir
+CODE_PROPERTIES = {
+    "AWS::Serverless::Function": "CodeUri",
+    "AWS::Serverless::LayerVersion": "ContentUri",
+}
+
+
+@dataclass
+class Artifact:
+    zip: str
+    source: str
+    sha256: str
+    size: int
+    tree: str
+
+
+def _is_timestamp_pyc(path: Path) -> bool:
+    """
+    Whether a .pyc file embeds the mtime of its source, which changes with every build.
+    Hash based pycs (PEP 552) are kept.
+    """
+    with path.open("rb") as pyc:
+        header = pyc.read(8)
+    return len(header) < 8 or not int.from_bytes(header[4:8], "little") & 0b1
+
+
+def zip_entries(source: Path) -> List[Path]:
+    """
+    The files of `source` to zip, in a stable order.
+    """
+    entries = []
+    for root, dirs, files in os.walk(source, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            path = Path(root) / name
+            if name.endswith(".pyc") and _is_timestamp_pyc(path):
+                continue
+            entries.append(path)
+    return entries
+
+
+def _mode(path: Path) -> int:
+    return EXECUTABLE_MODE if path.stat().st_mode & stat.S_IXUSR else FILE_MODE
+
+
+def tree_hash(source: Path) -> str:
+    """
+    Sha256 over the path, mode and content of the files zipped from `source`.
+    """
+    digest = hashlib.sha256()
+    for path in zip_entries(source):
+        digest.update(f"{path.relative_to(source).as_posix()}\0{_mode(path):o}\0".encode("utf-8"))
+        digest.update(path.read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def deterministic_zip(source: Path, archive: Path) -> str:
+    """
+    Zip `source` so that the same files give the same bytes: sorted entries,
+    fixed timestamps and permissions. Returns the sha256 of the zip.
+    """
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    partial = archive.with_name(f"{archive.name}.partial")
+    with zipfile.ZipFile(partial, "w") as zip_file:
+        for path in zip_entries(source):
+            info = zipfile.ZipInfo(path.relative_to(source).as_posix(), date_time=ZIP_DATE_TIME)
+            info.create_system = 3
+            info.external_attr = (stat.S_IFREG | _mode(path)) << 16
+            zip_file.writestr(info, path.read_bytes(), compress_type=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL)
+    partial.replace(archive)
+    return hashlib.sha256(archive.read_bytes()).hexdigest()
+
+
+@dataclass
+class ArtifactManifest:
+    path: Path
+    artifacts: Dict[str, Artifact]
+
+    @classmethod
+    def load(cls, path: Path) -> "ArtifactManifest":
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls(path=path, artifacts={})
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path=path, artifacts={})
+        return cls(
+            path=path,
+            artifacts={name: Artifact(**artifact) for name, artifact in data.get("artifacts", {}).items()},
+        )
+
+    def save(self) -> None:
+        data = {
+            "version": MANIFEST_VERSION,
+            "artifacts": {name: asdict(artifact) for name, artifact in sorted(self.artifacts.items())},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+def _code_sources(template: Dict, build_dir: Path, artifacts_dir: Path, previous: ArtifactManifest) -> Dict[str, Path]:
+    """
+    The local code dir of each function and layer of a built template. Resources
+    already pointing at their zip take their code dir from the previous manifest.
+    """
+    sources = {}
+    for name, resource in template.get("Resources", {}).items():
+        code_property = CODE_PROPERTIES.get(resource.get("Type"))
+        if code_property is None:
+            continue
+        uri = (resource.get("Properties") or {}).get(code_property)
+        if not isinstance(uri, str) or uri.startswith("s3://"):
+            continue
+        path = (build_dir / uri).resolve()
+        if path.is_dir():
+            sources[name] = path
+        elif path == (artifacts_dir / f"{name}.zip").resolve() and name in previous.artifacts:
+            sources[name] = (build_dir / previous.artifacts[name].source).resolve()
+    return sources
+
+
+def code_sources(template: Dict, build_dir: Path, artifacts_dir: Path) -> Dict[str, Path]:
+    """
+    The local code dir of each function and layer of a built template, also once it points at the zips.
+    """
+    return _code_sources(
+        template, build_dir, artifacts_dir, ArtifactManifest.load(artifacts_dir / ARTIFACTS_MANIFEST_FILE_NAME)
+    )
+
+
+def package_artifacts(
+    template: Dict, build_dir: Path, artifacts_dir: Path, jobs: int = 1
+) -> Dict[str, Optional[Artifact]]:
+    """
+    Zip the code dir of each function and layer of the built template into `artifacts_dir`,
+    in parallel, and point their CodeUri/ContentUri at the zips. A zip is only rewritten when
+    the files of its code dir changed.
+
+    Returns the artifact of each resource, None for the ones reused unchanged.
+    """
+    manifest = ArtifactManifest.load(artifacts_dir / ARTIFACTS_MANIFEST_FILE_NAME)
+    sources = _code_sources(template, build_dir, artifacts_dir, manifest)
+
+    def package(name: str) -> Optional[Artifact]:
+        source = sources[name]
+        archive = artifacts_dir / f"{name}.zip"
+        tree = tree_hash(source)
+        previous = manifest.artifacts.get(name)
+        if previous is not None and previous.tree == tree and archive.exists():
+            return None
+        sha256 = deterministic_zip(source, archive)
+        return Artifact(
+            zip=archive.name,
+            source=os.path.relpath(source, build_dir),
+            sha256=sha256,
+            size=archive.stat().st_size,
+            tree=tree,
+        )
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = dict(zip(sources, executor.map(package, sources)))
+
+    resources = template.get("Resources", {})
+    for name, artifact in results.items():
+        if artifact is not None:
+            manifest.artifacts[name] = artifact
+        code_property = CODE_PROPERTIES[resources[name]["Type"]]
+        resources[name]["Properties"][code_property] = os.path.relpath(artifacts_dir / f"{name}.zip", build_dir)
+    manifest.artifacts = {name: artifact for name, artifact in manifest.artifacts.items() if name in sources}
+    manifest.save()
+    for stale in artifacts_dir.glob("*.zip"):
+        if stale.stem not in sources:
+            stale.unlink()
+    return results
@@ -1,65 +1,124 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from os import sep
 from pathlib import Path
-from subprocess import run
+from subprocess import CompletedProcess, Popen
 from typing import Dict, List, Optional
 
-import yaml
 from cleo.io.io import IO
 from poetry.console.application import Application
 from poetry.poetry import Poetry
 
+from poetry_aws_sam.process import OutputHandler, run_process
+from poetry_aws_sam.template import IntrinsicResolver, read_template
+
+# files of a function's own Poetry project at its CodeUri
+POETRY_PROJECT_FILES = ("pyproject.toml", "poetry.lock")
+
 
 def find_root_dir(poetry: Poetry) -> Path:
     return poetry.pyproject.path.parent
 
 
+def find_project_dir(code_dir: Path) -> Optional[Path]:
+    """
+    The dir of the locked Poetry project at a function's CodeUri, None when it has none.
+    """
+    if all((code_dir / name).is_file() for name in POETRY_PROJECT_FILES):
+        return code_dir
+    return None
+
+
 @dataclass
 class AwsLambda:
     name: str
     path: Path
+    handler: str = ""
+    code_uri: str = "."
+    runtime: str = ""
+    architectures: List[str] = field(default_factory=lambda: ["x86_64"])
+    metadata: Dict = field(default_factory=dict)
+    # dir of the function's own Poetry project, None when it uses the root project
+    project_dir: Optional[Path] = None
 
 
 class Sam:
-    def __init__(self, sam_exec: str, template: Path):
+    def __init__(self, sam_exec: str, template: Path, parameter_overrides: Optional[Dict[str, str]] = None):
         self.exec = sam_exec
         self.template_path = template
+        self.parameter_overrides = parameter_overrides or {}
+        self._process: Optional[Popen] = None
+        # where the output of 'sam build' is streamed and logged
+        self.output: Optional[OutputHandler] = None
+        self.log_file: Optional[Path] = None
         self.template = self._parse_sam_template()
+        self.resolver = IntrinsicResolver(self.template, self.parameter_overrides)
         self.lambdas = self._get_aws_lambdas()
 
     def _get_aws_lambdas(self) -> List[AwsLambda]:
         resources = self.template["Resources"]
         lambdas = {
-            resource: {
-                **self.template.get("Globals", {}).get("Function", {}),
-                **resources[resource]["Properties"],
-            }
+            resource: self.resolver.resolve(
+                {
+                    **self.template.get("Globals", {}).get("Function", {}),
+                    **resources[resource]["Properties"],
+                }
+            )
             for resource, param in resources.items()
             if param["Type"] == "AWS::Serverless::Function"
         }
-        return [
+        aws_lambdas = [
             AwsLambda(
                 name=resource,
                 path=Path(param["Handler"].replace(".", sep)).parent.parent,
+                handler=param["Handler"],
+                code_uri=param.get("CodeUri", "."),
+                runtime=param["Runtime"],
+                architectures=list(param.get("Architectures", ["x86_64"])),
+                metadata=resources[resource].get("Metadata") or {},
             )
             for resource, param in lambdas.items()
             if param.get("Runtime", "").lower().startswith("python")
         ]
+        for aws_lambda in aws_lambdas:
+            if isinstance(aws_lambda.code_uri, str):
+                aws_lambda.project_dir = find_project_dir(self.code_dir(aws_lambda))
+        return aws_lambdas
+
+    def code_dir(self, aws_lambda: AwsLambda) -> Path:
+        return self.template_path.parent / aws_lambda.code_uri
 
     def _parse_sam_template(self) -> Dict:
-        yaml.SafeLoader.add_multi_constructor("!", lambda *args: None)
-        return yaml.safe_load(self.template_path.read_text(encoding="utf-8"))
+        return read_template(self.template_path)
 
     def invoke_sam_build(self, build_dir: str, params: Optional[List[str]] = None):
         def_params = ["--template", str(self.template_path), "--build-dir", build_dir]
         if not params:
             params = []
         params.extend(def_params)
+        if self.parameter_overrides:
+            overrides = " ".join(f"{name}={value}" for name, value in self.parameter_overrides.items())
+            params.extend(["--parameter-overrides", overrides])
+
+        def started(process: Popen) -> None:
+            self._process = process
+
+        try:
+            result = run_process(
+                [self.exec, "build"] + params,
+                output=self.output,
+                log_file=self.log_file,
+                check=False,
+                on_start=started,
+            )
+        finally:
+            self._process = None
+        # the output is streamed, only its last lines are kept for the error
+        return CompletedProcess(result.args, result.returncode, stdout=None, stderr=result.output)
 
-        return run(
-            [self.exec, "build"] + params,
-            text=True,
-            encoding="utf-8",
-            capture_output=True,
-            check=False,
-        )
+    def cancel_sam_build(self) -> None:
+        """
+        Terminate the running 'sam build', if any. Safe to call from another thread.
+        """
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
@@ -1,3 +1,6 @@
+import hashlib
+import json
+import threading
 from collections import defaultdict
 from collections.abc import Iterable
 from pathlib import Path
@@ -8,8 +11,22 @@ from poetry.console.exceptions import GroupNotFound
 from poetry.core.packages.dependency_group import MAIN_GROUP
 from poetry_plugin_export.exporter import Exporter
 
+from poetry_aws_sam.lockfile import UnsupportedLock, fast_export
+
 FORMAT_REQUIREMENTS_TXT = "requirements.txt"
 
+# options of SamCommand that change the content of the exported requirements
+EXPORT_OPTIONS = [
+    "with",
+    "without",
+    "only",
+    "extras",
+    "all-extras",
+    "without-hashes",
+    "without-urls",
+    "with-credentials",
+]
+
 
 class ExportLock:
     """
@@ -51,6 +68,32 @@ class ExportLock:
 
         self._io.write_error_line(styled, verbosity)
 
+    def lock_hash(self) -> str:
+        """
+        Sha256 of the poetry.lock content, empty string when the project is not locked.
+        """
+        lock_file = Path(self.poetry.locker.lock)
+        if not lock_file.exists():
+            return ""
+        return hashlib.sha256(lock_file.read_bytes()).hexdigest()
+
+    def options_hash(self) -> str:
+        """
+        Sha256 of the options that change the content of the export.
+        """
+        options = {}
+        for name in EXPORT_OPTIONS:
+            value = self.config(name) if self._io.input.has_option(name) else None
+            options[name] = sorted(value) if isinstance(value, list) else value
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def cache_key(self) -> str:
+        """
+        Key identifying an export: the poetry.lock content plus the export options.
+        """
+        payload = json.dumps({"lock": self.lock_hash(), "options": self.options_hash()}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
     @property
     def activated_groups(self) -> set[str]:
         groups = {}
@@ -90,7 +133,29 @@ class ExportLock:
     def default_groups(self) -> set[str]:
         return {MAIN_GROUP}
 
+    def fast_export(self, requirements_file: Path) -> bool:
+        """
+        Write the requirements without the Exporter when the lock and options allow it.
+
+        Returns False when the Exporter has to be used.
+        """
+        if self.config("exporter"):
+            return False
+        extras = self.poetry.package.extras.keys() if self.config("all-extras") else self.config("extras")
+        try:
+            content = fast_export(
+                self.poetry, self.activated_groups, extras or [], with_hashes=not self.config("without-hashes")
+            )
+        except UnsupportedLock as reason:
+            self.line_error(f"Exporting poetry.lock with the Exporter: {reason}", verbosity=Verbosity.VERBOSE)
+            return False
+        requirements_file.write_text(content, encoding="utf-8")
+        return True
+
     def handle(self, requirements_file: Path) -> int:
+        if self.fast_export(requirements_file):
+            return 0
+
         fmt = FORMAT_REQUIREMENTS_TXT
 
         if not Exporter.is_format_supported(fmt):
@@ -145,3 +210,44 @@ class ExportLock:
         exporter.export(fmt, Path.cwd(), str(requirements_file))
 
         return 0
+
+
+class ExportCache:
+    """
+    Memoizes the requirements exported from poetry.lock so that the
+    Exporter runs once per lock and `poetry sam` run instead of once per function.
+    """
+
+    def __init__(self):
+        self._exports: dict[str, str] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._exports)
+
+    def clear(self) -> None:
+        self._exports.clear()
+
+    def export(self, export_lock: ExportLock, requirements_file: Path) -> bool:
+        """
+        Write the requirements file for the export options of `export_lock`.
+
+        Returns True when a cached export was reused.
+        """
+        key = export_lock.cache_key()
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # held for the whole export so that parallel builds wait for the first
+        # export of the same lock instead of running the Exporter themselves,
+        # while the locks of other projects are exported in parallel
+        with lock:
+            cached = self._exports.get(key)
+            if cached is not None:
+                requirements_file.write_text(cached, encoding="utf-8")
+                return True
+
+            result = export_lock.handle(requirements_file)
+            if result == 0 and requirements_file.exists():
+                self._exports[key] = requirements_file.read_text(encoding="utf-8")
+            return False
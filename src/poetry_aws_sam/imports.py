@@ -0,0 +1,186 @@
+import ast
+import shutil
+from dataclasses import dataclass, field
+from importlib.metadata import Distribution
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from packaging.utils import NormalizedName, canonicalize_name
+
+
+@dataclass
+class InstalledDistribution:
+    name: NormalizedName
+    dist_info: Path
+    top_level: Set[str] = field(default_factory=set)
+    files: List[Path] = field(default_factory=list)
+
+
+def handler_module(handler: str) -> str:
+    """
+    Module of a lambda handler: 'app.handler.handler' -> 'app.handler'.
+    """
+    return handler.rsplit(".", 1)[0]
+
+
+def _module_files(root: Path, module: str) -> List[Path]:
+    """
+    The local files imported by `import module`: the __init__.py of each
+    package on the way and the module itself.
+    """
+    parts = module.split(".")
+    files = []
+    for index in range(1, len(parts) + 1):
+        path = root.joinpath(*parts[:index])
+        if (path / "__init__.py").exists():
+            files.append(path / "__init__.py")
+        elif index == len(parts) and path.with_suffix(".py").exists():
+            files.append(path.with_suffix(".py"))
+    return files
+
+
+def _imported_modules(tree: ast.AST, package: str) -> Iterable[str]:
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package.split(".") if package else []
+                base = base[: len(base) - node.level + 1] if node.level > 1 else base
+                module = ".".join(base + ([node.module] if node.module else []))
+            else:
+                module = node.module or ""
+            if not module:
+                continue
+            yield module
+            for alias in node.names:
+                yield f"{module}.{alias.name}"
+
+
+def find_imports(root: Path, module: str, ignore: Set[str]) -> Set[str]:
+    """
+    Top-level names imported by `module` and the local modules it imports, in turn.
+
+    Names in `ignore` (the installed distributions) are never read as local code.
+    """
+    external: Set[str] = set()
+    queue = [module]
+    seen_modules: Set[str] = set()
+    seen_files: Set[Path] = set()
+    while queue:
+        current = queue.pop()
+        if current in seen_modules:
+            continue
+        seen_modules.add(current)
+        top_level = current.split(".")[0]
+        if top_level in ignore:
+            external.add(top_level)
+            continue
+        files = _module_files(root, current)
+        if not files:
+            external.add(top_level)
+            continue
+        for file_path in files:
+            if file_path in seen_files:
+                continue
+            seen_files.add(file_path)
+            relative = file_path.relative_to(root).with_suffix("")
+            package = ".".join(relative.parts[:-1])
+            try:
+                tree = ast.parse(file_path.read_bytes(), filename=str(file_path))
+            except SyntaxError:
+                continue
+            queue.extend(_imported_modules(tree, package))
+    return external
+
+
+def _top_level_names(distribution: Distribution) -> Set[str]:
+    top_level = distribution.read_text("top_level.txt")
+    if top_level:
+        return {name.strip() for name in top_level.splitlines() if name.strip()}
+    names = set()
+    for file in distribution.files or []:
+        first = file.parts[0]
+        if first.endswith((".dist-info", ".data")) or first in {"..", "__pycache__", "bin"}:
+            continue
+        names.add(first.split(".")[0])
+    return names
+
+
+def installed_distributions(target: Path) -> Dict[NormalizedName, InstalledDistribution]:
+    distributions = {}
+    for dist_info in target.glob("*.dist-info"):
+        distribution = Distribution.at(dist_info)
+        name = distribution.metadata["Name"]
+        if not name:
+            continue
+        distributions[canonicalize_name(name)] = InstalledDistribution(
+            name=canonicalize_name(name),
+            dist_info=dist_info,
+            top_level=_top_level_names(distribution),
+            files=[target / file for file in distribution.files or []],
+        )
+    return distributions
+
+
+def dependency_closure(lock_data: Dict, roots: Iterable[str]) -> Set[NormalizedName]:
+    """
+    The names in `roots` and all their dependencies according to poetry.lock.
+    """
+    dependencies = {
+        canonicalize_name(package["name"]): {canonicalize_name(name) for name in package.get("dependencies", {})}
+        for package in lock_data.get("package", [])
+    }
+    closure: Set[NormalizedName] = set()
+    queue = [canonicalize_name(root) for root in roots]
+    while queue:
+        name = queue.pop()
+        if name in closure:
+            continue
+        closure.add(name)
+        queue.extend(dependencies.get(name, ()))
+    return closure
+
+
+def remove_distribution(target: Path, distribution: InstalledDistribution) -> None:
+    for file_path in distribution.files:
+        try:
+            resolved = file_path.resolve()
+            resolved.relative_to(target.resolve())
+        except (OSError, ValueError):
+            continue
+        if resolved.is_file() or resolved.is_symlink():
+            resolved.unlink()
+    shutil.rmtree(distribution.dist_info, ignore_errors=True)
+    for name in distribution.top_level:
+        package_dir = target / name
+        if package_dir.is_dir() and not any(path.is_file() for path in package_dir.rglob("*")):
+            shutil.rmtree(package_dir, ignore_errors=True)
+
+
+def prune_unused(target: Path, handler: str, lock_data: Dict, keep: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Remove the distributions installed in `target` that the handler does not import,
+    directly or through the dependencies of the distributions it imports.
+
+    Returns the names of the distributions removed.
+    """
+    distributions = installed_distributions(target)
+    # a namespace package (google, azure, zope) is the top level of several distributions
+    owners: Dict[str, Set[NormalizedName]] = {}
+    for name, distribution in distributions.items():
+        for module in distribution.top_level:
+            owners.setdefault(module, set()).add(name)
+    imports = find_imports(target, handler_module(handler), ignore=set(owners))
+    roots = {name for module in imports for name in owners.get(module, ())}
+    roots.update(canonicalize_name(name) for name in keep or [])
+    closure = dependency_closure(lock_data, roots)
+
+    removed = []
+    for name in sorted(distributions):
+        if name in closure:
+            continue
+        remove_distribution(target, distributions[name])
+        removed.append(name)
+    return removed
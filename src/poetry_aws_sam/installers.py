@@ -0,0 +1,292 @@
+import abc
+import compileall
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import zipfile
+from pathlib import Path, PurePosixPath
+from shlex import quote
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import InvalidWheelFilename, NormalizedName, canonicalize_name, parse_wheel_filename
+from packaging.version import InvalidVersion, Version
+
+from poetry_aws_sam.platforms import ARCHITECTURE_MACHINES, HOST_PYTHON_VERSION, InstallTarget, target_environment
+from poetry_aws_sam.wheelhouse import requirement_lines
+
+PIP = "pip"
+UV = "uv"
+UNPACK = "unpack"
+INSTALLERS = [PIP, UV, UNPACK]
+DEFAULT_INSTALLER = PIP
+# written into the dist-info of the unpacked wheels, as pip writes "pip"
+INSTALLER_NAME = "poetry-aws-sam"
+
+# runs a subprocess, raising ProcessError when it fails
+Runner = Callable[[List[str]], None]
+
+
+class InstallerError(Exception):
+    pass
+
+
+class Installer(abc.ABC):
+    """
+    Installs exported requirements into a target dir, from the index or only from the
+    wheels of `find_links` when it is set. `stage` names its timings stage.
+    """
+
+    name = ""
+    stage = ""
+    subprocess = True
+
+    @abc.abstractmethod
+    def install(
+        self, requirements_file: Path, target: Path, install: InstallTarget, find_links: Optional[Path] = None
+    ) -> None:
+        pass
+
+
+class PipInstaller(Installer):
+    name = PIP
+    stage = "pip install"
+
+    def __init__(self, run: Runner):
+        self.run = run
+
+    def args(
+        self, requirements_file: Path, target: Path, install: InstallTarget, find_links: Optional[Path] = None
+    ) -> List[str]:
+        return [
+            sys.executable,
+            "-m",
+            "pip",
+            "install",
+            *install.pip_args(),
+            "--only-binary",
+            ":all:",
+            "--upgrade",
+            "--disable-pip-version-check",
+            "--no-python-version-warning",
+            "-r",
+            quote(str(requirements_file)),
+            "-t",
+            quote(str(target)),
+        ] + (["--no-index", "--find-links", str(find_links)] if find_links is not None else [])
+
+    def install(
+        self, requirements_file: Path, target: Path, install: InstallTarget, find_links: Optional[Path] = None
+    ) -> None:
+        self.run(self.args(requirements_file, target, install, find_links))
+
+
+class UvInstaller(Installer):
+    """
+    `uv pip install`, which resolves and installs the pinned requirements faster than pip.
+    """
+
+    name = UV
+    stage = "uv install"
+
+    def __init__(self, run: Runner, executable: str):
+        self.run = run
+        self.executable = executable
+
+    @staticmethod
+    def python_platform(install: InstallTarget) -> str:
+        # uv names the platforms machine first: x86_64-manylinux2014, aarch64-manylinux_2_28
+        machine = ARCHITECTURE_MACHINES[install.architecture]
+        return f"{machine}-{install.platforms[-1][: -len(machine) - 1]}"
+
+    def args(
+        self, requirements_file: Path, target: Path, install: InstallTarget, find_links: Optional[Path] = None
+    ) -> List[str]:
+        return [
+            self.executable,
+            "pip",
+            "install",
+            "--python",
+            sys.executable,
+            "--python-platform",
+            self.python_platform(install),
+            "--python-version",
+            f"{install.python_version[0]}.{install.python_version[1:]}",
+            "--only-binary",
+            ":all:",
+            # the installed files are slimmed and stripped in place, they must not be links into uv's cache
+            "--link-mode",
+            "copy",
+            "--compile-bytecode",
+            "--target",
+            str(target),
+            "-r",
+            str(requirements_file),
+        ] + (["--no-index", "--find-links", str(find_links)] if find_links is not None else [])
+
+    def install(
+        self, requirements_file: Path, target: Path, install: InstallTarget, find_links: Optional[Path] = None
+    ) -> None:
+        self.run(self.args(requirements_file, target, install, find_links))
+
+
+def _installed_path(name: str, wheel_data: str) -> Optional[PurePosixPath]:
+    """
+    Where a file of a wheel goes in a `pip install --target` dir, None for the
+    files pip leaves out. The scripts go to bin/ and the data files to the top.
+    """
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts or not path.parts:
+        raise InstallerError(f"Unsafe path {name} in wheel")
+    if path.parts[0] != wheel_data:
+        return path
+    if len(path.parts) < 3:
+        return None
+    scheme, rest = path.parts[1], PurePosixPath(*path.parts[2:])
+    if scheme in ("purelib", "platlib", "data"):
+        return rest
+    if scheme == "scripts":
+        return PurePosixPath("bin") / rest
+    if scheme == "headers":
+        return PurePosixPath("include") / rest
+    return None
+
+
+def _fix_shebang(content: bytes) -> bytes:
+    # as pip does for the `#!python` scripts of a wheel
+    if content.startswith(b"#!python"):
+        return b"#!" + os.fsencode(sys.executable) + content[len(b"#!python") :]
+    return content
+
+
+class UnpackInstaller(Installer):
+    """
+    Installs already downloaded wheels by extracting them into the target, without
+    a resolver or a subprocess. Every requirement has to be pinned, with a wheel for
+    the lambda's platform in `find_links`, or point at a local wheel. The console
+    scripts of the entry points are not generated.
+    """
+
+    name = UNPACK
+    stage = "unpack"
+    subprocess = False
+
+    def wheels(self, requirements_text: str, install: InstallTarget, find_links: Path) -> List[Tuple[Path, List[str]]]:
+        """
+        The wheel of each requirement of the lambda, with its allowed hashes.
+        """
+        environment = target_environment(install)
+        priorities = {tag: priority for priority, tag in enumerate(install.tags())}
+        available: Dict[Tuple[NormalizedName, Version], List[Tuple[int, Path]]] = {}
+        for wheel in find_links.glob("*.whl"):
+            try:
+                name, version, _, tags = parse_wheel_filename(wheel.name)
+            except (InvalidWheelFilename, InvalidVersion):
+                continue
+            priority = min((priorities[tag] for tag in tags if tag in priorities), default=None)
+            if priority is not None:
+                available.setdefault((name, version), []).append((priority, wheel))
+
+        wheels = []
+        for line in requirement_lines(requirements_text):
+            if line.startswith("--"):
+                # index options, the wheels are already downloaded
+                continue
+            requirement_part, *hash_parts = line.split(" --hash=")
+            try:
+                requirement = Requirement(requirement_part)
+            except InvalidRequirement:
+                raise InstallerError(f"Unsupported requirement for the unpack installer: {line}")
+            if requirement.marker is not None and not requirement.marker.evaluate(environment):
+                continue
+            hashes = [part.strip() for part in hash_parts]
+            if requirement.url:
+                parsed = urlsplit(requirement.url)
+                path = Path(unquote(parsed.path))
+                if parsed.scheme != "file" or path.suffix != ".whl":
+                    raise InstallerError(f"{requirement.name} is not a pinned wheel: {requirement.url}")
+                wheels.append((path, hashes))
+                continue
+            specifiers = list(requirement.specifier)
+            if len(specifiers) != 1 or specifiers[0].operator != "==":
+                raise InstallerError(f"{requirement.name} is not pinned: {requirement_part}")
+            key = (canonicalize_name(requirement.name), Version(specifiers[0].version))
+            candidates = sorted(available.get(key, []))
+            if not candidates:
+                raise InstallerError(
+                    f"No wheel of {requirement.name}=={specifiers[0].version} for {install.key} in {find_links}"
+                )
+            wheels.append((candidates[0][1], hashes))
+        return wheels
+
+    def install(
+        self, requirements_file: Path, target: Path, install: InstallTarget, find_links: Optional[Path] = None
+    ) -> None:
+        if find_links is None:
+            raise InstallerError("The unpack installer only installs from the wheelhouse")
+        wheels = self.wheels(requirements_file.read_text(encoding="utf-8"), install, find_links)
+        target.mkdir(parents=True, exist_ok=True)
+        installed = []
+        for wheel, hashes in wheels:
+            if hashes:
+                digest = f"sha256:{hashlib.sha256(wheel.read_bytes()).hexdigest()}"
+                if digest not in hashes:
+                    raise InstallerError(f"The hash of {wheel.name} does not match the requirements")
+            installed.extend(self.unpack(wheel, target))
+        if install.python_version == HOST_PYTHON_VERSION:
+            # pip compiles the installed modules with the python running it
+            for path in installed:
+                if path.suffix == ".py":
+                    compileall.compile_file(str(path), quiet=2)
+
+    def unpack(self, wheel: Path, target: Path) -> List[Path]:
+        """
+        Extract a wheel into `target` as `pip install --target` lays it out.
+
+        Returns the files written.
+        """
+        with zipfile.ZipFile(wheel) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+            # the dirs of the wheel are named after the name and version of its file
+            prefixes = {info.filename.split("/", 1)[0] for info in infos if "/" in info.filename}
+            dist_info = next((prefix for prefix in prefixes if prefix.endswith(".dist-info")), None)
+            if dist_info is None:
+                raise InstallerError(f"{wheel.name} has no .dist-info dir")
+            wheel_data = f"{dist_info[: -len('.dist-info')]}.data"
+            written = []
+            for info in infos:
+                relative = _installed_path(info.filename, wheel_data)
+                if relative is None:
+                    continue
+                path = target.joinpath(*relative.parts)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                content = archive.read(info)
+                if relative.parts[0] == "bin" and info.filename.startswith(f"{wheel_data}/scripts/"):
+                    content = _fix_shebang(content)
+                if path.is_symlink() or path.is_file():
+                    # replaced, as with pip's --upgrade, without writing through a link
+                    path.unlink()
+                path.write_bytes(content)
+                mode = info.external_attr >> 16
+                if mode and stat.S_ISREG(mode) and mode & 0o111:
+                    path.chmod(path.stat().st_mode | 0o111)
+                written.append(path)
+            (target / dist_info / "INSTALLER").write_text(f"{INSTALLER_NAME}\n", encoding="utf-8")
+        return written
+
+
+def create_installer(name: str, run: Runner) -> Installer:
+    """
+    The installer `name`. `uv` falls back to pip when it is not on PATH.
+    """
+    if name == PIP:
+        return PipInstaller(run)
+    if name == UV:
+        executable = shutil.which(UV)
+        return UvInstaller(run, executable) if executable else PipInstaller(run)
+    if name == UNPACK:
+        return UnpackInstaller()
+    raise InstallerError(f"Unknown installer '{name}'. Available: {', '.join(INSTALLERS)}")
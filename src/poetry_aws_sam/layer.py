@@ -0,0 +1,62 @@
+import re
+from pathlib import Path
+from typing import Dict, List
+
+from poetry_aws_sam.aws import AwsLambda
+from poetry_aws_sam.platforms import InstallTarget
+
+LAYER_RESOURCE_NAME = "PoetrySamDependenciesLayer"
+SAM_LAYERS_DIR_NAME = ".aws-sam/layers"
+# lambda adds the `python` dir of a layer to sys.path
+LAYER_PYTHON_DIR_NAME = "python"
+
+
+def _pascal_case(text: str) -> str:
+    return "".join(part.capitalize() for part in re.split(r"[^0-9A-Za-z]+", text) if part)
+
+
+def layer_resource_name(install: InstallTarget, project: str = "") -> str:
+    return f"{LAYER_RESOURCE_NAME}{_pascal_case(project)}{_pascal_case(install.architecture)}Py{install.python_version}"
+
+
+def dependency_layers(template: Dict, name: str) -> List[str]:
+    """
+    The dependencies layers that `attach_layer` referenced from the function `name` of a built template.
+    """
+    resources = template.get("Resources", {})
+    properties = resources.get(name, {}).get("Properties") or {}
+    return [
+        layer["Ref"]
+        for layer in properties.get("Layers", [])
+        if isinstance(layer, dict)
+        and str(layer.get("Ref", "")).startswith(LAYER_RESOURCE_NAME)
+        and resources.get(layer["Ref"], {}).get("Type") == "AWS::Serverless::LayerVersion"
+    ]
+
+
+def attach_layer(
+    template: Dict, aws_lambdas: List[AwsLambda], install: InstallTarget, content_uri: Path, project: str = ""
+) -> Dict:
+    """
+    Add the dependencies layer of an install target to a built template
+    and reference it from the python lambdas of that target.
+
+    `project` is the relative dir of the functions' own Poetry project, empty for the root project.
+    """
+    resources = template.setdefault("Resources", {})
+    resource_name = layer_resource_name(install, project)
+    runtimes = sorted({aws_lambda.runtime for aws_lambda in aws_lambdas if aws_lambda.runtime})
+    resources[resource_name] = {
+        "Type": "AWS::Serverless::LayerVersion",
+        "Properties": {
+            "Description": f"Third party packages from {project + '/' if project else ''}poetry.lock",
+            "ContentUri": content_uri.as_posix(),
+            "CompatibleArchitectures": [install.architecture],
+            "CompatibleRuntimes": runtimes,
+        },
+    }
+    for aws_lambda in aws_lambdas:
+        properties = resources[aws_lambda.name].setdefault("Properties", {})
+        layers = [layer for layer in properties.get("Layers", []) if layer != {"Ref": resource_name}]
+        properties["Layers"] = layers + [{"Ref": resource_name}]
+    return template
@@ -0,0 +1,77 @@
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+
+# ioctl request number of FICLONE (linux/fs.h), used for copy-on-write clones
+FICLONE = 0x40049409
+
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+COPY = "copy"
+
+
+def _reflink(source: Path, target: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    with open(source, "rb") as source_file, open(target, "wb") as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            failed = True
+        else:
+            failed = False
+    if failed:
+        target.unlink()
+    return not failed
+
+
+def clone_file(source: Path, target: Path) -> str:
+    """
+    Place `source` at `target` with the cheapest method the filesystem supports:
+    a reflink, then a hard link, then a plain copy.
+
+    Returns the method used.
+    """
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    if _reflink(source, target):
+        shutil.copystat(source, target)
+        return REFLINK
+    try:
+        os.link(source, target)
+        return HARDLINK
+    except OSError:
+        shutil.copy2(source, target)
+        return COPY
+
+
+def link_tree(source: Path, target: Path) -> Counter:
+    """
+    Mirror the tree at `source` into `target`, replacing files that already exist.
+
+    Returns how many files were placed with each method.
+    """
+    methods: Counter = Counter()
+    for root, dirs, files in os.walk(source):
+        relative = Path(root).relative_to(source)
+        (target / relative).mkdir(parents=True, exist_ok=True)
+        for name in dirs:
+            if (Path(root) / name).is_symlink():
+                link = target / relative / name
+                if not link.exists():
+                    link.symlink_to(os.readlink(Path(root) / name))
+        for name in files:
+            source_file = Path(root) / name
+            target_file = target / relative / name
+            if source_file.is_symlink():
+                if target_file.exists() or target_file.is_symlink():
+                    target_file.unlink()
+                target_file.symlink_to(os.readlink(source_file))
+                methods[COPY] += 1
+                continue
+            methods[clone_file(source_file, target_file)] += 1
+    return methods
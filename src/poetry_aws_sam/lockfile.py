@@ -0,0 +1,223 @@
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from packaging.utils import NormalizedName, canonicalize_name
+from poetry.core.factory import Factory
+from poetry.core.packages.dependency import Dependency
+from poetry.core.packages.package import Package
+from poetry.core.version.requirements import InvalidRequirement
+from poetry_plugin_export.exporter import Exporter
+from poetry_plugin_export.walker import get_python_version_region_markers
+
+try:
+    import tomllib
+except ImportError:  # python 3.10
+    import tomli as tomllib
+
+SUPPORTED_LOCK_VERSION = "2."
+
+
+class UnsupportedLock(Exception):
+    """
+    The lock or the export options need the Exporter.
+    """
+
+
+class LockGraph:
+    """
+    The packages of a parsed poetry.lock, with their dependencies built on first use.
+    """
+
+    def __init__(self, lock_data: Dict, root_dir: Path):
+        metadata = lock_data.get("metadata", {})
+        self.lock_version = str(metadata.get("lock-version", ""))
+        self.content_hash = metadata.get("content-hash")
+        self.root_dir = root_dir
+        self._infos: Dict[NormalizedName, List[Dict]] = {}
+        for info in lock_data.get("package", []):
+            self._infos.setdefault(canonicalize_name(info["name"]), []).append(info)
+        self._packages: Dict[NormalizedName, Package] = {}
+        self._with_extras: Set[NormalizedName] = set()
+        self._lock = threading.Lock()
+
+    def info(self, name: NormalizedName) -> Optional[Dict]:
+        infos = self._infos.get(name)
+        if not infos:
+            return None
+        if len(infos) > 1:
+            raise UnsupportedLock(f"{name} is locked at several versions")
+        info = infos[0]
+        if info.get("source"):
+            raise UnsupportedLock(f"{name} is locked from a {info['source'].get('type', 'custom')} source")
+        if info.get("develop"):
+            raise UnsupportedLock(f"{name} is locked in develop mode")
+        return info
+
+    def package(self, name: NormalizedName, features: Iterable[str] = ()) -> Optional[Package]:
+        """
+        The locked package `name` with its dependencies, as the Locker builds it.
+        Its extras are only read when it is required with `features`.
+        """
+        with self._lock:
+            package = self._packages.get(name)
+            if package is None:
+                info = self.info(name)
+                if info is None:
+                    return None
+                package = Package(info["name"], info["version"])
+                package.optional = info.get("optional", False)
+                package.python_versions = info["python-versions"]
+                package.files = info.get("files", [])
+                for dependency_name, constraint in info.get("dependencies", {}).items():
+                    for item in constraint if isinstance(constraint, list) else [constraint]:
+                        package.add_dependency(Factory.create_dependency(dependency_name, item, root_dir=self.root_dir))
+                self._packages[name] = package
+            if not features:
+                return package
+            if name not in self._with_extras:
+                try:
+                    package.extras = {
+                        canonicalize_name(extra): [Dependency.create_from_pep_508(dependency) for dependency in deps]
+                        for extra, deps in self.info(name).get("extras", {}).items()
+                    }
+                except InvalidRequirement as error:
+                    raise UnsupportedLock(f"invalid extra of {name}: {error}")
+                self._with_extras.add(name)
+            return package.with_features(features)
+
+
+_graphs: Dict[Path, Tuple[Tuple[int, int], LockGraph]] = {}
+_graphs_lock = threading.Lock()
+
+
+def read_lock(path: Path) -> LockGraph:
+    """
+    Parse poetry.lock, reusing the previous parse while the file is unchanged.
+    """
+    stat = path.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _graphs_lock:
+        cached = _graphs.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    with path.open("rb") as lock_file:
+        graph = LockGraph(tomllib.load(lock_file), path.parent)
+    with _graphs_lock:
+        _graphs[path] = (key, graph)
+    return graph
+
+
+def clear_lock_cache() -> None:
+    with _graphs_lock:
+        _graphs.clear()
+
+
+def _locked(graph: LockGraph, requirement: Dependency) -> Package:
+    package = graph.package(requirement.name, requirement.extras)
+    if package is None:
+        raise UnsupportedLock(f"{requirement.name} is not in poetry.lock")
+    if not (
+        package.python_constraint.allows_all(requirement.python_constraint)
+        and requirement.constraint.allows(package.version)
+    ):
+        raise UnsupportedLock(f"the locked {package.name} {package.version} does not match {requirement}")
+    return package
+
+
+def _walk(graph: LockGraph, dependencies: List[Dependency], root_name: NormalizedName) -> Dict[Package, Dependency]:
+    """
+    The locked packages required by `dependencies` with their combined markers,
+    following poetry-plugin-export's walk_dependencies.
+    """
+    nested: Dict[Package, Dependency] = {}
+    visited = set()
+    while dependencies:
+        requirement = dependencies.pop(0)
+        if (requirement, requirement.marker) in visited or requirement.name == root_name:
+            continue
+        visited.add((requirement, requirement.marker))
+
+        package = _locked(graph, requirement)
+        constraint, marker = requirement.constraint, requirement.marker
+        requirement = package.to_dependency()
+        requirement.marker = requirement.marker.intersect(marker)
+        requirement.constraint = constraint
+
+        for require in package.requires:
+            if require.is_optional() and not any(
+                require in package.extras.get(feature, ()) for feature in package.features
+            ):
+                continue
+            base_marker = require.marker.intersect(requirement.marker).without_extras()
+            if base_marker.is_empty():
+                continue
+            candidate = graph.package(require.name)
+            candidates = [candidate] if candidate else []
+            for region_marker in get_python_version_region_markers(candidates):
+                marker = region_marker.intersect(base_marker)
+                if not marker.is_empty():
+                    require_in_region = require.clone()
+                    require_in_region.marker = marker
+                    dependencies.append(require_in_region)
+
+        if package not in nested:
+            nested[package] = requirement
+        else:
+            nested[package].marker = nested[package].marker.union(requirement.marker)
+    return nested
+
+
+def fast_export(poetry, groups: Iterable[str], extras: Iterable[str], with_hashes: bool) -> str:
+    """
+    The requirements.txt content of the locked dependencies of `groups`, as the Exporter writes it,
+    walked straight from the parsed lock instead of loading every locked package into a repository.
+
+    Raises UnsupportedLock when the Exporter is needed: extras, git/path/url or custom index
+    sources, packages locked at several versions or a lock that is not fresh.
+    """
+    if list(extras):
+        raise UnsupportedLock("extras are exported")
+    lock_path = Path(poetry.locker.lock)
+    if not lock_path.exists():
+        raise UnsupportedLock("poetry.lock does not exist")
+    graph = read_lock(lock_path)
+    if not graph.lock_version.startswith(SUPPORTED_LOCK_VERSION):
+        raise UnsupportedLock(f"lock version {graph.lock_version}")
+    if graph.content_hash is None or graph.content_hash != getattr(poetry.locker, "_content_hash", None):
+        raise UnsupportedLock("poetry.lock is not consistent with pyproject.toml")
+
+    root = poetry.package.with_dependency_groups(list(groups), only=True)
+    selected = []
+    for require in root.all_requires:
+        require = require.clone()
+        require.marker = require.marker.intersect(root.python_marker)
+        if require.source_type is not None:
+            raise UnsupportedLock(f"{require.name} is a {require.source_type} dependency")
+        locked = graph.package(require.name)
+        if locked is None or not require.constraint.allows(locked.version):
+            continue
+        if locked.optional:
+            # only exported with the extras that require it
+            continue
+        selected.append(require)
+
+    lines = set()
+    for package, dependency in _walk(graph, selected, root.name).items():
+        line = f"{package.complete_name}=={package.version}"
+        requirement = dependency.to_pep_508(with_extras=False, resolved=True)
+        if ";" in requirement:
+            markers = requirement.split(";", 1)[1].strip()
+            if markers:
+                line += f" ; {markers}"
+        if with_hashes and package.files:
+            hashes = []
+            for file in package.files:
+                algorithm, _, digest = file["hash"].rpartition(":")
+                algorithm = algorithm or "sha256"
+                if algorithm in Exporter.ALLOWED_HASH_ALGORITHMS:
+                    hashes.append(f"{algorithm}:{digest}")
+            for file_hash in sorted(hashes):
+                line += f" \\\n    --hash={file_hash}"
+        lines.add(line)
+    return "\n".join(sorted(lines)) + "\n"
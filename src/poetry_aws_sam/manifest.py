@@ -0,0 +1,95 @@
+import fnmatch
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+SAM_MANIFEST_FILE_NAME = ".aws-sam/poetry-sam-manifest.json"
+MANIFEST_VERSION = 2
+
+# directories never part of a function's source tree
+IGNORED_DIRS = {"__pycache__", ".aws-sam", ".git", ".venv", "node_modules"}
+
+
+def hash_tree(path: Path, ignored_dirs: Iterable[str] = IGNORED_DIRS) -> str:
+    """
+    Sha256 over the relative paths and contents of the files under `path`,
+    skipping the dirs matching the `ignored_dirs` patterns.
+    """
+    digest = hashlib.sha256()
+    if path.is_file():
+        digest.update(path.read_bytes())
+        return digest.hexdigest()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if not any(fnmatch.fnmatch(name, pattern) for pattern in ignored_dirs))
+        for name in sorted(files):
+            if name.endswith(".pyc"):
+                continue
+            file_path = Path(root) / name
+            digest.update(file_path.relative_to(path).as_posix().encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(file_path.read_bytes())
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class Fingerprint:
+    code: str
+    lock: str
+    options: str
+    build: str
+    properties: Dict
+
+    def changes(self, previous: Optional["Fingerprint"]) -> List[str]:
+        """
+        The reasons for rebuilding a function, empty when nothing changed.
+        """
+        if previous is None:
+            return ["not built before"]
+        reasons = []
+        if self.code != previous.code:
+            reasons.append("code changed")
+        if self.lock != previous.lock:
+            reasons.append("poetry.lock changed")
+        if self.options != previous.options:
+            reasons.append("export options changed")
+        if self.build != previous.build:
+            reasons.append("build options changed")
+        if self.properties != previous.properties:
+            reasons.append("template properties changed")
+        return reasons
+
+
+class BuildManifest:
+    """
+    Fingerprints of the functions of the last successful build,
+    stored as json in the .aws-sam dir.
+    """
+
+    def __init__(self, path: Path, fingerprints: Optional[Dict[str, Fingerprint]] = None, template: str = ""):
+        self.path = path
+        self.fingerprints = fingerprints or {}
+        self.template = template
+
+    @classmethod
+    def load(cls, path: Path) -> "BuildManifest":
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        fingerprints = {name: Fingerprint(**value) for name, value in data.get("functions", {}).items()}
+        return cls(path, fingerprints, data.get("template", ""))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "template": self.template,
+            "functions": {name: asdict(fingerprint) for name, fingerprint in sorted(self.fingerprints.items())},
+        }
+        self.path.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
@@ -0,0 +1,140 @@
+import platform
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, List
+
+from packaging.markers import default_environment
+from packaging.tags import Tag, compatible_tags, cpython_tags
+
+from poetry_aws_sam.aws import AwsLambda
+
+DEFAULT_ARCHITECTURE = "x86_64"
+HOST_PYTHON_VERSION = f"{sys.version_info.major}{sys.version_info.minor}"
+
+# lambda architecture -> machine of the manylinux platform tags
+ARCHITECTURE_MACHINES = {"x86_64": "x86_64", "arm64": "aarch64"}
+# the other names of those machines in platform.machine()
+HOST_MACHINES = {"amd64": "x86_64", "arm64": "aarch64"}
+
+# the python3.12+ runtimes run on Amazon Linux 2023 (glibc 2.34)
+# and can use manylinux_2_28 wheels besides the manylinux2014 ones
+MANYLINUX_2_28_MIN_VERSION = (3, 12)
+# glibc minor version of the manylinux platforms, and the legacy aliases of the older ones
+MANYLINUX_GLIBC_MINOR = {"manylinux2014": 17, "manylinux_2_28": 28}
+LEGACY_MANYLINUX = {17: "manylinux2014", 12: "manylinux2010", 5: "manylinux1"}
+
+RUNTIME_PATTERN = re.compile(r"^python(\d)\.(\d+)$")
+
+
+@dataclass(frozen=True)
+class InstallTarget:
+    """
+    Architecture and python version that the wheels of a lambda must match.
+    """
+
+    architecture: str = DEFAULT_ARCHITECTURE
+    python_version: str = HOST_PYTHON_VERSION
+
+    @property
+    def key(self) -> str:
+        return f"{self.architecture}-cp{self.python_version}"
+
+    @property
+    def version_tuple(self):
+        return int(self.python_version[0]), int(self.python_version[1:])
+
+    @property
+    def platforms(self) -> List[str]:
+        machine = ARCHITECTURE_MACHINES[self.architecture]
+        platforms = [f"manylinux2014_{machine}"]
+        if self.version_tuple >= MANYLINUX_2_28_MIN_VERSION:
+            platforms.append(f"manylinux_2_28_{machine}")
+        return platforms
+
+    def tags(self) -> List[Tag]:
+        """
+        The wheel tags installable on the lambda, most specific first: the cpython and
+        pure python tags of its version, with the manylinux platforms up to its glibc.
+        """
+        machine = ARCHITECTURE_MACHINES[self.architecture]
+        glibc_minor = max(MANYLINUX_GLIBC_MINOR[tag[: -len(machine) - 1]] for tag in self.platforms)
+        platforms = []
+        for minor in range(glibc_minor, 4, -1):
+            platforms.append(f"manylinux_2_{minor}_{machine}")
+            if minor in LEGACY_MANYLINUX:
+                platforms.append(f"{LEGACY_MANYLINUX[minor]}_{machine}")
+        interpreter = f"cp{self.python_version}"
+        return [
+            *cpython_tags(self.version_tuple, abis=[interpreter], platforms=platforms),
+            *compatible_tags(self.version_tuple, interpreter, platforms),
+        ]
+
+    def pip_args(self) -> List[str]:
+        args = []
+        for tag in self.platforms:
+            args.extend(["--platform", tag])
+        python_version = f"{self.python_version[0]}.{self.python_version[1:]}"
+        return args + [
+            "--python-version",
+            python_version,
+            "--implementation",
+            "cp",
+            "--abi",
+            f"cp{self.python_version}",
+        ]
+
+
+def target_environment(install: InstallTarget) -> Dict[str, str]:
+    """
+    The marker environment of a lambda, to select the requirements it installs.
+    """
+    environment = default_environment()
+    python_version = f"{install.python_version[0]}.{install.python_version[1:]}"
+    machine = ARCHITECTURE_MACHINES[install.architecture]
+    environment.update(
+        {
+            "implementation_name": "cpython",
+            "os_name": "posix",
+            "platform_machine": machine,
+            "platform_python_implementation": "CPython",
+            "platform_system": "Linux",
+            "python_version": python_version,
+            "sys_platform": "linux",
+        }
+    )
+    if python_version != environment["python_full_version"].rsplit(".", 1)[0]:
+        environment["python_full_version"] = f"{python_version}.0"
+    return environment
+
+
+def install_target(aws_lambda: AwsLambda) -> InstallTarget:
+    """
+    Install target of a lambda from its `Architectures` and `Runtime`, falling back
+    to x86_64 and the python version running poetry.
+    """
+    architecture = (aws_lambda.architectures or [DEFAULT_ARCHITECTURE])[0]
+    if architecture not in ARCHITECTURE_MACHINES:
+        raise ValueError(f"Unsupported architecture '{architecture}' for {aws_lambda.name}")
+    match = RUNTIME_PATTERN.match(aws_lambda.runtime or "")
+    python_version = f"{match.group(1)}{match.group(2)}" if match else HOST_PYTHON_VERSION
+    return InstallTarget(architecture=architecture, python_version=python_version)
+
+
+def runs_on_host(install: InstallTarget) -> bool:
+    """
+    Whether the python running poetry can import the packages installed for a lambda:
+    the same machine and python version, as native wheels are built for both.
+    """
+    machine = platform.machine().lower()
+    return (
+        HOST_MACHINES.get(machine, machine) == ARCHITECTURE_MACHINES[install.architecture]
+        and install.python_version == HOST_PYTHON_VERSION
+    )
+
+
+def group_by_target(aws_lambdas: List[AwsLambda]) -> Dict[InstallTarget, List[AwsLambda]]:
+    groups: Dict[InstallTarget, List[AwsLambda]] = {}
+    for aws_lambda in aws_lambdas:
+        groups.setdefault(install_target(aws_lambda), []).append(aws_lambda)
+    return groups
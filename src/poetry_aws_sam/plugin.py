@@ -1,9 +1,10 @@
+from pathlib import Path
+
 from cleo.helpers import option
+from poetry.console.commands.command import Command
 from poetry.console.commands.group_command import GroupCommand
 from poetry.plugins.application_plugin import ApplicationPlugin
 
-from poetry_aws_sam.sam import AwsBuilder
-
 SAM_TEMPLATE_TXT = "template.yaml"
 
 
@@ -19,6 +20,13 @@ class SamCommand(GroupCommand):
             flag=False,
             default=SAM_TEMPLATE_TXT,
         ),
+        option(
+            "parameter-overrides",
+            None,
+            "Template parameter values (Name=Value) used to resolve !Ref and !Sub, also passed to 'sam build'.",
+            flag=False,
+            multiple=True,
+        ),
         option("without-hashes", None, "Exclude hashes from the exported file."),
         option(
             "without-urls",
@@ -35,10 +43,288 @@ class SamCommand(GroupCommand):
         ),
         option("all-extras", None, "Include all sets of extra dependencies."),
         option("with-credentials", None, "Include credentials for extra indices."),
+        option(
+            "exporter",
+            None,
+            "Always export poetry.lock with poetry-plugin-export's Exporter instead of reading it directly.",
+        ),
+        option(
+            "slim",
+            None,
+            "Remove __pycache__, tests, docs, type stubs and installer metadata from the installed packages.",
+        ),
+        option(
+            "slim-rules",
+            None,
+            "Slim rules to apply instead of the --slim ones (comma separated):"
+            " pycache, tests, stubs, metadata, docs, strip, precompile.",
+            flag=False,
+            multiple=True,
+        ),
+        option(
+            "report",
+            None,
+            "Print the size and handler import time of each function and write them as json.",
+        ),
+        option(
+            "report-file",
+            None,
+            "Path of the json report. Defaults to .aws-sam/poetry-sam-report.json.",
+            flag=False,
+        ),
+        option("max-size", None, "Fail the report when a function is over this unzipped size in MB.", flag=False),
+        option(
+            "max-import-time",
+            None,
+            "Fail the report when a function's handler takes longer than this to import, in ms.",
+            flag=False,
+        ),
+        option(
+            "jobs",
+            "j",
+            "Number of functions to install dependencies for in parallel.",
+            flag=False,
+            default="1",
+        ),
+        option(
+            "link-dependencies",
+            None,
+            "Install each distinct set of dependencies once into .aws-sam/staging"
+            " and link it into the function build dirs.",
+        ),
+        option(
+            "wheelhouse",
+            None,
+            "Download wheels once into a persistent wheelhouse and install from it without an index.",
+        ),
+        option(
+            "wheelhouse-dir",
+            None,
+            "Directory of the wheelhouse. Defaults to the poetry cache dir.",
+            flag=False,
+        ),
+        option("offline", None, "Install only from the wheelhouse, failing on missing wheels."),
+        option(
+            "installer",
+            None,
+            "Installer of the dependencies: pip, uv (when it is on PATH, pip otherwise)"
+            " or unpack (extracts the wheels of the wheelhouse without pip, implies --wheelhouse).",
+            flag=False,
+            default="pip",
+        ),
+        option(
+            "no-source-wheels",
+            None,
+            "Let pip clone and build the git and path dependencies on every install"
+            " instead of reusing their wheels built once per commit or source tree.",
+        ),
+        option(
+            "source-wheels-dir",
+            None,
+            "Directory of the wheels built from git and path dependencies. Defaults to the poetry cache dir.",
+            flag=False,
+        ),
+        option(
+            "incremental",
+            None,
+            "Skip the functions whose code, poetry.lock, export and build options and template properties are unchanged.",
+        ),
+        option(
+            "native-staging",
+            None,
+            "Copy the function code without 'sam build', which is still used for templates it does not handle.",
+        ),
+        option(
+            "exclude",
+            None,
+            "Glob patterns of files not copied with --native-staging (comma separated).",
+            flag=False,
+            multiple=True,
+        ),
+        option(
+            "as-layer",
+            None,
+            "Install the dependencies once into a layer attached to every python function"
+            " instead of into each function.",
+        ),
+        option(
+            "prune-imports",
+            None,
+            "Remove the installed packages that are not imported, directly or transitively, by a function's handler.",
+        ),
+        option(
+            "prune-keep",
+            None,
+            "Packages to keep when pruning, for dynamic imports (comma separated).",
+            flag=False,
+            multiple=True,
+        ),
+        option(
+            "zip",
+            None,
+            "Write a deterministic zip of each function and layer to .aws-sam/artifacts"
+            " with a manifest of their hashes, and point the built template at them.",
+        ),
+        option(
+            "watch",
+            None,
+            "Build, then watch the functions' code, poetry.lock and the template and rebuild what changed.",
+        ),
+        option(
+            "tree-cache",
+            None,
+            "Cache the installed dependencies by requirements, architecture and python version"
+            " and link them into the build dirs instead of running pip.",
+        ),
+        option(
+            "tree-cache-dir",
+            None,
+            "Directory of the tree cache. Defaults to the poetry cache dir.",
+            flag=False,
+        ),
+        option(
+            "tree-cache-size",
+            None,
+            "Size of the tree cache in MB, over which the least recently used trees are evicted. Defaults to 2048.",
+            flag=False,
+        ),
+        option(
+            "logs",
+            None,
+            "Write the full output of pip and 'sam build' to .aws-sam/logs, one file per function.",
+        ),
+        option("timings", None, "Print the wall and CPU time of each build stage, per function."),
+        option(
+            "trace-file",
+            None,
+            "Write the timed build stages as a Chrome trace-event json file, viewable in Perfetto.",
+            flag=False,
+        ),
+    ]
+
+    def handle(self) -> int:
+        # poetry loads the plugin for every command: the build modules are only imported when `sam` runs
+        from poetry_aws_sam.sam import AwsBuilder
+
+        builder = AwsBuilder(self.option, self.poetry, self.io)
+        if self.option("watch"):
+            return builder.watch()
+        _ = builder.build_standard()
+
+        return 0
+
+
+class WheelhousePruneCommand(Command):
+    name = "sam wheelhouse prune"
+    description = "Removes the wheels of the sam wheelhouse that poetry.lock does not refer to"
+
+    options = [
+        option(
+            "sam-template",
+            "s",
+            "Name of sam template, whose functions with their own Poetry project keep the wheels of their lock.",
+            flag=False,
+            default=SAM_TEMPLATE_TXT,
+        ),
+        option(
+            "wheelhouse-dir",
+            None,
+            "Directory of the wheelhouse, required as the default one is shared by every project.",
+            flag=False,
+        ),
+        option("dry-run", None, "Only list the wheels that would be removed."),
+    ]
+
+    def handle(self) -> int:
+        from poetry.factory import Factory
+
+        from poetry_aws_sam.aws import Sam
+        from poetry_aws_sam.wheelhouse import Wheelhouse, locked_packages
+
+        wheelhouse_dir = self.option("wheelhouse-dir")
+        if not wheelhouse_dir:
+            # the wheels of the default wheelhouse are used by the locks of the other projects too
+            self.line_error(
+                "<error>The default wheelhouse in the poetry cache dir is shared by every project,"
+                " pass the '--wheelhouse-dir' of this project's builds to prune it.</error>"
+            )
+            return 1
+        root_dir = self.poetry.pyproject.path.parent
+        keep = locked_packages(self.poetry)
+        template = root_dir / self.option("sam-template")
+        if template.is_file():
+            # the functions installed from their own poetry.lock
+            project_dirs = {
+                aws_lambda.project_dir.resolve()
+                for aws_lambda in Sam(sam_exec="sam", template=template).lambdas
+                if aws_lambda.project_dir is not None
+            }
+            for project_dir in sorted(project_dirs - {root_dir.resolve()}):
+                self.line(f"Keeping the wheels of {project_dir / 'poetry.lock'}")
+                keep |= locked_packages(Factory().create_poetry(project_dir))
+        wheelhouse = Wheelhouse(Path(wheelhouse_dir))
+        removed = wheelhouse.prune(keep, dry_run=self.option("dry-run"))
+        for wheel in removed:
+            self.line(f"{'Would remove' if self.option('dry-run') else 'Removed'} {wheel.name}")
+        self.line(f"{len(removed)} wheel(s) pruned from {wheelhouse.root}")
+
+        return 0
+
+
+class TreeCacheStatsCommand(Command):
+    name = "sam cache stats"
+    description = "Shows the installed dependency trees of the sam tree cache"
+
+    options = [
+        option(
+            "tree-cache-dir",
+            None,
+            "Directory of the tree cache. Defaults to the poetry cache dir.",
+            flag=False,
+        ),
     ]
 
     def handle(self) -> int:
-        _ = AwsBuilder(self.option, self.poetry, self.io).build_standard()
+        from datetime import datetime
+
+        from poetry_aws_sam.slim import format_size
+        from poetry_aws_sam.tree_cache import TreeCache, default_tree_cache_dir
+
+        tree_cache_dir = self.option("tree-cache-dir")
+        tree_cache = TreeCache(Path(tree_cache_dir) if tree_cache_dir else default_tree_cache_dir(self.poetry))
+        entries = tree_cache.entries()
+        for entry in reversed(entries):
+            last_used = datetime.fromtimestamp(entry.last_used).isoformat(sep=" ", timespec="seconds")
+            self.line(f"{entry.key[:16]}  {format_size(entry.size):>10}  last used {last_used}")
+        total = sum(entry.size for entry in entries)
+        self.line(f"{len(entries)} tree(s), {format_size(total)} in {tree_cache.root}")
+
+        return 0
+
+
+class TreeCacheClearCommand(Command):
+    name = "sam cache clear"
+    description = "Removes the installed dependency trees of the sam tree cache"
+
+    options = [
+        option(
+            "tree-cache-dir",
+            None,
+            "Directory of the tree cache. Defaults to the poetry cache dir.",
+            flag=False,
+        ),
+    ]
+
+    def handle(self) -> int:
+        from poetry_aws_sam.slim import format_size
+        from poetry_aws_sam.tree_cache import TreeCache, default_tree_cache_dir
+
+        tree_cache_dir = self.option("tree-cache-dir")
+        tree_cache = TreeCache(Path(tree_cache_dir) if tree_cache_dir else default_tree_cache_dir(self.poetry))
+        removed = tree_cache.clear()
+        self.line(
+            f"{len(removed)} tree(s), {format_size(sum(entry.size for entry in removed))} removed from {tree_cache.root}"
+        )
 
         return 0
 
@@ -47,6 +333,21 @@ def factory():
     return SamCommand()
 
 
+def wheelhouse_prune_factory():
+    return WheelhousePruneCommand()
+
+
+def tree_cache_stats_factory():
+    return TreeCacheStatsCommand()
+
+
+def tree_cache_clear_factory():
+    return TreeCacheClearCommand()
+
+
 class PoetryAwsSamPlugin(ApplicationPlugin):
     def activate(self, application):
         application.command_loader.register_factory("sam", factory)
+        application.command_loader.register_factory("sam wheelhouse prune", wheelhouse_prune_factory)
+        application.command_loader.register_factory("sam cache stats", tree_cache_stats_factory)
+        application.command_loader.register_factory("sam cache clear", tree_cache_clear_factory)
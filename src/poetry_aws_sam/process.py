@@ -0,0 +1,84 @@
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from subprocess import PIPE, STDOUT, CalledProcessError, Popen
+from typing import Callable, List, Optional
+
+# lines of output kept in memory to explain a failure
+DEFAULT_TAIL_LINES = 40
+
+OutputHandler = Callable[[str], None]
+
+
+@dataclass
+class ProcessResult:
+    args: List[str]
+    returncode: int
+    tail: List[str] = field(default_factory=list)
+
+    @property
+    def output(self) -> str:
+        """
+        The last lines of the output.
+        """
+        return "\n".join(self.tail)
+
+
+class ProcessError(CalledProcessError):
+    """
+    A subprocess exited with an error, with the last lines of its output.
+    """
+
+    def __init__(self, result: ProcessResult):
+        super().__init__(result.returncode, result.args, output=result.output)
+        self.result = result
+
+    def __str__(self) -> str:
+        command = " ".join(str(arg) for arg in self.cmd[:4])
+        message = f"'{command} ...' exited with {self.returncode}"
+        return f"{message}, last output:\n{self.output}" if self.output else message
+
+
+def run_process(
+    args: List[str],
+    output: Optional[OutputHandler] = None,
+    log_file: Optional[Path] = None,
+    tail_lines: int = DEFAULT_TAIL_LINES,
+    check: bool = True,
+    on_start: Optional[Callable[[Popen], None]] = None,
+) -> ProcessResult:
+    """
+    Run `args` with its stderr merged into its stdout, passing each line to `output`
+    as it is written and appending it to `log_file`. The output is read as it comes,
+    so a chatty process never blocks on a full pipe, and only its last `tail_lines`
+    lines are kept in memory.
+
+    `on_start` receives the process once it is started, to terminate it from another thread.
+    Raises ProcessError on a non-zero exit when `check` is set.
+    """
+    tail: deque = deque(maxlen=tail_lines)
+    log = None
+    if log_file is not None:
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        log = log_file.open("a", encoding="utf-8")
+        log.write(f"$ {' '.join(str(arg) for arg in args)}\n")
+    try:
+        with Popen(args, stdout=PIPE, stderr=STDOUT, text=True, encoding="utf-8", errors="replace") as process:
+            if on_start is not None:
+                on_start(process)
+            for line in process.stdout:
+                line = line.rstrip("\r\n")
+                tail.append(line)
+                if log is not None:
+                    log.write(f"{line}\n")
+                if output is not None:
+                    output(line)
+            returncode = process.wait()
+    finally:
+        if log is not None:
+            log.close()
+
+    result = ProcessResult(args=list(args), returncode=returncode, tail=list(tail))
+    if check and returncode != 0:
+        raise ProcessError(result)
+    return result
@@ -0,0 +1,175 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from poetry_aws_sam.imports import handler_module
+from poetry_aws_sam.slim import format_size, tree_size
+
+# unzipped size limit of a function's code and layers
+LAMBDA_UNZIPPED_LIMIT = 250 * 1024 * 1024
+LARGEST_ENTRIES = 5
+SLOWEST_IMPORTS = 10
+IMPORT_TIMEOUT = 120
+
+
+@dataclass
+class FunctionReport:
+    name: str
+    unzipped_size: int
+    zipped_size: int
+    largest_packages: List[Tuple[str, int]] = field(default_factory=list)
+    # unzipped size of its dependencies layers
+    layer_size: int = 0
+    import_time_us: Optional[int] = None
+    slowest_imports: List[Tuple[str, int]] = field(default_factory=list)
+    import_error: Optional[str] = None
+    # why the handler was not imported
+    import_skipped: Optional[str] = None
+
+    @property
+    def total_size(self) -> int:
+        # the unzipped limit is over the code and the layers of a function
+        return self.unzipped_size + self.layer_size
+
+    @property
+    def limit_percent(self) -> float:
+        return self.total_size * 100 / LAMBDA_UNZIPPED_LIMIT
+
+
+def zipped_size(path: Path) -> int:
+    with tempfile.TemporaryFile() as archive_file:
+        with zipfile.ZipFile(archive_file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    file_path = Path(root) / name
+                    archive.write(file_path, file_path.relative_to(path).as_posix())
+        return archive_file.tell()
+
+
+def largest_entries(path: Path, count: int = LARGEST_ENTRIES) -> List[Tuple[str, int]]:
+    """
+    The top-level entries of a build dir with the largest size, skipping dist-info dirs.
+    """
+    sizes = []
+    for entry in path.iterdir():
+        if entry.name.endswith(".dist-info") or entry.is_symlink():
+            continue
+        sizes.append((entry.name, tree_size(entry) if entry.is_dir() else entry.stat().st_size))
+    return sorted(sizes, key=lambda item: item[1], reverse=True)[:count]
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self us, cumulative us) of each line of `-X importtime` output.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, module = line[len("import time:") :].split("|", 2)
+        try:
+            imports.append((module.strip(), int(own), int(cumulative)))
+        except ValueError:
+            continue
+    return imports
+
+
+def import_times(
+    build_dir: Path, handler: str, python: str = sys.executable, layer_dirs: Optional[List[Path]] = None
+) -> Tuple[Optional[int], list, str]:
+    """
+    Import the handler's module in an isolated interpreter with `-X importtime`, with the
+    `layer_dirs` after the build dir on sys.path as lambda puts them. No bytecode is written
+    into the build dir, which is deployed as it is.
+
+    Returns the cumulative import time of the module, the slowest imports and an error, if any.
+    """
+    module = handler_module(handler)
+    paths = [str(build_dir)] + [str(layer_dir) for layer_dir in layer_dirs or []]
+    code = f"import sys; sys.path[0:0] = {paths!r}; import {module}"
+    try:
+        result = subprocess.run(
+            [python, "-I", "-S", "-B", "-X", "importtime", "-c", code],
+            cwd=build_dir,
+            capture_output=True,
+            text=True,
+            timeout=IMPORT_TIMEOUT,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        return None, [], f"import timed out after {IMPORT_TIMEOUT}s"
+    imports = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        error_lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return None, [], error_lines[-1] if error_lines else f"exit code {result.returncode}"
+    total = next((cumulative for name, _, cumulative in imports if name == module), None)
+    slowest = sorted(((name, cumulative) for name, _, cumulative in imports), key=lambda item: item[1], reverse=True)
+    return total, slowest[:SLOWEST_IMPORTS], ""
+
+
+def function_report(
+    name: str,
+    build_dir: Path,
+    handler: str,
+    layer_dirs: Optional[List[Path]] = None,
+    skip_import: Optional[str] = None,
+) -> FunctionReport:
+    """
+    The report of a built function and its dependencies `layer_dirs`. The handler is not
+    imported when `skip_import` gives a reason, such as packages built for another platform.
+    """
+    layer_dirs = layer_dirs or []
+    import_time, slowest, error = None, [], ""
+    if skip_import is None:
+        import_time, slowest, error = import_times(build_dir, handler, layer_dirs=layer_dirs)
+    return FunctionReport(
+        name=name,
+        unzipped_size=tree_size(build_dir),
+        zipped_size=zipped_size(build_dir),
+        layer_size=sum(tree_size(layer_dir) for layer_dir in layer_dirs),
+        largest_packages=largest_entries(build_dir),
+        import_time_us=import_time,
+        slowest_imports=slowest,
+        import_error=error or None,
+        import_skipped=skip_import,
+    )
+
+
+def render_table(reports: List[FunctionReport]) -> List[str]:
+    header = ("Function", "Unzipped", "Zipped", "% of 250 MB", "Import", "Largest packages")
+    rows = [header]
+    for report in reports:
+        if report.import_skipped:
+            import_time = "skipped"
+        elif report.import_time_us is not None:
+            import_time = f"{report.import_time_us / 1000:.1f} ms"
+        else:
+            import_time = "error"
+        largest = ", ".join(f"{name} ({format_size(size)})" for name, size in report.largest_packages[:3])
+        rows.append(
+            (
+                report.name,
+                format_size(report.total_size),
+                format_size(report.zipped_size),
+                f"{report.limit_percent:.1f}%",
+                import_time,
+                largest,
+            )
+        )
+    widths = [max(len(row[index]) for row in rows) for index in range(len(header))]
+    return ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+
+
+def write_report(path: Path, reports: List[FunctionReport]) -> None:
+    data = {
+        "limit_unzipped_size": LAMBDA_UNZIPPED_LIMIT,
+        "functions": [asdict(report) for report in reports],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
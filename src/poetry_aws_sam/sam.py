@@ -1,97 +1,1040 @@
+import hashlib
+import json
+import os
+import re
+import shutil
 import sys
-from shlex import quote
-from subprocess import PIPE, check_call
-from typing import Dict
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Type
 
-from poetry_aws_sam.aws import AwsLambda, Sam, find_root_dir
-from poetry_aws_sam.export import ExportLock
+import yaml
+from cleo.io.outputs.output import Verbosity
+from poetry.factory import Factory
+from poetry.poetry import Poetry
+
+from poetry_aws_sam.artifacts import SAM_ARTIFACTS_DIR_NAME, code_sources, package_artifacts
+from poetry_aws_sam.aws import POETRY_PROJECT_FILES, AwsLambda, Sam, find_root_dir
+from poetry_aws_sam.export import ExportCache, ExportLock
+from poetry_aws_sam.imports import prune_unused
+from poetry_aws_sam.installers import (
+    DEFAULT_INSTALLER,
+    INSTALLERS,
+    UNPACK,
+    UV,
+    Installer,
+    InstallerError,
+    create_installer,
+)
+from poetry_aws_sam.layer import LAYER_PYTHON_DIR_NAME, SAM_LAYERS_DIR_NAME, attach_layer, dependency_layers
+from poetry_aws_sam.link import link_tree
+from poetry_aws_sam.manifest import SAM_MANIFEST_FILE_NAME, BuildManifest, Fingerprint, hash_tree
+from poetry_aws_sam.platforms import InstallTarget, group_by_target, install_target, runs_on_host
+from poetry_aws_sam.process import OutputHandler, ProcessError, run_process
+from poetry_aws_sam.report import function_report, render_table, write_report
+from poetry_aws_sam.slim import DEFAULT_SLIM_RULES, METADATA_KEY, SlimError, format_size, slim, slim_rules
+from poetry_aws_sam.source_wheels import SourceWheelError, SourceWheels, default_source_wheels_dir
+from poetry_aws_sam.staging import DEFAULT_EXCLUDES, NativeStaging
+from poetry_aws_sam.template import read_template, write_template
+from poetry_aws_sam.timings import TimingHook, Timings
+from poetry_aws_sam.tree_cache import DEFAULT_TREE_CACHE_SIZE_MB, TreeCache, default_tree_cache_dir, tree_key
+from poetry_aws_sam.watch import PollingWatcher, sync_files
+from poetry_aws_sam.wheelhouse import Wheelhouse, WheelhouseError, default_wheelhouse_dir, parse_pins
 
 SAM_BUILD_DIR_NAME = ".aws-sam/build"
+SAM_STAGING_DIR_NAME = ".aws-sam/staging"
+SAM_INCREMENTAL_DIR_NAME = ".aws-sam/incremental"
+SAM_REPORT_FILE_NAME = ".aws-sam/poetry-sam-report.json"
+SAM_PREFETCH_DIR_NAME = ".aws-sam/prefetch"
+SAM_LOGS_DIR_NAME = ".aws-sam/logs"
+# log of the subprocesses that do not run for a function
+BUILD_LOG_NAME = "poetry-sam"
+# names of the watched roots that are not functions
+WATCH_LOCK = "poetry.lock"
+WATCH_TEMPLATE = "template"
+# statuses of the functions of a build
+SUCCESS = "success"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNCHANGED = "unchanged"
+# options that change what is installed into a function's build dir, with the installer
+BUILD_OPTIONS = ["slim", "slim-rules", "prune-imports", "prune-keep", "as-layer", "exclude"]
+
+
+class BuildError(Exception):
+    """
+    The build was aborted. The programmatic API sets `result` to what was built.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.result = None
+
+
+class OptionError(BuildError):
+    pass
+
+
+class TemplateError(BuildError):
+    pass
+
+
+class SamBuildError(BuildError):
+    pass
+
+
+class DependencyError(BuildError):
+    pass
+
+
+class FunctionBuildError(BuildError):
+    pass
+
+
+class ReportError(BuildError):
+    pass
+
+
+class PackageError(BuildError):
+    pass
 
 
 class AwsBuilder:
-    def __init__(self, options, poetry, io):
+    def __init__(
+        self,
+        options,
+        poetry,
+        io,
+        timing_hooks: Optional[List[TimingHook]] = None,
+        export_cache: Optional[ExportCache] = None,
+        raise_errors: bool = False,
+    ):
         self.config = options
         self._io = io
         self.poetry = poetry
+        self.timings = Timings(hooks=timing_hooks)
+        self.export_cache = export_cache if export_cache is not None else ExportCache()
+        # raise a BuildError instead of exiting, for the programmatic API
+        self.raise_errors = raise_errors
+        # status of each function of the last build, and the error of the failed ones
+        self.statuses: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self._local = threading.local()
+        self._staging_locks: Dict[str, threading.Lock] = {}
+        self._staging_guard = threading.Lock()
+        self._wheelhouse_lock = threading.Lock()
+        self._projects: Dict[Path, Poetry] = {}
+        self._projects_guard = threading.Lock()
+        self.stop_watching = threading.Event()
 
     @property
     def root_dir(self):
         return find_root_dir(self.poetry)
 
+    def poetry_for(self, aws_lambda: AwsLambda) -> Poetry:
+        """
+        The Poetry project whose lock is installed for the lambda: the project at
+        its CodeUri when it has one, the root project otherwise. Each project is loaded once.
+        """
+        project_dir = aws_lambda.project_dir
+        if project_dir is None or project_dir.resolve() == Path(self.root_dir).resolve():
+            return self.poetry
+        key = project_dir.resolve()
+        with self._projects_guard:
+            poetry = self._projects.get(key)
+        if poetry is None:
+            poetry = Factory().create_poetry(key)
+            with self._projects_guard:
+                poetry = self._projects.setdefault(key, poetry)
+        return poetry
+
+    def clear_projects(self) -> None:
+        """
+        Forget the loaded Poetry projects and their exports, for locks that changed.
+        """
+        self.export_cache.clear()
+        with self._projects_guard:
+            self._projects.clear()
+
+    def project_name(self, poetry: Poetry) -> str:
+        """
+        The dir of a function's Poetry project relative to the root, empty for the root project.
+        """
+        if poetry is self.poetry:
+            return ""
+        return Path(os.path.relpath(find_root_dir(poetry), self.root_dir)).as_posix()
+
+    def lambdas_by_project(self, aws_lambdas: List[AwsLambda]) -> Dict[str, List[AwsLambda]]:
+        """
+        The lambdas grouped by the name of the Poetry project they are installed from.
+        """
+        projects: Dict[str, List[AwsLambda]] = {}
+        for aws_lambda in aws_lambdas:
+            projects.setdefault(self.project_name(self.poetry_for(aws_lambda)), []).append(aws_lambda)
+        return projects
+
     def get_version_api(self) -> Dict:
         return {"standard": self.build_standard}
 
-    def abort(self, message: str = "", code: int = 1) -> None:
+    def abort(self, message: str = "", code: int = 1, error: Type[BuildError] = BuildError) -> None:
         """
-        Terminate the program with the given return code.
+        Terminate the program with the given return code, or raise `error` with raise_errors.
         """
+        if self.raise_errors:
+            raise error(message)
         self._io.write_error_line(message)
 
         sys.exit(code)
 
+    @contextmanager
+    def abort_on_error(self, message: str, error: Type[BuildError]) -> Iterator[None]:
+        """
+        Abort with `error` when a subprocess, an installer, the lambda targets or the
+        files of the build fail, instead of letting their own exception through.
+        """
+        try:
+            yield
+        except (
+            ProcessError,
+            InstallerError,
+            WheelhouseError,
+            SourceWheelError,
+            SlimError,
+            ValueError,
+            OSError,
+        ) as cause:
+            self.abort(f"{message}: {cause}", error=error)
+
+    @property
+    def jobs(self) -> int:
+        try:
+            jobs = int(self.config("jobs"))
+        except (TypeError, ValueError):
+            jobs = 0
+        if jobs < 1:
+            self.abort("The '--jobs' option must be a positive integer.", error=OptionError)
+        return jobs
+
+    @property
+    def parameter_overrides(self) -> Dict[str, str]:
+        overrides = {}
+        for override in self.config("parameter-overrides") or []:
+            for pair in override.split():
+                name, separator, value = pair.partition("=")
+                if not separator:
+                    self.abort(f"Invalid parameter override '{pair}', expected Name=Value.", error=OptionError)
+                overrides[name] = value
+        return overrides
+
+    @property
+    def slim_rules(self) -> List[str]:
+        rules = [rule.strip() for rules in self.config("slim-rules") or [] for rule in rules.split(",") if rule.strip()]
+        if not rules and self.config("slim"):
+            rules = list(DEFAULT_SLIM_RULES)
+        return rules
+
+    def line(self, text: str) -> None:
+        """
+        Write a line of output for the lambda being built.
+
+        Output written from a worker thread is buffered so that it is
+        printed in order once the lambda's build is done.
+        """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            self._io.write_line(text)
+        else:
+            buffer.append(text)
+
     @property
     def sam_build_location(self):
         return self.root_dir / SAM_BUILD_DIR_NAME
 
+    @property
+    def sam_staging_location(self):
+        return self.root_dir / SAM_STAGING_DIR_NAME
+
+    @property
+    def wheelhouse(self) -> Optional[Wheelhouse]:
+        # the unpack installer only installs the wheels of the wheelhouse
+        if not (self.config("wheelhouse") or self.config("offline") or self.config("installer") == UNPACK):
+            return None
+        wheelhouse_dir = self.config("wheelhouse-dir")
+        return Wheelhouse(Path(wheelhouse_dir) if wheelhouse_dir else default_wheelhouse_dir(self.poetry))
+
+    @property
+    def tree_cache(self) -> Optional[TreeCache]:
+        if not self.config("tree-cache"):
+            return None
+        tree_cache_dir = self.config("tree-cache-dir")
+        max_size = self._threshold("tree-cache-size")
+        return TreeCache(
+            Path(tree_cache_dir) if tree_cache_dir else default_tree_cache_dir(self.poetry),
+            max_size=int((DEFAULT_TREE_CACHE_SIZE_MB if max_size is None else max_size) * 1024 * 1024),
+        )
+
+    @property
+    def source_wheels(self) -> Optional[SourceWheels]:
+        if self.config("no-source-wheels"):
+            return None
+        source_wheels_dir = self.config("source-wheels-dir")
+        return SourceWheels(Path(source_wheels_dir) if source_wheels_dir else default_source_wheels_dir(self.poetry))
+
+    def use_source_wheels(self, requirements_file: Path) -> None:
+        """
+        Point the git and path dependencies of the requirements at their cached wheels,
+        building the missing ones, so that pip does not clone and build them on every install.
+        """
+        source_wheels = self.source_wheels
+        if source_wheels is None or not requirements_file.exists():
+            return
+        requirements_text = requirements_file.read_text(encoding="utf-8")
+        with self.timings.stage("source wheels"):
+            rewritten, built = source_wheels.rewrite(requirements_text)
+        for wheel in built:
+            self.line(f"built {wheel} into {source_wheels.root}")
+        if rewritten != requirements_text:
+            requirements_file.write_text(rewritten, encoding="utf-8")
+
+    def log_file(self, name: Optional[str]) -> Optional[Path]:
+        """
+        The --logs file of a function, or of the build when `name` is None.
+        """
+        if not self.config("logs"):
+            return None
+        return self.root_dir / SAM_LOGS_DIR_NAME / f"{re.sub(r'[^A-Za-z0-9_.-]+', '-', name or BUILD_LOG_NAME)}.log"
+
+    def stream(self, name: Optional[str], verbosity: Verbosity) -> OutputHandler:
+        """
+        Write the output of a subprocess live at `verbosity`, prefixed with the function it runs for.
+        """
+        prefix = f"{name}: " if name else ""
+
+        def write(text: str) -> None:
+            self._io.write_line(f"{prefix}{text}", verbosity=verbosity)
+
+        return write
+
+    def execute(self, args: List[str]) -> None:
+        """
+        Run a pip subprocess for the current function, streaming its output at -vv
+        and raising ProcessError with its last lines when it fails.
+        """
+        function = self.timings.current_function
+        run_process(args, output=self.stream(function, Verbosity.VERY_VERBOSE), log_file=self.log_file(function))
+
+    def run(self, stage: str, args: List[str]) -> None:
+        with self.timings.stage(stage, subprocess=True):
+            self.execute(args)
+
+    def fill_wheelhouse(self, wheelhouse: Wheelhouse, requirements_file: Path, install: InstallTarget) -> None:
+        """
+        Download the wheels of the pinned requirements missing from the wheelhouse.
+        """
+        pins, _ = parse_pins(requirements_file.read_text(encoding="utf-8"))
+        with self._wheelhouse_lock:
+            missing = wheelhouse.missing(pins, install)
+            if not missing:
+                return
+            if self.config("offline"):
+                names = ", ".join(f"{pin.name}=={pin.version}" for pin in missing)
+                raise WheelhouseError(f"Wheels missing from the wheelhouse in offline mode: {names}")
+            missing_file = requirements_file.with_name("requirements-missing.txt")
+            missing_file.write_text("\n".join(pin.line for pin in missing) + "\n", encoding="utf-8")
+            try:
+                self.run(
+                    "pip download", [sys.executable, "-m", "pip"] + wheelhouse.download_args(missing_file, install)
+                )
+            finally:
+                missing_file.unlink()
+
+    def install_requirements(self, requirements_file: Path, target: Path, install: InstallTarget) -> bool:
+        """
+        Install the requirements into `target`, through the tree cache when it is enabled.
+
+        Returns True when the installed tree was reused from the tree cache.
+        """
+        # before the tree key, which then changes with the source of the path dependencies
+        self.use_source_wheels(requirements_file)
+        tree_cache = self.tree_cache
+        if tree_cache is None:
+            self._install_requirements(requirements_file, target, install)
+            return False
+        key = tree_key(requirements_file.read_text(encoding="utf-8"), install, self.installer.name)
+        return tree_cache.install(
+            key, target, lambda tree: self._install_requirements(requirements_file, tree, install)
+        )
+
+    @property
+    def installer(self) -> Installer:
+        name = self.config("installer") or DEFAULT_INSTALLER
+        if name not in INSTALLERS:
+            self.abort(f"Unknown installer '{name}'. Available: {', '.join(INSTALLERS)}", error=OptionError)
+        return create_installer(name, self.execute)
+
+    def _install_requirements(self, requirements_file: Path, target: Path, install: InstallTarget) -> None:
+        wheelhouse = self.wheelhouse
+        if wheelhouse is not None:
+            self.fill_wheelhouse(wheelhouse, requirements_file, install)
+        installer = self.installer
+        with self.timings.stage(installer.stage, subprocess=installer.subprocess):
+            installer.install(
+                requirements_file, target, install, find_links=wheelhouse.tag_dir(install) if wheelhouse else None
+            )
+
+    def stage_requirements(self, aws_lambda: AwsLambda, requirements_file: Path, install: InstallTarget) -> Path:
+        """
+        Install the requirements into a staging dir shared by every lambda
+        with the same requirements, architecture and python version.
+        Only the first lambda of the group runs pip.
+        """
+        requirements_hash = hashlib.sha256(requirements_file.read_bytes()).hexdigest()[:16]
+        key = f"{install.key}-{requirements_hash}"
+        staging_dir = self.sam_staging_location / key
+        with self._staging_guard:
+            staging_lock = self._staging_locks.setdefault(key, threading.Lock())
+
+        with staging_lock:
+            if staging_dir.exists():
+                self.line(f"{aws_lambda.name}: reusing staged dependencies {key}")
+                return staging_dir
+            partial_dir = staging_dir.with_name(f"{key}.partial")
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            self.install_requirements(requirements_file, partial_dir, install)
+            partial_dir.mkdir(parents=True, exist_ok=True)
+            partial_dir.rename(staging_dir)
+        return staging_dir
+
     def build_lambda(self, aws_lambda: AwsLambda) -> None:
         build_dir = self.sam_build_location / aws_lambda.name
         target = build_dir / aws_lambda.path
         requirements_file = target / "requirements.txt"
         requirements_file.parent.mkdir(exist_ok=True, parents=True)
-        _ = ExportLock(self.config, self.poetry, self._io).handle(requirements_file)
-
-        check_call(
-            [
-                sys.executable,
-                "-m",
-                "pip",
-                "install",
-                "--platform",
-                "manylinux2014_x86_64",
-                "--only-binary",
-                ":all:",
-                "--upgrade",
-                "--disable-pip-version-check",
-                "--no-python-version-warning",
-                "-r",
-                quote(str(requirements_file)),
-                "-t",
-                quote(str(build_dir)),
-            ],
-            stdout=PIPE,
-            stderr=PIPE,
-            shell=False,
-        )
+        poetry = self.poetry_for(aws_lambda)
+        project = self.project_name(poetry)
+        if project:
+            self.line(f"{aws_lambda.name}: installing the poetry.lock of {project}")
+        export_lock = ExportLock(self.config, poetry, self._io)
+        with self.timings.stage("export"):
+            cached = self.export_cache.export(export_lock, requirements_file)
+        if cached:
+            self.line(f"{aws_lambda.name}: reusing cached poetry.lock export")
+
+        install = install_target(aws_lambda)
+        if self.config("link-dependencies"):
+            staging_dir = self.stage_requirements(aws_lambda, requirements_file, install)
+            with self.timings.stage("link"):
+                methods = link_tree(staging_dir, build_dir)
+            summary = ", ".join(f"{count} {method}" for method, count in sorted(methods.items()))
+            self.line(f"{aws_lambda.name}: linked dependencies ({summary or 'no files'})")
+        elif self.install_requirements(requirements_file, build_dir, install):
+            self.line(f"{aws_lambda.name}: linked dependencies from the tree cache")
         if requirements_file.exists():
             requirements_file.unlink()
 
-    def build_standard(self) -> int:
+        if self.config("prune-imports"):
+            with self.timings.stage("prune"):
+                self.prune_lambda(aws_lambda, build_dir)
+
+        rules = slim_rules(self.slim_rules, aws_lambda.metadata)
+        if rules:
+            with self.timings.stage("slim"):
+                result = slim(build_dir, rules, install)
+            saved = result.saved * 100 // result.before if result.before else 0
+            self.line(
+                f"{aws_lambda.name}: slimmed {format_size(result.before)} -> {format_size(result.after)} (-{saved}%)"
+            )
+            for message in result.messages:
+                self.line(f"{aws_lambda.name}: {message}")
+
+    def prune_lambda(self, aws_lambda: AwsLambda, build_dir: Path) -> None:
+        """
+        Remove the installed packages that the lambda's handler does not import.
+        """
+        keep = [name for names in self.config("prune-keep") or [] for name in names.split(",") if name.strip()]
+        removed = prune_unused(build_dir, aws_lambda.handler, self.poetry_for(aws_lambda).locker.lock_data, keep=keep)
+        if removed:
+            self.line(f"{aws_lambda.name}: pruned {len(removed)} unused package(s): {', '.join(removed)}")
+        else:
+            self.line(f"{aws_lambda.name}: no unused packages")
+
+    def _build_lambda_buffered(self, aws_lambda: AwsLambda) -> List[str]:
+        self._local.buffer = []
         try:
-            sam = Sam(sam_exec="sam", template=self.root_dir / self.config("sam-template"))
-        except AttributeError:
-            self.abort(
-                "Unsupported type for a 'CodeUri' or 'Handler'. Only string is supported."
-                "Functions !Sub, !Ref and others are not supported yet. "
+            with self.timings.function(aws_lambda.name), self.timings.stage("build lambda"):
+                self.build_lambda(aws_lambda=aws_lambda)
+            return self._local.buffer
+        finally:
+            self._local.buffer = None
+
+    def build_lambdas(self, aws_lambdas: List[AwsLambda]) -> None:
+        """
+        Install the dependencies of each lambda on a pool of `--jobs` workers.
+
+        Output is printed in the order of the lambdas. When a lambda fails
+        the lambdas that have not started yet are cancelled.
+        """
+        results: Dict[str, str] = {}
+        failed: List[str] = []
+        # recorded as they come, so that they are kept when the build is aborted
+        self.statuses.update({aws_lambda.name: CANCELLED for aws_lambda in aws_lambdas})
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [
+                (aws_lambda, executor.submit(self._build_lambda_buffered, aws_lambda)) for aws_lambda in aws_lambdas
+            ]
+            for aws_lambda, future in futures:
+                if future.cancelled():
+                    results[aws_lambda.name] = CANCELLED
+                    continue
+                self._io.write_line(f"{aws_lambda.name} ...")
+                try:
+                    lines = future.result()
+                except CancelledError:
+                    results[aws_lambda.name] = CANCELLED
+                    continue
+                except Exception as error:
+                    self._io.write_error_line(f"{aws_lambda.name} failed: {error}")
+                    results[aws_lambda.name] = self.statuses[aws_lambda.name] = FAILED
+                    self.errors[aws_lambda.name] = str(error)
+                    failed.append(aws_lambda.name)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    continue
+                for text in lines:
+                    self._io.write_line(text)
+                self._io.write_line("success")
+                results[aws_lambda.name] = self.statuses[aws_lambda.name] = SUCCESS
+
+        if len(aws_lambdas) > 1:
+            self._io.write_line("Summary:")
+            for name, status in results.items():
+                self._io.write_line(f"  {name}: {status}")
+        if failed:
+            self.abort(f"Build failed for: {', '.join(failed)}", error=FunctionBuildError)
+
+    @property
+    def manifest_location(self):
+        return self.root_dir / SAM_MANIFEST_FILE_NAME
+
+    def build_options_hash(self) -> str:
+        """
+        Sha256 of the options that change how the dependencies of a function are installed.
+        """
+        options = {}
+        for name in BUILD_OPTIONS:
+            value = self.config(name)
+            options[name] = sorted(value) if isinstance(value, list) else value
+        # the installer that runs, uv falls back to pip
+        options["installer"] = self.installer.name
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def fingerprints(self, sam: Sam) -> Dict[str, Fingerprint]:
+        options_hash = ExportLock(self.config, self.poetry, self._io).options_hash()
+        build_hash = self.build_options_hash()
+        fingerprints = {}
+        # the lambdas sharing a CodeUri only hash it once
+        code_hashes: Dict[Path, str] = {}
+        for aws_lambda in sam.lambdas:
+            if isinstance(aws_lambda.code_uri, str) and sam.code_dir(aws_lambda).exists():
+                code_dir = sam.code_dir(aws_lambda).resolve()
+                if code_dir not in code_hashes:
+                    code_hashes[code_dir] = hash_tree(code_dir)
+                code = code_hashes[code_dir]
+            else:
+                code = json.dumps(aws_lambda.code_uri, sort_keys=True, default=str)
+            fingerprints[aws_lambda.name] = Fingerprint(
+                code=code,
+                lock=ExportLock(self.config, self.poetry_for(aws_lambda), self._io).lock_hash(),
+                options=options_hash,
+                build=build_hash,
+                properties={
+                    "Architectures": aws_lambda.architectures,
+                    "Handler": aws_lambda.handler,
+                    "Runtime": aws_lambda.runtime,
+                    METADATA_KEY: aws_lambda.metadata.get(METADATA_KEY),
+                },
             )
-            raise
-        self._io.write_line("Building lambda functions ...")
-        build_dir = str(self.sam_build_location)
+        return fingerprints
+
+    def changed_lambdas(
+        self, aws_lambdas: List[AwsLambda], manifest: BuildManifest, fingerprints: Dict[str, Fingerprint]
+    ) -> List[AwsLambda]:
+        """
+        The lambdas whose fingerprint differs from the manifest, reporting why each one is rebuilt.
+        """
+        changed = []
+        for aws_lambda in aws_lambdas:
+            reasons = fingerprints[aws_lambda.name].changes(manifest.fingerprints.get(aws_lambda.name))
+            if not reasons and not (self.sam_build_location / aws_lambda.name).exists():
+                reasons = ["build output missing"]
+            if reasons:
+                self._io.write_line(f"Rebuilding {aws_lambda.name}: {', '.join(reasons)}")
+                changed.append(aws_lambda)
+            else:
+                self._io.write_line(f"Skipping {aws_lambda.name}: unchanged", verbosity=Verbosity.VERBOSE)
+        return changed
+
+    @contextmanager
+    def preserve_builds(self, aws_lambdas: List[AwsLambda]) -> Iterator[None]:
+        """
+        Keep the build dirs of `aws_lambdas` out of the way of 'sam build'
+        and put them back once it is done.
+        """
+        incremental_dir = self.root_dir / SAM_INCREMENTAL_DIR_NAME
+        shutil.rmtree(incremental_dir, ignore_errors=True)
+        incremental_dir.mkdir(parents=True)
+        for aws_lambda in aws_lambdas:
+            (self.sam_build_location / aws_lambda.name).rename(incremental_dir / aws_lambda.name)
+        try:
+            yield
+        finally:
+            for aws_lambda in aws_lambdas:
+                build_dir = self.sam_build_location / aws_lambda.name
+                shutil.rmtree(build_dir, ignore_errors=True)
+                build_dir.parent.mkdir(parents=True, exist_ok=True)
+                (incremental_dir / aws_lambda.name).rename(build_dir)
+            shutil.rmtree(incremental_dir, ignore_errors=True)
+
+    def build_layer(self, sam: Sam) -> None:
+        """
+        Install the exported poetry.lock once into a layer per Poetry project, architecture
+        and python version, shared by the python lambdas of the built template.
+        A layer is only reinstalled when the requirements or its slim rules change.
+        """
+        layers_dir = self.root_dir / SAM_LAYERS_DIR_NAME
+        layers_dir.mkdir(parents=True, exist_ok=True)
+        requirements_file = layers_dir / "requirements.txt"
+
+        built_template = self.sam_build_location / "template.yaml"
+        template = read_template(built_template)
+        layer_dirs = set()
+        for project, project_lambdas in self.lambdas_by_project(sam.lambdas).items():
+            export_lock = ExportLock(self.config, self.poetry_for(project_lambdas[0]), self._io)
+            with self.timings.stage("export"):
+                self.export_cache.export(export_lock, requirements_file)
+            requirements_hash = hashlib.sha256(requirements_file.read_bytes()).hexdigest()[:16]
+
+            for install, aws_lambdas in group_by_target(project_lambdas).items():
+                # the layer is shared, it is only slimmed with the rules of all its lambdas
+                lambda_rules = [slim_rules(self.slim_rules, aws_lambda.metadata) for aws_lambda in aws_lambdas]
+                rules = [rule for rule in lambda_rules[0] if all(rule in other for other in lambda_rules[1:])]
+                # projects with the same requirements share the installed layer
+                key = f"{install.key}-{requirements_hash}"
+                if rules:
+                    key += f"-{hashlib.sha256(','.join(rules).encode('utf-8')).hexdigest()[:8]}"
+                layer_dir = layers_dir / key
+
+                self._io.write_line(f"Dependencies layer {key}{f' of {project}' if project else ''} ...")
+                if layer_dir in layer_dirs or layer_dir.exists():
+                    self._io.write_line("unchanged, reusing the installed layer")
+                else:
+                    partial_dir = layers_dir / f"{key}.partial"
+                    shutil.rmtree(partial_dir, ignore_errors=True)
+                    with self.timings.function(f"layer {key}"):
+                        self.install_requirements(requirements_file, partial_dir / LAYER_PYTHON_DIR_NAME, install)
+                        if rules:
+                            with self.timings.stage("slim"):
+                                result = slim(partial_dir / LAYER_PYTHON_DIR_NAME, rules, install)
+                            saved = result.saved * 100 // result.before if result.before else 0
+                            self._io.write_line(
+                                f"slimmed {format_size(result.before)} -> {format_size(result.after)} (-{saved}%)"
+                            )
+                            for message in result.messages:
+                                self._io.write_line(message)
+                    partial_dir.mkdir(parents=True, exist_ok=True)
+                    partial_dir.rename(layer_dir)
+                    self._io.write_line("success")
+                layer_dirs.add(layer_dir)
+                template = attach_layer(
+                    template,
+                    aws_lambdas,
+                    install,
+                    Path(os.path.relpath(layer_dir, self.sam_build_location)),
+                    project=project,
+                )
+            requirements_file.unlink()
+        write_template(built_template, template)
+
+        for stale_dir in layers_dir.iterdir():
+            if stale_dir.is_dir() and stale_dir not in layer_dirs:
+                shutil.rmtree(stale_dir, ignore_errors=True)
+
+    def prefetch(self, aws_lambdas: List[AwsLambda], cancelled: threading.Event) -> None:
+        """
+        Export the poetry.lock of each Poetry project into the export cache and, with a
+        wheelhouse, download the missing wheels of each install target into it, once for
+        the pins shared by several projects. Neither needs the build dir, so this runs
+        while the code is staged. Stops between steps once `cancelled` is set.
+        """
+        wheelhouse = self.wheelhouse
+        prefetch_dir = self.root_dir / SAM_PREFETCH_DIR_NAME
+        prefetch_dir.mkdir(parents=True, exist_ok=True)
+        requirements_file = prefetch_dir / "requirements.txt"
+        try:
+            for project_lambdas in self.lambdas_by_project(aws_lambdas).values():
+                if cancelled.is_set():
+                    return
+                export_lock = ExportLock(self.config, self.poetry_for(project_lambdas[0]), self._io)
+                with self.timings.stage("export"):
+                    self.export_cache.export(export_lock, requirements_file)
+                if wheelhouse is None or not requirements_file.exists():
+                    continue
+                for install in group_by_target(project_lambdas):
+                    if cancelled.is_set():
+                        return
+                    with self.timings.stage("prefetch wheels"):
+                        self.fill_wheelhouse(wheelhouse, requirements_file, install)
+                requirements_file.unlink()
+        finally:
+            shutil.rmtree(prefetch_dir, ignore_errors=True)
+
+    def stage_code_and_prefetch(
+        self, sam: Sam, build_dir: str, aws_lambdas: List[AwsLambda], unchanged: Optional[List[AwsLambda]] = None
+    ) -> None:
+        """
+        Stage the code while the dependencies are exported, and downloaded with
+        a wheelhouse, in the background. A failure of either cancels the other.
+        """
+        cancelled = threading.Event()
+
+        def cancel_on_failure(future):
+            if future.exception() is not None:
+                cancelled.set()
+                sam.cancel_sam_build()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prefetched = executor.submit(self.prefetch, aws_lambdas, cancelled)
+            prefetched.add_done_callback(cancel_on_failure)
+            try:
+                self.stage_code(sam, build_dir, cancelled, unchanged)
+            except BaseException:
+                cancelled.set()
+                raise
+            error = prefetched.exception()
+        if error is not None:
+            self.abort(f"Fetching the dependencies failed: {error}", error=DependencyError)
+
+    def stage_code(
+        self,
+        sam: Sam,
+        build_dir: str,
+        cancelled: Optional[threading.Event] = None,
+        unchanged: Optional[List[AwsLambda]] = None,
+    ) -> None:
+        """
+        Copy the code of the functions into the build dir and write the built template.
+        Native staging does not copy the `unchanged` functions, 'sam build' copies them all.
+        """
+        if self.config("native-staging"):
+            excludes = [pattern for patterns in self.config("exclude") or [] for pattern in patterns.split(",")]
+            staging = NativeStaging(sam.template_path, Path(build_dir), excludes, sam.parameter_overrides)
+            reasons = staging.unsupported()
+            if not reasons:
+                with self.timings.stage("native staging"):
+                    with self.abort_on_error("Staging the code failed", SamBuildError):
+                        staging.stage(jobs=self.jobs, skip={aws_lambda.name for aws_lambda in unchanged or []})
+                return
+            self._io.write_line(f"Falling back to 'sam build': {'; '.join(reasons)}")
+
         # 'sam build' creates the build dir and copies
         # the app code into that dir
         # same result as running 'sam build' without a requirements file
-        result = sam.invoke_sam_build(build_dir=build_dir, params=None)
+        with self.timings.stage("sam build", subprocess=True):
+            result = sam.invoke_sam_build(build_dir=build_dir, params=None)
+        if cancelled is not None and cancelled.is_set():
+            # stopped because fetching the dependencies failed, which is reported instead
+            return
         if result.returncode != 0:
             self._io.write_error_line(result.stderr)
-            self.abort("SAM build failed!")
+            self.abort("SAM build failed!", error=SamBuildError)
 
-        for aws_lambda in sam.lambdas:
-            self._io.write_line(f"{aws_lambda.name} ...")
+    def package(self) -> None:
+        """
+        Zip the built functions and layers deterministically into .aws-sam/artifacts
+        and point the built template at the zips, so that unchanged code gives the same zip.
+        """
+        with self.abort_on_error("Packaging failed", PackageError):
+            built_template = self.sam_build_location / "template.yaml"
+            template = read_template(built_template)
+            with self.timings.stage("package"):
+                artifacts = package_artifacts(
+                    template, self.sam_build_location, self.root_dir / SAM_ARTIFACTS_DIR_NAME, jobs=self.jobs
+                )
+            write_template(built_template, template)
+            for name, artifact in artifacts.items():
+                if artifact is None:
+                    self._io.write_line(f"{name}: zip unchanged", verbosity=Verbosity.VERBOSE)
+                else:
+                    self._io.write_line(f"{name}: zipped {format_size(artifact.size)} sha256:{artifact.sha256[:12]}")
+
+    def _threshold(self, name: str) -> Optional[float]:
+        value = self.config(name)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            self.abort(f"The '--{name}' option must be a number.", error=OptionError)
+
+    def report(self, sam: Sam) -> None:
+        """
+        Print the size and handler import time of each built lambda, write them
+        as json and fail when they are over the --max-size/--max-import-time thresholds.
+        """
+        max_size = self._threshold("max-size")
+        max_import_time = self._threshold("max-import-time")
+        with self.abort_on_error("Reporting failed", ReportError), self.timings.stage("report"):
+            template = read_template(self.sam_build_location / "template.yaml")
+            sources = code_sources(template, self.sam_build_location, self.root_dir / SAM_ARTIFACTS_DIR_NAME)
+            reports = []
+            for aws_lambda in sam.lambdas:
+                install = install_target(aws_lambda)
+                reports.append(
+                    function_report(
+                        aws_lambda.name,
+                        self.sam_build_location / aws_lambda.name,
+                        aws_lambda.handler,
+                        layer_dirs=[
+                            sources[layer] / LAYER_PYTHON_DIR_NAME
+                            for layer in dependency_layers(template, aws_lambda.name)
+                            if layer in sources
+                        ],
+                        skip_import=None if runs_on_host(install) else f"built for {install.key}, not this host",
+                    )
+                )
+        for text in render_table(reports):
+            self._io.write_line(text)
+        for report in reports:
+            if report.slowest_imports:
+                slowest = ", ".join(f"{name} ({time / 1000:.1f} ms)" for name, time in report.slowest_imports[:5])
+                self._io.write_line(f"{report.name} slowest imports: {slowest}")
+
+        report_file = Path(self.config("report-file") or self.root_dir / SAM_REPORT_FILE_NAME)
+        with self.abort_on_error("Writing the report failed", ReportError):
+            write_report(report_file, reports)
+        self._io.write_line(f"Report written to {report_file}")
+
+        failures = []
+        for report in reports:
+            if report.import_skipped:
+                self._io.write_line(f"{report.name}: import not measured, {report.import_skipped}")
+            if report.import_error:
+                self._io.write_error_line(f"{report.name}: import failed: {report.import_error}")
+            if max_size is not None and report.total_size > max_size * 1024 * 1024:
+                failures.append(f"{report.name} is {format_size(report.total_size)}, over {max_size:g} MB")
+            if max_import_time is not None and report.import_error:
+                failures.append(f"{report.name} could not be imported")
+            elif max_import_time is not None and (report.import_time_us or 0) / 1000 > max_import_time:
+                failures.append(
+                    f"{report.name} imports in {report.import_time_us / 1000:.1f} ms, over {max_import_time:g} ms"
+                )
+        if failures:
+            self.abort("Report thresholds exceeded: " + "; ".join(failures), error=ReportError)
+
+    def write_timings(self) -> None:
+        """
+        Print the --timings summary and write the --trace-file.
+        """
+        if self.config("timings"):
+            self._io.write_line("Timings:")
+            for text in self.timings.summary():
+                self._io.write_line(f"  {text}" if text else "")
+        trace_file = self.config("trace-file")
+        if trace_file:
+            self.timings.write_trace(Path(trace_file))
+            self._io.write_line(f"Trace written to {trace_file}")
+
+    def load_sam(self) -> Sam:
+        sam_options = {}
+        if self.parameter_overrides:
+            sam_options["parameter_overrides"] = self.parameter_overrides
+        try:
+            with self.timings.stage("template parse"):
+                sam = Sam(sam_exec="sam", template=self.root_dir / self.config("sam-template"), **sam_options)
+            sam.output = self.stream(None, Verbosity.VERBOSE)
+            sam.log_file = self.log_file("sam-build")
+            return sam
+        except AttributeError:
+            self.abort(
+                "Unsupported type for a 'CodeUri' or 'Handler'. Only string is supported. "
+                "!Ref, !Sub, !FindInMap and !Join are resolved against the template's Parameters and Mappings, "
+                "other functions and references to resources are not supported.",
+                error=TemplateError,
+            )
+            raise
+        except (yaml.YAMLError, OSError) as error:
+            self.abort(f"The template could not be read: {error}", error=TemplateError)
+            raise
+        except KeyError as error:
+            self.abort(f"The template is missing {error}", error=TemplateError)
+            raise
+
+    def build_standard(self, sam: Optional[Sam] = None) -> int:
+        try:
+            return self._build_standard(sam or self.load_sam())
+        finally:
+            self.write_timings()
+
+    def _build_standard(self, sam: Sam) -> int:
+        self.statuses, self.errors = {}, {}
+        if self.config("installer") == UV and shutil.which(UV) is None:
+            self._io.write_error_line("uv is not on PATH, installing with pip")
+        if self.config("logs"):
+            # the logs are of the last build only
+            shutil.rmtree(self.root_dir / SAM_LOGS_DIR_NAME, ignore_errors=True)
+        aws_lambdas = sam.lambdas
+        unchanged: List[AwsLambda] = []
+        manifest = None
+        if self.config("incremental"):
+            with self.timings.stage("fingerprint"):
+                manifest = BuildManifest.load(self.manifest_location)
+                fingerprints = self.fingerprints(sam)
+                template_hash = hash_tree(sam.template_path)
+            aws_lambdas = self.changed_lambdas(sam.lambdas, manifest, fingerprints)
+            unchanged = [aws_lambda for aws_lambda in sam.lambdas if aws_lambda not in aws_lambdas]
+            self.statuses.update({aws_lambda.name: UNCHANGED for aws_lambda in unchanged})
+            if not aws_lambdas and manifest.template == template_hash:
+                self._io.write_line("All lambda functions are up to date")
+                if self.config("zip"):
+                    self.package()
+                if self.config("report"):
+                    self.report(sam)
+                return 0
+
+        self._io.write_line("Building lambda functions ...")
+        build_dir = str(self.sam_build_location)
+        with self.preserve_builds(unchanged):
+            self.stage_code_and_prefetch(
+                sam, build_dir, sam.lambdas if self.config("as-layer") else aws_lambdas, unchanged
+            )
+
+        if self.config("link-dependencies"):
+            # the staging dir only lives for one build
+            shutil.rmtree(self.sam_staging_location, ignore_errors=True)
+
+        if self.config("as-layer"):
+            with self.abort_on_error("Installing the dependencies layer failed", DependencyError):
+                self.build_layer(sam)
+            self.statuses.update({aws_lambda.name: SUCCESS for aws_lambda in aws_lambdas})
+        else:
             # 'build_lambda' adds the third party packages
             # into the build directory using poetry to create
             # the requirements file
-            self.build_lambda(aws_lambda=aws_lambda)
-            self._io.write_line("success")
+            self.build_lambdas(aws_lambdas)
+
+        if manifest is not None:
+            manifest.template = template_hash
+            manifest.fingerprints = {aws_lambda.name: fingerprints[aws_lambda.name] for aws_lambda in sam.lambdas}
+            manifest.save()
+
+        if self.config("zip"):
+            self.package()
 
         self._io.write_line("Build successfull 🚀")
+        if self.config("report"):
+            self.report(sam)
+        return 0
+
+    @property
+    def watch_excludes(self) -> List[str]:
+        return DEFAULT_EXCLUDES + [
+            pattern for patterns in self.config("exclude") or [] for pattern in patterns.split(",")
+        ]
+
+    def watch_roots(self, sam: Sam) -> Dict[str, Path]:
+        roots = {
+            aws_lambda.name: sam.code_dir(aws_lambda)
+            for aws_lambda in sam.lambdas
+            if isinstance(aws_lambda.code_uri, str)
+        }
+        roots[WATCH_LOCK] = Path(self.poetry.locker.lock)
+        roots[WATCH_TEMPLATE] = sam.template_path
+        return roots
+
+    def rebuild(self, sam: Optional[Sam] = None) -> Optional[Sam]:
+        """
+        Run a full build, reporting a failure instead of exiting so that watching goes on.
+
+        Returns the parsed template, None when it could not be parsed.
+        """
+        try:
+            sam = sam or self.load_sam()
+            self.build_standard(sam)
+        except (SystemExit, BuildError):
+            self._io.write_error_line("Build failed, fix the error and save to rebuild")
+        # the events of a build are only kept until its --timings summary is printed
+        self.timings.clear()
+        return sam
+
+    def sync_code(self, sam: Sam, changes: Dict[str, Set[str]]) -> None:
+        """
+        Copy the changed files of each function's CodeUri into its build dir, leaving
+        its dependencies as they are.
+        """
+        for aws_lambda in sam.lambdas:
+            paths = changes.get(aws_lambda.name)
+            if not paths:
+                continue
+            copied, removed = sync_files(sam.code_dir(aws_lambda), self.sam_build_location / aws_lambda.name, paths)
+            self._io.write_line(f"{aws_lambda.name}: {copied} file(s) copied, {removed} removed")
+        if self.config("zip"):
+            self.package()
+
+    def changed_projects(self, sam: Sam, changes: Dict[str, Set[str]]) -> Set[Path]:
+        """
+        The dirs of the functions whose pyproject.toml or poetry.lock changed.
+        """
+        code_dirs = {
+            aws_lambda.name: sam.code_dir(aws_lambda)
+            for aws_lambda in sam.lambdas
+            if isinstance(aws_lambda.code_uri, str)
+        }
+        return {
+            Path(code_dirs[name]).resolve()
+            for name, paths in changes.items()
+            if name in code_dirs and paths.intersection(POETRY_PROJECT_FILES)
+        }
+
+    def watch(self) -> int:
+        """
+        Build, then rebuild on changes until interrupted. The parsed template and
+        the exported requirements stay in memory between rebuilds. A change to a
+        function's code is copied into its build dir, a change to poetry.lock or to a
+        function's own Poetry project reinstalls the dependencies and a change to the
+        template rebuilds everything.
+        """
+        sam = self.load_sam()
+        self.rebuild(sam)
+        watcher = PollingWatcher(self.watch_roots(sam), self.watch_excludes)
+        self._io.write_line("Watching for changes, press Ctrl+C to stop ...")
+        try:
+            while not self.stop_watching.is_set():
+                changes = watcher.wait(should_stop=self.stop_watching.is_set)
+                if not changes:
+                    continue
+                project_dirs = self.changed_projects(sam, changes)
+                if WATCH_TEMPLATE in changes:
+                    self._io.write_line("Template changed, rebuilding all functions ...")
+                    sam = self.rebuild() or sam
+                    watcher = PollingWatcher(self.watch_roots(sam), self.watch_excludes)
+                elif project_dirs:
+                    self._io.write_line("A function's Poetry project changed, reinstalling the dependencies ...")
+                    self.clear_projects()
+                    if WATCH_LOCK in changes or Path(self.root_dir).resolve() in project_dirs:
+                        # the function is the root project, as with the default CodeUri "."
+                        self.poetry = Factory().create_poetry(self.root_dir)
+                    sam = self.rebuild() or sam
+                    watcher = PollingWatcher(self.watch_roots(sam), self.watch_excludes)
+                elif WATCH_LOCK in changes:
+                    self._io.write_line("poetry.lock changed, reinstalling the dependencies ...")
+                    # the previous exports are for a lock that is gone
+                    self.clear_projects()
+                    self.poetry = Factory().create_poetry(self.root_dir)
+                    self.rebuild(sam)
+                else:
+                    self.sync_code(sam, changes)
+        except KeyboardInterrupt:
+            pass
+        self._io.write_line("Stopped watching")
         return 0
@@ -0,0 +1,154 @@
+import compileall
+import os
+import py_compile
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from poetry_aws_sam.imports import installed_distributions
+from poetry_aws_sam.platforms import InstallTarget
+
+SLIM_RULES = ("pycache", "tests", "stubs", "metadata", "docs", "strip", "precompile")
+DEFAULT_SLIM_RULES = ("pycache", "tests", "stubs", "metadata", "docs")
+
+# template Metadata of a function: `PoetrySam: {Slim: [rules]}`, or `Slim: false` to disable
+METADATA_KEY = "PoetrySam"
+METADATA_SLIM_KEY = "Slim"
+
+TEST_DIR_NAMES = {"tests"}
+DOC_DIR_NAMES = {"docs", "doc", "examples"}
+# dist-info files only used by installers, METADATA and entry_points.txt are read at runtime
+INSTALLER_METADATA_FILES = {"RECORD", "INSTALLER", "REQUESTED", "direct_url.json"}
+
+
+class SlimError(Exception):
+    pass
+
+
+@dataclass
+class SlimResult:
+    before: int
+    after: int = 0
+    messages: List[str] = field(default_factory=list)
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+
+def tree_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = Path(root) / name
+            if not file_path.is_symlink():
+                total += file_path.stat().st_size
+    return total
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def slim_rules(rules: Optional[Iterable[str]], metadata: Optional[Dict]) -> List[str]:
+    """
+    The rules for a function: those of its template Metadata when set, else `rules`.
+    """
+    configured = (metadata or {}).get(METADATA_KEY, {}).get(METADATA_SLIM_KEY)
+    if configured is False:
+        return []
+    if configured is True:
+        configured = DEFAULT_SLIM_RULES
+    selected = list(configured if configured is not None else rules or [])
+    unknown = sorted(set(selected) - set(SLIM_RULES))
+    if unknown:
+        raise SlimError(f"Unknown slim rule(s): {', '.join(unknown)}. Available: {', '.join(SLIM_RULES)}")
+    return selected
+
+
+def _remove_dirs(roots: Iterable[Path], names: set) -> None:
+    for root in roots:
+        for path in sorted(root.rglob("*"), reverse=True):
+            if path.is_dir() and not path.is_symlink() and path.name in names:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _strip(package_dirs: Iterable[Path]) -> Optional[str]:
+    strip = shutil.which("strip")
+    if strip is None:
+        return "skipped strip: no 'strip' on PATH"
+    for package_dir in package_dirs:
+        for library in package_dir.rglob("*.so*"):
+            if not library.is_file() or library.is_symlink():
+                continue
+            # strip a copy so that hard links to a staged install are not modified
+            with tempfile.NamedTemporaryFile(dir=library.parent, delete=False) as copy:
+                copy_path = Path(copy.name)
+            shutil.copy2(library, copy_path)
+            result = subprocess.run([strip, "--strip-debug", str(copy_path)], capture_output=True, check=False)
+            if result.returncode == 0:
+                copy_path.replace(library)
+            else:
+                copy_path.unlink()
+    return None
+
+
+def slim(target: Path, rules: List[str], install: InstallTarget) -> SlimResult:
+    """
+    Remove what the lambda runtime does not need from an installed function dir.
+
+    Only the installed packages are slimmed, except for `pycache` and `precompile`
+    which also apply to the function's own code.
+    """
+    result = SlimResult(before=tree_size(target))
+    distributions = installed_distributions(target)
+    package_dirs = [
+        target / name
+        for distribution in distributions.values()
+        for name in distribution.top_level
+        if (target / name).is_dir()
+    ]
+    dist_info_dirs = [distribution.dist_info for distribution in distributions.values()]
+
+    if "pycache" in rules:
+        _remove_dirs([target], {"__pycache__"})
+    if "tests" in rules:
+        _remove_dirs(package_dirs, TEST_DIR_NAMES)
+    if "docs" in rules:
+        _remove_dirs(package_dirs, DOC_DIR_NAMES)
+    if "stubs" in rules:
+        for package_dir in package_dirs:
+            for stub in package_dir.rglob("*.pyi"):
+                stub.unlink()
+    if "metadata" in rules:
+        for dist_info in dist_info_dirs:
+            for name in INSTALLER_METADATA_FILES:
+                (dist_info / name).unlink(missing_ok=True)
+    if "strip" in rules:
+        message = _strip(package_dirs)
+        if message:
+            result.messages.append(message)
+    if "precompile" in rules:
+        host_version = f"{sys.version_info.major}{sys.version_info.minor}"
+        if host_version != install.python_version:
+            result.messages.append(
+                f"skipped precompile: python {host_version} cannot compile for cp{install.python_version}"
+            )
+        else:
+            # hash based pycs stay valid whatever the file times are once zipped
+            compileall.compile_dir(
+                str(target),
+                quiet=2,
+                invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+            )
+
+    result.after = tree_size(target)
+    return result
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from packaging.requirements import InvalidRequirement, Requirement
+
+from poetry_aws_sam.manifest import IGNORED_DIRS, hash_tree
+from poetry_aws_sam.process import run_process
+from poetry_aws_sam.tree_cache import file_lock
+from poetry_aws_sam.wheelhouse import requirement_lines
+
+SOURCE_WHEELS_DIR_NAME = "aws-sam/source-wheels"
+# bumped when the way a wheel is built changes
+SOURCE_WHEELS_VERSION = 1
+GIT = "git"
+PATH = "path"
+COMMIT_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+# build outputs written into a local source tree, which do not change what is built
+BUILD_OUTPUT_DIRS = {"build", "dist", "*.egg-info"}
+
+
+class SourceWheelError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Source:
+    """
+    A git or local path dependency of the exported requirements.
+    """
+
+    requirement: Requirement
+    kind: str
+    key: str
+
+    @property
+    def name(self) -> str:
+        extras = f"[{','.join(sorted(self.requirement.extras))}]" if self.requirement.extras else ""
+        return f"{self.requirement.name}{extras}"
+
+
+def default_source_wheels_dir(poetry) -> Path:
+    return Path(poetry.config.get("cache-dir")) / SOURCE_WHEELS_DIR_NAME
+
+
+def _key(**values) -> str:
+    payload = json.dumps({"version": SOURCE_WHEELS_VERSION, **values}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _git_key(url: str) -> Optional[str]:
+    """
+    Key of a `git+` url pinned to a commit, None when it points at a branch or tag.
+    """
+    parsed = urlsplit(url[len("git+") :])
+    repository, _, revision = parsed.path.rpartition("@")
+    if not repository or not COMMIT_PATTERN.match(revision):
+        return None
+    # the url holds the commit and the subdirectory
+    return _key(kind=GIT, url=url)
+
+
+def _path_key(url: str) -> Optional[str]:
+    """
+    Key of a `file:` url from the content of the local source tree or sdist,
+    None for a wheel, which is installed as it is.
+    """
+    parsed = urlsplit(url)
+    path = Path(unquote(parsed.path))
+    if parsed.netloc not in ("", "localhost") or path.suffix == ".whl" or not path.exists():
+        return None
+    if path.is_dir():
+        content = hash_tree(path, ignored_dirs=IGNORED_DIRS | BUILD_OUTPUT_DIRS)
+    else:
+        content = hashlib.sha256(path.read_bytes()).hexdigest()
+    return _key(kind=PATH, path=str(path), content=content)
+
+
+def source_of(line: str) -> Optional[Source]:
+    """
+    The git or path dependency of a requirements line, None for any other line.
+    """
+    if line.startswith("-e "):
+        # a wheel of the project is installed into the function instead
+        line = line[len("-e ") :]
+    try:
+        requirement = Requirement(line.split(" --hash")[0])
+    except InvalidRequirement:
+        return None
+    url = requirement.url or ""
+    if url.startswith("git+"):
+        kind, key = GIT, _git_key(url)
+    elif url.startswith("file:"):
+        kind, key = PATH, _path_key(url)
+    else:
+        return None
+    if key is None:
+        return None
+    return Source(requirement=requirement, kind=kind, key=key)
+
+
+class SourceWheels:
+    """
+    Wheels built from the git dependencies, once per commit, and from the local path
+    dependencies, once per content of their source tree. They are kept under `root`
+    and shared by the functions and the later builds.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def wheel(self, source: Source) -> Tuple[Path, bool]:
+        """
+        The wheel of `source`, built with `pip wheel` when it is not in the cache.
+
+        Returns the wheel and whether it was built.
+        """
+        wheel_dir = self.root / source.key
+        with file_lock(self.root / "locks" / f"{source.key}.lock"):
+            wheels = sorted(wheel_dir.glob("*.whl"))
+            if wheels:
+                return wheels[0], False
+            partial = self.root / "partial" / f"{source.key}-{os.getpid()}-{threading.get_ident()}"
+            shutil.rmtree(partial, ignore_errors=True)
+            partial.mkdir(parents=True)
+            try:
+                requirement = f"{source.name} @ {source.requirement.url}"
+                result = run_process(
+                    [
+                        sys.executable,
+                        "-m",
+                        "pip",
+                        "wheel",
+                        "--no-deps",
+                        "--disable-pip-version-check",
+                        "--wheel-dir",
+                        str(partial),
+                        requirement,
+                    ],
+                    check=False,
+                )
+                wheels = sorted(partial.glob("*.whl"))
+                if result.returncode != 0 or len(wheels) != 1:
+                    raise SourceWheelError(f"Building a wheel of {requirement} failed:\n{result.output}")
+                partial.rename(wheel_dir)
+            finally:
+                shutil.rmtree(partial, ignore_errors=True)
+        return wheel_dir / wheels[0].name, True
+
+    def rewrite(self, requirements_text: str) -> Tuple[str, List[str]]:
+        """
+        Replace the git and path dependencies of the requirements with their wheels.
+
+        Returns the new requirements and the names of the wheels that were built.
+        """
+        lines = requirement_lines(requirements_text)
+        with_hashes = any(" --hash" in line for line in lines)
+        rewritten, built = [], []
+        sources = [source_of(line) for line in lines]
+        if not any(sources):
+            return requirements_text, built
+        for line, source in zip(lines, sources):
+            if source is None:
+                rewritten.append(line)
+                continue
+            wheel, was_built = self.wheel(source)
+            if was_built:
+                built.append(wheel.name)
+            line = f"{source.name} @ {wheel.as_uri()}"
+            if source.requirement.marker is not None:
+                line += f" ; {source.requirement.marker}"
+            if with_hashes:
+                line += f" --hash=sha256:{hashlib.sha256(wheel.read_bytes()).hexdigest()}"
+            rewritten.append(line)
+        return "\n".join(rewritten) + "\n", built
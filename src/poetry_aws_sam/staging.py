@@ -0,0 +1,179 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from poetry_aws_sam.template import IntrinsicResolver, read_template, write_template
+
+# never copied into a function's build dir
+DEFAULT_EXCLUDES = ["__pycache__", "*.pyc", ".aws-sam", ".git", ".venv", ".pytest_cache"]
+
+# properties holding a local path that has to be relative to the built template
+PATH_PROPERTIES = {
+    "AWS::Serverless::Api": "DefinitionUri",
+    "AWS::Serverless::HttpApi": "DefinitionUri",
+    "AWS::Serverless::StateMachine": "DefinitionUri",
+    "AWS::Serverless::LayerVersion": "ContentUri",
+    "AWS::Serverless::Application": "Location",
+}
+
+# the other properties holding a local path that 'sam build' rewrites, looked up at any depth
+# of the resource's properties: native staging falls back to 'sam build' when one is local
+OTHER_PATH_PROPERTIES = {
+    "AWS::Serverless::GraphQLApi": {"SchemaUri", "CodeUri"},
+    "AWS::AppSync::GraphQLSchema": {"DefinitionS3Location"},
+    "AWS::AppSync::Resolver": {
+        "RequestMappingTemplateS3Location",
+        "ResponseMappingTemplateS3Location",
+        "CodeS3Location",
+    },
+    "AWS::AppSync::FunctionConfiguration": {
+        "RequestMappingTemplateS3Location",
+        "ResponseMappingTemplateS3Location",
+        "CodeS3Location",
+    },
+    "AWS::Lambda::LayerVersion": {"Content"},
+    "AWS::ApiGateway::RestApi": {"BodyS3Location"},
+    "AWS::ApiGatewayV2::Api": {"BodyS3Location"},
+    "AWS::StepFunctions::StateMachine": {"DefinitionS3Location"},
+    "AWS::ElasticBeanstalk::ApplicationVersion": {"SourceBundle"},
+    "AWS::CloudFormation::Stack": {"TemplateURL"},
+    "AWS::CloudFormation::ModuleVersion": {"ModulePackage"},
+    "AWS::CloudFormation::ResourceVersion": {"SchemaHandlerPackage"},
+    "AWS::Glue::Job": {"ScriptLocation"},
+}
+
+
+def _is_local_path(value: Any) -> bool:
+    # relative to the template, as the urls, the S3 objects and the absolute paths are left as they are
+    return isinstance(value, str) and bool(value) and "://" not in value and not os.path.isabs(value)
+
+
+def _local_paths(value: Any, names: Set[str]) -> List[str]:
+    """
+    The local paths held by the `names` properties anywhere in `value`.
+    """
+    paths = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in names and _is_local_path(item):
+                paths.append(item)
+            else:
+                paths.extend(_local_paths(item, names))
+    elif isinstance(value, list):
+        for item in value:
+            paths.extend(_local_paths(item, names))
+    return paths
+
+
+def _includes(value: Any) -> List[str]:
+    """
+    The local locations of the `AWS::Include` transforms anywhere in `value`.
+    """
+    locations = []
+    if isinstance(value, dict):
+        transform = value.get("Fn::Transform")
+        if isinstance(transform, dict) and transform.get("Name") == "AWS::Include":
+            location = (transform.get("Parameters") or {}).get("Location")
+            if _is_local_path(location):
+                locations.append(location)
+        for item in value.values():
+            locations.extend(_includes(item))
+    elif isinstance(value, list):
+        for item in value:
+            locations.extend(_includes(item))
+    return locations
+
+
+class NativeStaging:
+    """
+    Copies the code of the python functions of a template into the build dir
+    and writes the built template, as `sam build` does for functions without
+    a requirements file.
+    """
+
+    def __init__(
+        self,
+        template_path: Path,
+        build_dir: Path,
+        excludes: List[str],
+        parameter_overrides: Optional[Dict[str, str]] = None,
+    ):
+        self.template_path = template_path
+        self.template = read_template(template_path)
+        self.resolver = IntrinsicResolver(self.template, parameter_overrides)
+        self.build_dir = build_dir
+        self.excludes = DEFAULT_EXCLUDES + excludes
+
+    @property
+    def functions(self) -> Dict[str, Dict]:
+        globals_function = self.template.get("Globals", {}).get("Function", {})
+        return {
+            name: self.resolver.resolve({**globals_function, **resource.get("Properties", {})})
+            for name, resource in self.template.get("Resources", {}).items()
+            if resource.get("Type") == "AWS::Serverless::Function"
+        }
+
+    def unsupported(self) -> List[str]:
+        """
+        The reasons why the template needs `sam build`, empty when it can be staged natively.
+        """
+        reasons = []
+        for name, properties in self.functions.items():
+            if properties.get("PackageType", "Zip") != "Zip":
+                reasons.append(f"{name} is an image function")
+            elif not str(properties.get("Runtime", "")).lower().startswith("python"):
+                reasons.append(f"{name} is not a python function")
+            elif not isinstance(properties.get("CodeUri", "."), str):
+                reasons.append(f"{name} has a CodeUri that is not a local path")
+        for name, resource in self.template.get("Resources", {}).items():
+            if resource.get("Metadata", {}).get("BuildMethod"):
+                reasons.append(f"{name} has a BuildMethod")
+            elif resource.get("Type") == "AWS::Lambda::Function":
+                reasons.append(f"{name} is an AWS::Lambda::Function")
+            elif resource.get("Type") in OTHER_PATH_PROPERTIES:
+                properties = self.resolver.resolve(resource.get("Properties") or {})
+                for path in _local_paths(properties, OTHER_PATH_PROPERTIES[resource["Type"]]):
+                    reasons.append(f"{name} has the local path {path}")
+        for location in _includes(self.template):
+            reasons.append(f"AWS::Include of the local file {location}")
+        return reasons
+
+    def _relative_to_build(self, uri: str) -> str:
+        path = self.template_path.parent / uri
+        if "://" in uri or not path.exists():
+            return uri
+        return os.path.relpath(path.resolve(), self.build_dir.resolve())
+
+    def _copy_function(self, name: str, code_uri: str) -> None:
+        source = self.template_path.parent / code_uri
+        target = self.build_dir / name
+        shutil.copytree(source, target, ignore=shutil.ignore_patterns(*self.excludes), dirs_exist_ok=True)
+
+    def stage(self, jobs: int = 1, skip: Optional[Set[str]] = None) -> None:
+        """
+        Copy the code of the functions, except the `skip` ones whose build dirs are
+        left as they are, and write the built template of all of them.
+        """
+        functions = self.functions
+        copied = [name for name in functions if name not in (skip or set())]
+        for name in copied:
+            shutil.rmtree(self.build_dir / name, ignore_errors=True)
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            copies = [
+                executor.submit(self._copy_function, name, functions[name].get("CodeUri", ".")) for name in copied
+            ]
+            for copy in copies:
+                copy.result()
+
+        resources = self.template.get("Resources", {})
+        for name in functions:
+            resources[name].setdefault("Properties", {})["CodeUri"] = name
+        for resource in resources.values():
+            path_property = PATH_PROPERTIES.get(resource.get("Type"))
+            properties = resource.get("Properties", {})
+            if path_property and isinstance(properties.get(path_property), str):
+                properties[path_property] = self._relative_to_build(properties[path_property])
+        write_template(self.build_dir / "template.yaml", self.template)
@@ -0,0 +1,160 @@
+import copy
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import yaml
+
+# libyaml is much faster on large templates, fall back to the pure python classes without it
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover - depends on how pyyaml was built
+    from yaml import SafeDumper, SafeLoader  # type: ignore[assignment]
+
+# the intrinsic functions whose long form has no "Fn::" prefix
+BARE_INTRINSICS = {"Ref", "Condition"}
+
+SUB_VARIABLE_PATTERN = re.compile(r"\$\{([^}]+)\}")
+
+PSEUDO_PARAMETERS = {
+    "AWS::Partition": "aws",
+    "AWS::URLSuffix": "amazonaws.com",
+}
+
+_cache: Dict[Path, Tuple[Tuple[int, int], Dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def _intrinsic_constructor(loader: yaml.SafeLoader, tag_suffix: str, node: yaml.Node) -> Dict:
+    """
+    Read a short form intrinsic function (`!Ref x`) as its long form (`{"Ref": x}`).
+    """
+    name = tag_suffix if tag_suffix in BARE_INTRINSICS else f"Fn::{tag_suffix}"
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+        if tag_suffix == "GetAtt":
+            value = value.split(".", 1)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    return {name: value}
+
+
+class CfnLoader(SafeLoader):
+    pass
+
+
+# registered on a subclass so that yaml.SafeLoader itself is left untouched
+CfnLoader.add_multi_constructor("!", _intrinsic_constructor)
+
+
+def read_template(path: Path) -> Dict:
+    """
+    Parse a template, reusing the previous parse while the file's mtime and size are unchanged.
+
+    A copy is returned so that callers can edit it.
+    """
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = path.resolve()
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is None or cached[0] != signature:
+        template = yaml.load(path.read_text(encoding="utf-8"), Loader=CfnLoader)
+        cached = (signature, template)
+        with _cache_lock:
+            _cache[key] = cached
+    return copy.deepcopy(cached[1])
+
+
+def clear_template_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def write_template(path: Path, template: Dict) -> None:
+    path.write_text(yaml.dump(template, Dumper=SafeDumper, sort_keys=False), encoding="utf-8")
+
+
+class IntrinsicResolver:
+    """
+    Resolves `Ref`, `Fn::Sub`, `Fn::FindInMap` and `Fn::Join` against the template's
+    Parameters (their Default or an override) and Mappings.
+
+    Values that cannot be resolved locally are returned unchanged.
+    """
+
+    def __init__(self, template: Dict, parameter_overrides: Optional[Dict[str, str]] = None):
+        self.parameters: Dict[str, Any] = dict(PSEUDO_PARAMETERS)
+        region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+        if region:
+            self.parameters["AWS::Region"] = region
+        for name, parameter in (template.get("Parameters") or {}).items():
+            if isinstance(parameter, dict) and "Default" in parameter:
+                self.parameters[name] = str(parameter["Default"])
+        self.parameters.update(parameter_overrides or {})
+        self.mappings: Dict = template.get("Mappings") or {}
+
+    def _sub(self, argument: Any) -> Any:
+        if isinstance(argument, list) and len(argument) == 2:
+            text, variables = argument[0], self.resolve(argument[1])
+        else:
+            text, variables = argument, {}
+        if not isinstance(text, str) or not isinstance(variables, dict):
+            return None
+
+        unresolved = False
+
+        def replace(match: re.Match) -> str:
+            nonlocal unresolved
+            name = match.group(1)
+            if name.startswith("!"):
+                return "${" + name[1:] + "}"
+            value = variables.get(name, self.parameters.get(name))
+            if not isinstance(value, str):
+                unresolved = True
+                return match.group(0)
+            return value
+
+        result = SUB_VARIABLE_PATTERN.sub(replace, text)
+        return None if unresolved else result
+
+    def _find_in_map(self, argument: Any) -> Any:
+        if not isinstance(argument, list) or len(argument) != 3:
+            return None
+        map_name, top_key, second_key = (self.resolve(item) for item in argument)
+        try:
+            return self.mappings[map_name][top_key][second_key]
+        except (KeyError, TypeError):
+            return None
+
+    def _join(self, argument: Any) -> Any:
+        if not isinstance(argument, list) or len(argument) != 2:
+            return None
+        delimiter, items = self.resolve(argument[0]), self.resolve(argument[1])
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            return None
+        return delimiter.join(items)
+
+    def resolve(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if len(value) == 1:
+            function, argument = next(iter(value.items()))
+            resolved = None
+            if function == "Ref" and isinstance(argument, str):
+                resolved = self.parameters.get(argument)
+            elif function == "Fn::Sub":
+                resolved = self._sub(argument)
+            elif function == "Fn::FindInMap":
+                resolved = self._find_in_map(argument)
+            elif function == "Fn::Join":
+                resolved = self._join(argument)
+            return value if resolved is None else resolved
+        return {key: self.resolve(item) for key, item in value.items()}
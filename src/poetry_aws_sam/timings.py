@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+@dataclass
+class TimingEvent:
+    """
+    A timed stage of the build. `start` is in seconds since the recorder was created
+    and `cpu` is the CPU time of the calling thread, so a subprocess stage's CPU time
+    is only the time spent waiting on it.
+    """
+
+    stage: str
+    function: Optional[str]
+    start: float
+    wall: float
+    cpu: float
+    thread: int
+    subprocess: bool = False
+
+
+TimingHook = Callable[[TimingEvent], None]
+
+
+class Timings:
+    """
+    Records the wall and CPU time of the build stages, per function.
+
+    Every recorded event is passed to the hooks, which lets a programmatic
+    caller receive them as the build goes.
+    """
+
+    def __init__(self, hooks: Optional[List[TimingHook]] = None):
+        self.events: List[TimingEvent] = []
+        self.hooks: List[TimingHook] = list(hooks or [])
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_hook(self, hook: TimingHook) -> None:
+        self.hooks.append(hook)
+
+    @property
+    def current_function(self) -> Optional[str]:
+        """
+        The function the stages timed by this thread are attributed to.
+        """
+        return getattr(self._local, "function", None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events.clear()
+
+    @contextmanager
+    def function(self, name: str) -> Iterator[None]:
+        """
+        Attribute the stages timed by this thread to the function `name`.
+        """
+        previous = getattr(self._local, "function", None)
+        self._local.function = name
+        try:
+            yield
+        finally:
+            self._local.function = previous
+
+    @contextmanager
+    def stage(self, name: str, subprocess: bool = False) -> Iterator[None]:
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            event = TimingEvent(
+                stage=name,
+                function=self.current_function,
+                start=start - self._origin,
+                wall=time.perf_counter() - start,
+                cpu=time.thread_time() - cpu_start,
+                thread=threading.get_ident(),
+                subprocess=subprocess,
+            )
+            with self._lock:
+                self.events.append(event)
+            for hook in self.hooks:
+                hook(event)
+
+    def summary(self) -> List[str]:
+        """
+        A table of the stages with their total wall and CPU time and the slowest function,
+        followed by the time each function spent in its stages and subprocesses.
+        """
+        stages: Dict[str, List[TimingEvent]] = defaultdict(list)
+        for event in self.events:
+            stages[event.stage].append(event)
+        rows = [("Stage", "Calls", "Wall", "CPU", "Slowest")]
+        for stage, events in stages.items():
+            slowest = max(events, key=lambda event: event.wall)
+            rows.append(
+                (
+                    stage,
+                    str(len(events)),
+                    f"{sum(event.wall for event in events):.3f}s",
+                    f"{sum(event.cpu for event in events):.3f}s",
+                    f"{slowest.function} ({slowest.wall:.3f}s)" if slowest.function else "",
+                )
+            )
+        lines = _table(rows)
+
+        functions: Dict[str, List[TimingEvent]] = defaultdict(list)
+        for event in self.events:
+            if event.function:
+                functions[event.function].append(event)
+        if functions:
+            rows = [("Function", "Stages", "Subprocesses")]
+            for function, events in functions.items():
+                rows.append(
+                    (
+                        function,
+                        f"{sum(event.wall for event in events if not event.subprocess):.3f}s",
+                        f"{sum(event.wall for event in events if event.subprocess):.3f}s",
+                    )
+                )
+            lines += [""] + _table(rows)
+        return lines
+
+    def trace(self) -> Dict:
+        """
+        The events in the Chrome trace event format, as read by Perfetto and chrome://tracing.
+        """
+        pid = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": event.stage,
+                    "cat": "subprocess" if event.subprocess else "stage",
+                    "ph": "X",
+                    "ts": round(event.start * 1_000_000),
+                    "dur": round(event.wall * 1_000_000),
+                    "pid": pid,
+                    "tid": event.thread,
+                    "args": {"function": event.function, "cpu_ms": round(event.cpu * 1000, 3)},
+                }
+                for event in self.events
+            ],
+        }
+
+    def write_trace(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.trace()), encoding="utf-8")
+
+
+def _table(rows: List[tuple]) -> List[str]:
+    widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+    return ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
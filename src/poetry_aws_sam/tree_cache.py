@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+from poetry_aws_sam.link import link_tree
+from poetry_aws_sam.platforms import InstallTarget
+from poetry_aws_sam.slim import tree_size
+
+TREE_CACHE_DIR_NAME = "aws-sam/trees"
+DEFAULT_TREE_CACHE_SIZE_MB = 2048
+# bumped when the layout of the cache or the pip install of a tree changes
+TREE_CACHE_VERSION = 1
+# partial installs left behind by a killed build are removed after this many seconds
+STALE_PARTIAL_SECONDS = 24 * 60 * 60
+
+
+def default_tree_cache_dir(poetry) -> Path:
+    return Path(poetry.config.get("cache-dir")) / TREE_CACHE_DIR_NAME
+
+
+def tree_key(requirements_text: str, install: InstallTarget, installer: str) -> str:
+    """
+    Key of the installed tree of exported requirements for an install target,
+    by the installer that lays it out.
+    """
+    payload = json.dumps(
+        {
+            "version": TREE_CACHE_VERSION,
+            "target": install.key,
+            "installer": installer,
+            "requirements": requirements_text,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False) -> Iterator[None]:
+    """
+    Hold an flock on `path`, shared or exclusive, across processes and threads.
+    Without fcntl (windows) only the threads of this process are excluded.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    with open(path, "a") as lock_file:
+        if fcntl is None:
+            with _fallback_lock(path):
+                yield
+            return
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+_fallback_locks = {}
+_fallback_guard = threading.Lock()
+
+
+def _fallback_lock(path: Path) -> threading.RLock:
+    with _fallback_guard:
+        return _fallback_locks.setdefault(path, threading.RLock())
+
+
+@dataclass
+class TreeEntry:
+    key: str
+    path: Path
+    size: int
+    last_used: float
+
+
+class TreeCache:
+    """
+    Persistent cache of installed dependency trees, keyed by `tree_key`, holding at
+    most `max_size` bytes. The least recently used trees are evicted first.
+
+    Trees are linked into the build dirs with `link_tree`, so a hit costs links
+    instead of a pip install. Readers hold a shared lock on the cache while linking
+    and writers an exclusive one, and each key has its own lock held during its install,
+    so parallel builds on one machine install a tree once and never see a partial one.
+    """
+
+    def __init__(self, root: Path, max_size: int = DEFAULT_TREE_CACHE_SIZE_MB * 1024 * 1024):
+        self.root = root
+        self.max_size = max_size
+
+    @property
+    def trees_dir(self) -> Path:
+        return self.root / "trees"
+
+    @property
+    def partial_dir(self) -> Path:
+        return self.root / "partial"
+
+    def _lock(self, shared: bool = False):
+        return file_lock(self.root / ".lock", shared=shared)
+
+    def _key_lock(self, key: str):
+        return file_lock(self.root / "locks" / f"{key}.lock")
+
+    def _metadata(self, key: str) -> Path:
+        return self.trees_dir / f"{key}.json"
+
+    def _complete(self, key: str) -> bool:
+        # the metadata is written once the tree is in place and removed before it
+        return self._metadata(key).is_file() and (self.trees_dir / key).is_dir()
+
+    def entries(self) -> List[TreeEntry]:
+        """
+        The complete trees of the cache, least recently used first.
+        """
+        entries = []
+        for metadata in self.trees_dir.glob("*.json"):
+            tree = metadata.with_suffix("")
+            if not tree.is_dir():
+                continue
+            try:
+                size = json.loads(metadata.read_text(encoding="utf-8"))["size"]
+                last_used = metadata.stat().st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append(TreeEntry(key=tree.name, path=tree, size=size, last_used=last_used))
+        return sorted(entries, key=lambda entry: (entry.last_used, entry.key))
+
+    def materialize(self, key: str, target: Path) -> bool:
+        """
+        Link the cached tree `key` into `target`. Returns False when it is not cached.
+        """
+        tree = self.trees_dir / key
+        with self._lock(shared=True):
+            if not self._complete(key):
+                return False
+            try:
+                os.utime(self._metadata(key))
+            except OSError:
+                pass
+            link_tree(tree, target)
+        return True
+
+    def install(self, key: str, target: Path, install: Callable[[Path], None]) -> bool:
+        """
+        Link the cached tree `key` into `target`, first installing it with `install`
+        into a new dir and adding it to the cache when it is missing.
+
+        Returns True when the tree was already cached.
+        """
+        with self._key_lock(key):
+            if self.materialize(key, target):
+                return True
+            self.partial_dir.mkdir(parents=True, exist_ok=True)
+            partial = self.partial_dir / f"{key}-{os.getpid()}-{threading.get_ident()}"
+            shutil.rmtree(partial, ignore_errors=True)
+            try:
+                install(partial)
+                partial.mkdir(parents=True, exist_ok=True)
+                link_tree(partial, target)
+                self._add(key, partial)
+            finally:
+                shutil.rmtree(partial, ignore_errors=True)
+        return False
+
+    def _add(self, key: str, partial: Path) -> None:
+        size = tree_size(partial)
+        with self._lock():
+            if not self._complete(key):
+                tree = self.trees_dir / key
+                # left behind by a build killed while adding or removing it
+                shutil.rmtree(tree, ignore_errors=True)
+                self.trees_dir.mkdir(parents=True, exist_ok=True)
+                partial.rename(tree)
+                self._metadata(key).write_text(json.dumps({"size": size}), encoding="utf-8")
+            self._evict(keep=key)
+            self._remove_stale_partials()
+
+    def _evict(self, keep: Optional[str] = None) -> List[TreeEntry]:
+        entries = self.entries()
+        total = sum(entry.size for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            if entry.key == keep:
+                continue
+            self._remove(entry)
+            total -= entry.size
+            evicted.append(entry)
+        return evicted
+
+    def _remove(self, entry: TreeEntry) -> None:
+        self._metadata(entry.key).unlink(missing_ok=True)
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _remove_stale_partials(self) -> None:
+        now = time.time()
+        for partial in self.partial_dir.glob("*"):
+            try:
+                if now - partial.stat().st_mtime > STALE_PARTIAL_SECONDS:
+                    shutil.rmtree(partial, ignore_errors=True)
+            except OSError:
+                continue
+
+    def clear(self) -> List[TreeEntry]:
+        """
+        Remove every tree of the cache. Returns the trees removed.
+        """
+        with self._lock():
+            entries = self.entries()
+            for entry in entries:
+                self._remove(entry)
+            # the key locks and the recent partial installs stay, as a running build may use them
+            self._remove_stale_partials()
+        return entries
@@ -0,0 +1,124 @@
+import fnmatch
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+
+WATCH_INTERVAL = 0.5
+# quiet time after the last change before rebuilding, so that a save of
+# several files or a `poetry lock` gives one rebuild
+WATCH_DEBOUNCE = 0.3
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def _excluded(name: str, excludes: List[str]) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in excludes)
+
+
+def snapshot(root: Path, excludes: List[str]) -> Snapshot:
+    """
+    Modification time and size of each file under `root`, by relative path.
+    A file root gives a single "." entry.
+    """
+    try:
+        if root.is_file():
+            stat = root.stat()
+            return {".": (stat.st_mtime_ns, stat.st_size)}
+    except OSError:
+        return {}
+    files = {}
+    for current, dirs, names in os.walk(root):
+        dirs[:] = [name for name in dirs if not _excluded(name, excludes)]
+        for name in names:
+            if _excluded(name, excludes):
+                continue
+            path = Path(current) / name
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files[path.relative_to(root).as_posix()] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def changed_paths(previous: Snapshot, current: Snapshot) -> Set[str]:
+    return {path for path in previous.keys() | current.keys() if previous.get(path) != current.get(path)}
+
+
+class PollingWatcher:
+    """
+    Polls the files under named roots for changes.
+
+    Only the latest snapshot of each root is kept and changes are merged
+    per path, so memory does not grow with the length of the session.
+    """
+
+    def __init__(
+        self,
+        roots: Dict[str, Path],
+        excludes: List[str],
+        interval: float = WATCH_INTERVAL,
+        debounce: float = WATCH_DEBOUNCE,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.roots = roots
+        self.excludes = excludes
+        self.interval = interval
+        self.debounce = debounce
+        self._clock = clock
+        self._sleep = sleep
+        self._snapshots = {name: snapshot(root, excludes) for name, root in roots.items()}
+
+    def poll(self) -> Dict[str, Set[str]]:
+        """
+        The changed paths of each root since the last poll.
+        """
+        changes = {}
+        for name, root in self.roots.items():
+            current = snapshot(root, self.excludes)
+            paths = changed_paths(self._snapshots[name], current)
+            self._snapshots[name] = current
+            if paths:
+                changes[name] = paths
+        return changes
+
+    def wait(self, should_stop: Callable[[], bool] = lambda: False) -> Dict[str, Set[str]]:
+        """
+        Block until files changed and then stayed unchanged for the debounce time.
+
+        Returns the changed paths of each root, empty when stopped.
+        """
+        changes: Dict[str, Set[str]] = {}
+        last_change = 0.0
+        while not should_stop():
+            polled = self.poll()
+            if polled:
+                for name, paths in polled.items():
+                    changes.setdefault(name, set()).update(paths)
+                last_change = self._clock()
+            elif changes and self._clock() - last_change >= self.debounce:
+                return changes
+            self._sleep(self.interval)
+        return {}
+
+
+def sync_files(source: Path, target: Path, paths: Set[str]) -> Tuple[int, int]:
+    """
+    Copy the changed `paths` of `source` into `target` and remove the ones that were deleted.
+
+    Returns the number of files copied and removed.
+    """
+    copied = removed = 0
+    for path in sorted(paths):
+        source_file, target_file = source / path, target / path
+        if source_file.is_file():
+            target_file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source_file, target_file)
+            copied += 1
+        elif target_file.is_file():
+            target_file.unlink()
+            removed += 1
+    return copied, removed
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from packaging.markers import Marker
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import InvalidWheelFilename, NormalizedName, canonicalize_name, parse_wheel_filename
+from packaging.version import InvalidVersion, Version
+
+from poetry_aws_sam.platforms import InstallTarget, target_environment
+
+WHEELHOUSE_DIR_NAME = "aws-sam/wheelhouse"
+
+
+class WheelhouseError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Pin:
+    name: NormalizedName
+    version: str
+    line: str
+    marker: Optional[Marker] = None
+
+
+def default_wheelhouse_dir(poetry) -> Path:
+    return Path(poetry.config.get("cache-dir")) / WHEELHOUSE_DIR_NAME
+
+
+def requirement_lines(requirements_text: str) -> List[str]:
+    """
+    Join the backslash continuations of a requirements file into single lines.
+    """
+    lines: List[str] = []
+    current = ""
+    for raw_line in requirements_text.splitlines():
+        line = raw_line.rstrip()
+        if line.endswith("\\"):
+            current += line[:-1].strip() + " "
+            continue
+        current += line.strip()
+        if current and not current.startswith("#"):
+            lines.append(current)
+        current = ""
+    if current.strip():
+        lines.append(current.strip())
+    return lines
+
+
+def parse_pins(requirements_text: str) -> Tuple[List[Pin], List[str]]:
+    """
+    Split the requirements into `name==version` pins and the lines that are not pins
+    (options, urls, unpinned requirements).
+    """
+    pins: List[Pin] = []
+    others: List[str] = []
+    for line in requirement_lines(requirements_text):
+        if line.startswith("-"):
+            others.append(line)
+            continue
+        requirement_part = line.split(" --hash")[0]
+        try:
+            requirement = Requirement(requirement_part)
+        except InvalidRequirement:
+            others.append(line)
+            continue
+        specifiers = list(requirement.specifier)
+        if requirement.url or len(specifiers) != 1 or specifiers[0].operator != "==":
+            others.append(line)
+            continue
+        pins.append(
+            Pin(
+                name=canonicalize_name(requirement.name),
+                version=specifiers[0].version,
+                line=line,
+                marker=requirement.marker,
+            )
+        )
+    return pins, others
+
+
+def pins_for(pins: List[Pin], target: InstallTarget) -> List[Pin]:
+    """
+    The pins whose markers hold on the lambda's platform and python version.
+    """
+    environment = target_environment(target)
+    return [pin for pin in pins if pin.marker is None or pin.marker.evaluate(environment)]
+
+
+def _wheel_key(wheel: Path) -> Optional[Tuple[NormalizedName, Version]]:
+    try:
+        name, version, _, _ = parse_wheel_filename(wheel.name)
+    except (InvalidWheelFilename, InvalidVersion):
+        return None
+    return name, version
+
+
+def _pin_key(pin: Pin) -> Optional[Tuple[NormalizedName, Version]]:
+    try:
+        return pin.name, Version(pin.version)
+    except InvalidVersion:
+        return None
+
+
+class Wheelhouse:
+    """
+    Persistent directory of downloaded wheels, one sub directory per
+    platform tag and python version.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def tag_dir(self, target: InstallTarget) -> Path:
+        return self.root / f"{target.platforms[0]}-cp{target.python_version}"
+
+    def wheels(self) -> Iterable[Path]:
+        return self.root.glob("*/*.whl")
+
+    def missing(self, pins: List[Pin], target: InstallTarget) -> List[Pin]:
+        """
+        The pins installed on `target` without a wheel in its dir. The pins its markers
+        exclude are never downloaded, so they are not missing.
+        """
+        tag_dir = self.tag_dir(target)
+        available = {_wheel_key(wheel) for wheel in tag_dir.glob("*.whl")}
+        return [pin for pin in pins_for(pins, target) if _pin_key(pin) not in available]
+
+    def download_args(self, requirements_file: Path, target: InstallTarget) -> List[str]:
+        return [
+            "download",
+            *target.pip_args(),
+            "--only-binary",
+            ":all:",
+            "--no-deps",
+            "--disable-pip-version-check",
+            "-r",
+            str(requirements_file),
+            "-d",
+            str(self.tag_dir(target)),
+        ]
+
+    def prune(self, keep: Set[Tuple[NormalizedName, Version]], dry_run: bool = False) -> List[Path]:
+        """
+        Remove the wheels whose name and version are not in `keep`.
+
+        Returns the wheels removed.
+        """
+        removed = []
+        for wheel in sorted(self.wheels()):
+            if _wheel_key(wheel) in keep:
+                continue
+            removed.append(wheel)
+            if not dry_run:
+                wheel.unlink()
+        return removed
+
+
+def locked_packages(poetry) -> Set[Tuple[NormalizedName, Version]]:
+    """
+    Name and version of every package in the project's poetry.lock.
+    """
+    packages = set()
+    for package in poetry.locker.lock_data.get("package", []):
+        try:
+            packages.add((canonicalize_name(package["name"]), Version(package["version"])))
+        except InvalidVersion:
+            continue
+    return packages
@@ -0,0 +1,208 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+import yaml
+from poetry.factory import Factory
+
+from poetry_aws_sam.api import (
+    FAILED,
+    SUCCESS,
+    BuildResult,
+    DependencyError,
+    FunctionBuildError,
+    OptionError,
+    PackageError,
+    ReportError,
+    SamBuildError,
+    TemplateError,
+    build,
+)
+from poetry_aws_sam.aws import AwsLambda
+from poetry_aws_sam.export import ExportCache
+from poetry_aws_sam.process import ProcessError, ProcessResult
+
+fake_aws_lambdas = [AwsLambda(name="1", path=Path("12")), AwsLambda(name="2", path=Path("aa"))]
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.poetry]\nname = "stack"\nversion = "0.1.0"\ndescription = ""\nauthors = []\n\n'
+        '[tool.poetry.dependencies]\npython = "^3.10"\n'
+    )
+    (tmp_path / "poetry.lock").write_text("")
+    return tmp_path
+
+
+@pytest.fixture
+def patch_sam(mocker):
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = fake_aws_lambdas
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+    return patch_sam
+
+
+@pytest.fixture
+def exported(mocker):
+    exported = []
+
+    def fake_export_lock(options, poetry, io):
+        def fake_handle(requirements_file):
+            exported.append(poetry.package.name)
+            requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+            return 0
+
+        export_lock = MagicMock()
+        export_lock.cache_key.return_value = poetry.package.name
+        export_lock.handle.side_effect = fake_handle
+        return export_lock
+
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock", side_effect=fake_export_lock)
+    return exported
+
+
+def fake_pip(failing=()):
+    def fake_run_process(args, **kwargs):
+        target = Path(args[args.index("-t") + 1])
+        if target.name in failing:
+            raise ProcessError(ProcessResult(args, 1, ["ERROR: No matching distribution found for pyyaml==6.0.1"]))
+        (target / "yaml").mkdir(parents=True, exist_ok=True)
+        (target / "yaml" / "__init__.py").write_text("x" * 100)
+
+    return fake_run_process
+
+
+def test_build(mocker, project_dir, patch_sam, exported):
+    """
+    Test that two builds of one project return their results without exiting
+    and export poetry.lock once
+
+    Parameters:
+    - the project dir, then a Poetry instance of it
+    - jobs set to 2
+    """
+    # Given
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_pip())
+    export_cache = ExportCache()
+
+    # When
+    first = build(project_dir, options={"jobs": 2}, export_cache=export_cache)
+    first_template = patch_sam.call_args.kwargs["template"]
+    second = build(Factory().create_poetry(project_dir), "other.yaml", options={"jobs": 2}, export_cache=export_cache)
+
+    # Then
+    # test: the template is relative to the project
+    assert first_template == project_dir / "template.yaml"
+    assert patch_sam.call_args.kwargs["template"] == project_dir / "other.yaml"
+    # test: each function was built, with its build dir and size
+    for result in (first, second):
+        assert isinstance(result, BuildResult)
+        assert result.succeeded
+        assert result.build_dir == project_dir / ".aws-sam" / "build"
+        assert [function.status for function in result.functions.values()] == [SUCCESS, SUCCESS]
+        assert result.functions["1"].build_dir == project_dir / ".aws-sam" / "build" / "1"
+        assert result.functions["1"].size == 100
+        assert result.functions["1"].duration > 0
+    # test: the export cache is shared by the builds
+    assert exported == ["stack"]
+
+
+def test_build_failure(mocker, project_dir, patch_sam, exported):
+    """
+    Test that a failed function raises FunctionBuildError with the results
+
+    Parameters:
+    - two lambdas, the second one failing
+    """
+    # Given
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_pip(failing={"2"}))
+
+    # When
+    with pytest.raises(FunctionBuildError) as wrapped_error:
+        build(project_dir)
+
+    # Then
+    result = wrapped_error.value.result
+    # test: the failed function is reported with pip's last output
+    assert not result.succeeded
+    assert result.failed == ["2"]
+    assert result.functions["1"].status == SUCCESS
+    assert result.functions["2"].status == FAILED
+    assert "No matching distribution found for pyyaml==6.0.1" in result.functions["2"].error
+    assert str(wrapped_error.value) == "Build failed for: 2"
+
+
+def test_build_errors(mocker, project_dir, patch_sam, exported):
+    """
+    Test the typed errors of the programmatic API
+
+    Parameters:
+    - an unknown option, the watch option, a failing 'sam build' and an invalid --jobs
+    """
+    # Given
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_pip())
+
+    # When, Then
+    # test: the options are checked before building
+    with pytest.raises(OptionError, match="'--no-such-option' does not exist"):
+        build(project_dir, options={"no_such_option": True})
+    with pytest.raises(OptionError, match="not supported"):
+        build(project_dir, options={"watch": True})
+    patch_sam.assert_not_called()
+
+    # test: a template that is not valid yaml
+    patch_sam.side_effect = yaml.parser.ParserError("expected <block end>")
+    with pytest.raises(TemplateError, match="The template could not be read"):
+        build(project_dir)
+    patch_sam.side_effect = None
+
+    # test: an invalid option value
+    with pytest.raises(OptionError, match="positive integer"):
+        build(project_dir, options={"jobs": 0})
+
+    # test: 'sam build' failed
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 1
+    patch_sam.return_value.invoke_sam_build.return_value.stderr = "Error: template invalid"
+    with pytest.raises(SamBuildError) as wrapped_error:
+        build(project_dir)
+    assert [function.status for function in wrapped_error.value.result.functions.values()] == [
+        "cancelled",
+        "cancelled",
+    ]
+
+
+def test_build_wrapped_errors(mocker, project_dir, patch_sam, exported):
+    """
+    Test that the failures after the functions are built raise typed errors with the results
+
+    Parameters:
+    - a failing layer install, then no built template to zip or report on
+    """
+    # Given
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_pip(failing={"python"}))
+
+    def fake_sam_build(build_dir, params):
+        Path(build_dir).mkdir(parents=True, exist_ok=True)
+        (Path(build_dir) / "template.yaml").write_text(
+            "Resources:\n  '1':\n    Type: AWS::Serverless::Function\n    Properties:\n      CodeUri: '1'\n"
+            "  '2':\n    Type: AWS::Serverless::Function\n    Properties:\n      CodeUri: '2'\n"
+        )
+        return MagicMock(returncode=0)
+
+    # When, Then
+    # test: pip failing for the layer
+    patch_sam.return_value.invoke_sam_build.side_effect = fake_sam_build
+    with pytest.raises(DependencyError, match="Installing the dependencies layer failed") as wrapped_error:
+        build(project_dir, options={"as_layer": True})
+    assert isinstance(wrapped_error.value.__context__, ProcessError)
+    assert set(wrapped_error.value.result.functions) == {"1", "2"}
+
+    # test: the built template is missing
+    patch_sam.return_value.invoke_sam_build.side_effect = None
+    (project_dir / ".aws-sam" / "build" / "template.yaml").unlink()
+    with pytest.raises(PackageError, match="Packaging failed") as wrapped_error:
+        build(project_dir, options={"zip": True})
+    assert wrapped_error.value.result.functions["1"].status == SUCCESS
+    with pytest.raises(ReportError, match="Reporting failed"):
+        build(project_dir, options={"report": True})
@@ -0,0 +1,107 @@
+import os
+import py_compile
+import zipfile
+
+from poetry_aws_sam.artifacts import (
+    ARTIFACTS_MANIFEST_FILE_NAME,
+    ArtifactManifest,
+    deterministic_zip,
+    package_artifacts,
+)
+
+
+def write_function(path, content="def handler(event, context): ...\n"):
+    (path / "app").mkdir(parents=True, exist_ok=True)
+    (path / "app" / "handler.py").write_text(content)
+    (path / "bin").mkdir(exist_ok=True)
+    (path / "bin" / "tool").write_text("#!/bin/sh\n")
+    (path / "bin" / "tool").chmod(0o775)
+
+
+def test_deterministic_zip(tmp_path):
+    """
+    Test that the same files give the same zip whatever their times and pycs
+    """
+    # Given
+    one, two = tmp_path / "one", tmp_path / "two"
+    write_function(one)
+    write_function(two)
+    os.utime(two / "app" / "handler.py", (0, 0))
+    py_compile.compile(str(two / "app" / "handler.py"), invalidation_mode=py_compile.PycInvalidationMode.TIMESTAMP)
+    py_compile.compile(str(one / "app" / "handler.py"), invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+
+    # When
+    one_hash = deterministic_zip(one, tmp_path / "one.zip")
+    os.remove(next((one / "app" / "__pycache__").iterdir()))
+    one_without_pyc_hash = deterministic_zip(one, tmp_path / "one.zip")
+    two_hash = deterministic_zip(two, tmp_path / "two.zip")
+
+    # Then
+    # test: timestamp pycs are left out, hash based ones are zipped
+    assert one_hash != one_without_pyc_hash
+    assert one_without_pyc_hash == two_hash
+    # test: entries are sorted with fixed times and permissions
+    with zipfile.ZipFile(tmp_path / "two.zip") as archive:
+        infos = archive.infolist()
+    assert [info.filename for info in infos] == ["app/handler.py", "bin/tool"]
+    assert {info.date_time for info in infos} == {(1980, 1, 1, 0, 0, 0)}
+    assert [info.external_attr >> 16 & 0o777 for info in infos] == [0o644, 0o755]
+
+
+def test_package_artifacts(tmp_path):
+    """
+    Test that the built template points at the zips and that unchanged code is not zipped again
+    """
+    # Given
+    build_dir = tmp_path / ".aws-sam" / "build"
+    artifacts_dir = tmp_path / ".aws-sam" / "artifacts"
+    write_function(build_dir / "One")
+    write_function(build_dir / "Two")
+    (tmp_path / ".aws-sam" / "layers" / "deps" / "python").mkdir(parents=True)
+    (tmp_path / ".aws-sam" / "layers" / "deps" / "python" / "pkg.py").write_text("")
+
+    def built_template():
+        return {
+            "Resources": {
+                "One": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "One"}},
+                "Two": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "Two"}},
+                "Deps": {"Type": "AWS::Serverless::LayerVersion", "Properties": {"ContentUri": "../layers/deps"}},
+                "Remote": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "s3://bucket/key.zip"}},
+            }
+        }
+
+    # When
+    template = built_template()
+    first = package_artifacts(template, build_dir, artifacts_dir, jobs=2)
+
+    # Then
+    # test: code dirs are replaced by their zip, other uris are kept
+    assert template["Resources"]["One"]["Properties"]["CodeUri"] == "../artifacts/One.zip"
+    assert template["Resources"]["Deps"]["Properties"]["ContentUri"] == "../artifacts/Deps.zip"
+    assert template["Resources"]["Remote"]["Properties"]["CodeUri"] == "s3://bucket/key.zip"
+    # test: same files, same zip
+    assert first["One"].sha256 == first["Two"].sha256
+    manifest = ArtifactManifest.load(artifacts_dir / ARTIFACTS_MANIFEST_FILE_NAME)
+    assert sorted(manifest.artifacts) == ["Deps", "One", "Two"]
+
+    # When
+    # rebuilding touches the files and changes one function, the template of an
+    # up to date incremental build already points at the zips
+    os.utime(build_dir / "One" / "app" / "handler.py", (0, 0))
+    write_function(build_dir / "Two", content="def handler(event, context): return 2\n")
+    second = package_artifacts(template, build_dir, artifacts_dir)
+
+    # Then
+    assert second["One"] is None and second["Deps"] is None
+    assert second["Two"].sha256 != first["Two"].sha256
+    manifest = ArtifactManifest.load(artifacts_dir / ARTIFACTS_MANIFEST_FILE_NAME)
+    assert manifest.artifacts["One"].sha256 == first["One"].sha256
+
+    # When
+    template = built_template()
+    del template["Resources"]["Two"]
+    package_artifacts(template, build_dir, artifacts_dir)
+
+    # Then
+    # test: the zips of removed resources are deleted
+    assert sorted(path.name for path in artifacts_dir.glob("*.zip")) == ["Deps.zip", "One.zip"]
@@ -0,0 +1,75 @@
+import stat
+import threading
+import time
+
+from poetry_aws_sam.aws import Sam
+
+
+def test_cancel_sam_build(tmp_path):
+    """
+    Test that a running 'sam build' is terminated from another thread
+    """
+    # Given
+    template = tmp_path / "template.yaml"
+    template.write_text("Resources: {}\n")
+    sam_exec = tmp_path / "sam"
+    sam_exec.write_text("#!/bin/sh\nexec sleep 30\n")
+    sam_exec.chmod(sam_exec.stat().st_mode | stat.S_IEXEC)
+    sam = Sam(sam_exec=str(sam_exec), template=template)
+
+    def cancel():
+        while sam._process is None:
+            time.sleep(0.01)
+        sam.cancel_sam_build()
+
+    # When
+    canceller = threading.Thread(target=cancel)
+    canceller.start()
+    start = time.monotonic()
+    result = sam.invoke_sam_build(build_dir=str(tmp_path / "build"))
+    canceller.join()
+
+    # Then
+    assert result.returncode != 0
+    assert time.monotonic() - start < 10
+    # test: cancelling once the build is done is a no-op
+    sam.cancel_sam_build()
+
+
+def test_function_projects(tmp_path):
+    """
+    Test that a function whose CodeUri is a locked Poetry project is installed from it
+    """
+    # Given
+    (tmp_path / "template.yaml").write_text("""
+Globals:
+  Function:
+    Runtime: python3.11
+Resources:
+  Orders:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: services/orders
+      Handler: app.handler.handler
+  Users:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: services/users
+      Handler: app.handler.handler
+  Root:
+    Type: AWS::Serverless::Function
+    Properties:
+      Handler: app.handler.handler
+""")
+    for name in ("orders", "users"):
+        (tmp_path / "services" / name).mkdir(parents=True)
+        (tmp_path / "services" / name / "pyproject.toml").write_text("[tool.poetry]\n")
+    (tmp_path / "services" / "orders" / "poetry.lock").write_text("")
+
+    # When
+    sam = Sam(sam_exec="sam", template=tmp_path / "template.yaml")
+
+    # Then
+    projects = {aws_lambda.name: aws_lambda.project_dir for aws_lambda in sam.lambdas}
+    # test: only the locked project is used, the others fall back to the root project
+    assert projects == {"Orders": tmp_path / "services" / "orders", "Users": None, "Root": None}
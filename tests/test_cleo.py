@@ -1,13 +1,31 @@
+import json
+import shutil
+import sys
+import threading
+import zipfile
 from pathlib import Path
 from unittest.mock import MagicMock, PropertyMock
 
 import pytest
+import yaml
+from cleo.io.outputs.output import Verbosity
 from cleo.testers.command_tester import CommandTester
 from poetry.console.application import Application
 
+import poetry_aws_sam.sam
 from poetry_aws_sam.aws import AwsLambda
-from poetry_aws_sam.plugin import SAM_TEMPLATE_TXT, SamCommand
+from poetry_aws_sam.platforms import InstallTarget
+from poetry_aws_sam.plugin import (
+    SAM_TEMPLATE_TXT,
+    SamCommand,
+    TreeCacheClearCommand,
+    TreeCacheStatsCommand,
+    WheelhousePruneCommand,
+)
+from poetry_aws_sam.process import run_process
 from poetry_aws_sam.sam import SAM_BUILD_DIR_NAME
+from poetry_aws_sam.staging import NativeStaging
+from poetry_aws_sam.wheelhouse import Wheelhouse
 
 fake_aws_lambda_one = AwsLambda(name="1", path=Path("12"))
 fake_aws_lambda_two = AwsLambda(name="2", path=Path("aa"))
@@ -21,18 +39,7 @@ def fake_root_dir():
 
     yield fake_root_dir
 
-    def rm_tree(pth: Path):
-        for child in pth.rglob("*"):
-            if child.is_file():
-                child.unlink()
-            else:
-                rm_tree(child)
-            child.rmdir()
-
-    rm_tree(fake_root_dir)
-
-    if fake_root_dir.exists():
-        fake_root_dir.rmdir()
+    shutil.rmtree(fake_root_dir, ignore_errors=True)
 
 
 def test_execute_one_lambda(mocker, fake_root_dir):
@@ -238,7 +245,7 @@ def test_execute_build_lambda(mocker, fake_root_dir):
     patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
     patch_export_handle = patch_export_lock.return_value.handle
 
-    patch_check_call = mocker.patch("poetry_aws_sam.sam.check_call")
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process")
     # When
     application = Application()
     application.add(SamCommand())
@@ -255,14 +262,14 @@ def test_execute_build_lambda(mocker, fake_root_dir):
         build_dir=str(fake_root_dir / SAM_BUILD_DIR_NAME), params=None
     )
 
-    # test: ExportLock handle is called with the requirements file
-    patch_export_handle.assert_called_once_with(Path(expected_requirements_file))
+    # test: ExportLock handle is called with the requirements file, after the prefetched export
+    patch_export_handle.assert_called_with(Path(expected_requirements_file))
 
     # test: pip call has the expected parameters
-    patch_check_call.assert_called_once()
-    patch_check_call_args = patch_check_call.call_args[0][0]
-    assert expected_requirements_file in patch_check_call_args
-    assert f"{fake_root_name}/.aws-sam/build/1" in patch_check_call_args
+    patch_run_process.assert_called_once()
+    patch_run_process_args = patch_run_process.call_args[0][0]
+    assert expected_requirements_file in patch_run_process_args
+    assert f"{fake_root_name}/.aws-sam/build/1" in patch_run_process_args
 
 
 def test_execute_passing_parameters(mocker, fake_root_dir):
@@ -282,7 +289,7 @@ def test_execute_passing_parameters(mocker, fake_root_dir):
     patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
     patch_export_handle = patch_export_lock.return_value.handle
 
-    patch_check_call = mocker.patch("poetry_aws_sam.sam.check_call")
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process")
     # When
     application = Application()
     application.add(SamCommand())
@@ -301,13 +308,1164 @@ def test_execute_passing_parameters(mocker, fake_root_dir):
         build_dir=str(fake_root_dir / SAM_BUILD_DIR_NAME), params=None
     )
 
-    # test: ExportLock handle is called with the requirements file
-    patch_export_handle.assert_called_once_with(Path(expected_requirements_file))
-    # test: ExportLock called only once (didn't know how to test that he parameters are set correctly
-    patch_export_lock.assert_called_once()
+    # test: ExportLock handle is called with the requirements file, after the prefetched export
+    patch_export_handle.assert_called_with(Path(expected_requirements_file))
+    # test: ExportLock called for the prefetched export and the lambda
+    # (didn't know how to test that he parameters are set correctly
+    assert patch_export_lock.call_count == 2
 
     # test: pip call has the expected parameters
-    patch_check_call.assert_called_once()
-    patch_check_call_args = patch_check_call.call_args[0][0]
-    assert expected_requirements_file in patch_check_call_args
-    assert f"{fake_root_name}/.aws-sam/build/1" in patch_check_call_args
+    patch_run_process.assert_called_once()
+    patch_run_process_args = patch_run_process.call_args[0][0]
+    assert expected_requirements_file in patch_run_process_args
+    assert f"{fake_root_name}/.aws-sam/build/1" in patch_run_process_args
+
+
+def test_execute_export_cached(mocker, fake_root_dir):
+    """
+    Test that poetry.lock is exported once and reused for both lambdas
+
+    Parameters:
+    - no parameters passed
+    - two lambdas
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one, fake_aws_lambda_two]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.cache_key.return_value = "fake-key"
+    patch_export_handle = patch_export_lock.return_value.handle
+    patch_export_handle.side_effect = fake_handle
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process")
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute()
+
+    # Then
+    # test: the Exporter ran once, in the background while 'sam build' copied the code
+    patch_export_handle.assert_called_once_with(Path(f"{fake_root_name}/.aws-sam/prefetch/requirements.txt"))
+    # test: pip install still ran for both lambdas
+    assert patch_run_process.call_count == 2
+    # test: the reuse of the export is reported
+    output = command_tester.io.fetch_output()
+    assert "1: reusing cached poetry.lock export" in output
+    assert "2: reusing cached poetry.lock export" in output
+
+
+def test_execute_jobs_failure(mocker, fake_root_dir):
+    """
+    Test that a failing lambda is reported and aborts the build
+    when lambdas are installed in parallel
+
+    Parameters:
+    - jobs set to 2
+    - two lambdas, the first one failing
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one, fake_aws_lambda_two]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    second_started = threading.Event()
+
+    def fake_build_lambda(aws_lambda):
+        if aws_lambda == fake_aws_lambda_one:
+            # fail only once the second lambda is running so it is not cancelled
+            second_started.wait(timeout=5)
+            raise RuntimeError("pip install failed")
+        second_started.set()
+
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda", side_effect=fake_build_lambda)
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    with pytest.raises(SystemExit) as wrapped_exit:
+        command_tester.execute("--jobs 2")
+
+    # Then
+    # test: both lambdas were started
+    assert patch_build_lambda.call_count == 2
+    # test: system exit with 1
+    assert wrapped_exit.value.code == 1
+    # test: the summary lists each lambda in order
+    output = command_tester.io.fetch_output()
+    assert output.index("1: failed") < output.index("2: success")
+    # test: wording of the failure
+    error = command_tester.io.fetch_error()
+    assert "1 failed: pip install failed" in error
+    assert "Build failed for: 1" in error
+
+
+def test_execute_link_dependencies(mocker, fake_root_dir):
+    """
+    Test that with --link-dependencies pip runs once into the staging dir
+    and the lambdas get linked copies
+
+    Parameters:
+    - link-dependencies set
+    - two lambdas with the same requirements
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one, fake_aws_lambda_two]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.cache_key.return_value = "fake-key"
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    def fake_run_process(args, **kwargs):
+        target = Path(args[args.index("-t") + 1])
+        (target / "yaml").mkdir(parents=True)
+        (target / "yaml" / "__init__.py").write_text("")
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_run_process)
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute("--link-dependencies")
+
+    # Then
+    # test: pip ran once into the staging dir
+    patch_run_process.assert_called_once()
+    assert ".aws-sam/staging" in patch_run_process.call_args[0][0][-1]
+    # test: both lambdas have the dependencies
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "1" / "yaml" / "__init__.py").exists()
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "2" / "yaml" / "__init__.py").exists()
+    assert "2: reusing staged dependencies" in command_tester.io.fetch_output()
+
+
+def test_execute_offline_missing_wheels(mocker, fake_root_dir, tmp_path):
+    """
+    Test that an offline build fails on wheels missing from the wheelhouse
+    without running pip
+
+    Parameters:
+    - offline with an empty wheelhouse
+    - one lambda
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process")
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    with pytest.raises(SystemExit) as wrapped_exit:
+        command_tester.execute(f"--offline --wheelhouse-dir {tmp_path}")
+
+    # Then
+    # test: neither pip download nor pip install ran
+    patch_run_process.assert_not_called()
+    assert wrapped_exit.value.code == 1
+    # test: the missing pin is named
+    assert "Wheels missing from the wheelhouse in offline mode: pyyaml==6.0.1" in command_tester.io.fetch_error()
+
+
+def test_execute_incremental(mocker, fake_root_dir):
+    """
+    Test that an incremental build only rebuilds the lambdas that changed
+
+    Parameters:
+    - incremental set
+    - two lambdas from a template, run three times
+    """
+    # Given
+    (fake_root_dir / "one" / "app").mkdir(parents=True)
+    (fake_root_dir / "one" / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+    (fake_root_dir / "two" / "app").mkdir(parents=True)
+    (fake_root_dir / "two" / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+    (fake_root_dir / SAM_TEMPLATE_TXT).write_text("""
+Globals:
+  Function:
+    Runtime: python3.11
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: one
+      Handler: app.handler.handler
+  Two:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: two
+      Handler: app.handler.handler
+""")
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_sam_build(build_dir, params):
+        for name in ("One", "Two"):
+            (Path(build_dir) / name).mkdir(parents=True, exist_ok=True)
+        return MagicMock(returncode=0)
+
+    patch_sam_build = mocker.patch("poetry_aws_sam.sam.Sam.invoke_sam_build", side_effect=fake_sam_build)
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.lock_hash.return_value = "lock"
+    patch_export_lock.return_value.options_hash.return_value = "options"
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+
+    application = Application()
+    application.add(SamCommand())
+    command = application.find("sam")
+
+    # When
+    first_run = CommandTester(command)
+    first_run.execute("--incremental")
+    second_run = CommandTester(command)
+    second_run.execute("--incremental")
+    (fake_root_dir / "two" / "app" / "handler.py").write_text("def handler(event, context): return 1\n")
+    third_run = CommandTester(command)
+    third_run.execute("--incremental")
+
+    # Then
+    # test: first run builds both lambdas as they were not built before
+    assert "Rebuilding One: not built before" in first_run.io.fetch_output()
+    # test: second run skips sam build and the lambdas
+    assert "All lambda functions are up to date" in second_run.io.fetch_output()
+    assert patch_sam_build.call_count == 2
+    # test: third run only rebuilds the changed lambda
+    assert "Rebuilding Two: code changed" in third_run.io.fetch_output()
+    assert [call.kwargs["aws_lambda"].name for call in patch_build_lambda.call_args_list] == ["One", "Two", "Two"]
+
+
+def test_execute_incremental_native_staging(mocker, fake_root_dir):
+    """
+    Test that an incremental build rebuilds on the build options and PoetrySam metadata
+    and that native staging only copies the changed lambdas
+
+    Parameters:
+    - incremental and native-staging set
+    - two lambdas from a template, run with slim, then with other metadata for one lambda
+    """
+    # Given
+    for name in ("one", "two"):
+        (fake_root_dir / name / "app").mkdir(parents=True)
+        (fake_root_dir / name / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+    template = """
+Globals:
+  Function:
+    Runtime: python3.11
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: one
+      Handler: app.handler.handler
+  Two:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: two
+      Handler: app.handler.handler
+    Metadata:
+      PoetrySam:
+        Slim: [pycache]
+"""
+    (fake_root_dir / SAM_TEMPLATE_TXT).write_text(template)
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    patch_sam_build = mocker.patch("poetry_aws_sam.sam.Sam.invoke_sam_build")
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.lock_hash.return_value = "lock"
+    patch_export_lock.return_value.options_hash.return_value = "options"
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    spy_copy = mocker.spy(NativeStaging, "_copy_function")
+
+    application = Application()
+    application.add(SamCommand())
+    command = application.find("sam")
+
+    # When
+    first_run = CommandTester(command)
+    first_run.execute("--incremental --native-staging")
+    slim_run = CommandTester(command)
+    slim_run.execute("--incremental --native-staging --slim")
+    (fake_root_dir / SAM_TEMPLATE_TXT).write_text(template.replace("[pycache]", "[pycache, tests]"))
+    spy_copy.reset_mock()
+    metadata_run = CommandTester(command)
+    metadata_run.execute("--incremental --native-staging --slim")
+
+    # Then
+    # test: a build option that changes the installed packages rebuilds every lambda
+    slim_output = slim_run.io.fetch_output()
+    assert "Rebuilding One: build options changed" in slim_output
+    assert "Rebuilding Two: build options changed" in slim_output
+    # test: the PoetrySam metadata of a lambda is part of its fingerprint
+    metadata_output = metadata_run.io.fetch_output()
+    assert "Rebuilding Two: template properties changed" in metadata_output
+    assert "Rebuilding One" not in metadata_output
+    # test: only the changed lambda was copied and the unchanged one kept its build dir
+    assert [call.args[1] for call in spy_copy.call_args_list] == ["Two"]
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "One" / "app" / "handler.py").exists()
+    patch_sam_build.assert_not_called()
+
+
+def test_execute_incremental_shared_code_uri(mocker, fake_root_dir):
+    """
+    Test that the lambdas sharing a CodeUri hash it once and that --exclude is a build option
+
+    Parameters:
+    - incremental set
+    - two lambdas with the same CodeUri, run again with an exclude pattern
+    """
+    # Given
+    (fake_root_dir / "src" / "app").mkdir(parents=True)
+    (fake_root_dir / "src" / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+    (fake_root_dir / SAM_TEMPLATE_TXT).write_text("""
+Globals:
+  Function:
+    Runtime: python3.11
+    CodeUri: src
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      Handler: app.handler.one
+  Two:
+    Type: AWS::Serverless::Function
+    Properties:
+      Handler: app.handler.two
+""")
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    _ = mocker.patch("poetry_aws_sam.sam.Sam.invoke_sam_build", return_value=MagicMock(returncode=0))
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.lock_hash.return_value = "lock"
+    patch_export_lock.return_value.options_hash.return_value = "options"
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    spy_hash_tree = mocker.spy(poetry_aws_sam.sam, "hash_tree")
+
+    application = Application()
+    application.add(SamCommand())
+    command = application.find("sam")
+
+    # When
+    first_run = CommandTester(command)
+    first_run.execute("--incremental")
+    exclude_run = CommandTester(command)
+    exclude_run.execute("--incremental --exclude *.md")
+
+    # Then
+    # test: the shared code dir is hashed once per run
+    code_dir = (fake_root_dir / "src").resolve()
+    assert [call.args[0] for call in spy_hash_tree.call_args_list].count(code_dir) == 2
+    # test: an exclude pattern changes the fingerprint of every lambda
+    exclude_output = exclude_run.io.fetch_output()
+    assert "Rebuilding One: build options changed" in exclude_output
+    assert "Rebuilding Two: build options changed" in exclude_output
+
+
+def test_execute_as_layer(mocker, fake_root_dir):
+    """
+    Test that --as-layer installs the dependencies once into a layer
+    and reuses it while the lock does not change
+
+    Parameters:
+    - as-layer set
+    - two lambdas, run twice
+    """
+    # Given
+    aws_lambda_one = AwsLambda(name="One", path=Path("app"), runtime="python3.11")
+    aws_lambda_two = AwsLambda(name="Two", path=Path("app"), runtime="python3.11")
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [aws_lambda_one, aws_lambda_two]
+
+    def fake_sam_build(build_dir, params):
+        Path(build_dir).mkdir(parents=True, exist_ok=True)
+        (Path(build_dir) / "template.yaml").write_text(
+            "Resources:\n"
+            "  One:\n    Type: AWS::Serverless::Function\n    Properties:\n      CodeUri: One\n"
+            "  Two:\n    Type: AWS::Serverless::Function\n    Properties:\n      CodeUri: Two\n"
+        )
+        return MagicMock(returncode=0)
+
+    patch_sam.return_value.invoke_sam_build.side_effect = fake_sam_build
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    def fake_run_process(args, **kwargs):
+        Path(args[args.index("-t") + 1], "yaml").mkdir(parents=True)
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_run_process)
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+
+    application = Application()
+    application.add(SamCommand())
+    command = application.find("sam")
+
+    # When
+    CommandTester(command).execute("--as-layer")
+    second_run = CommandTester(command)
+    second_run.execute("--as-layer")
+
+    # Then
+    # test: the lambdas get no dependencies of their own
+    patch_build_lambda.assert_not_called()
+    # test: pip ran once, into the python dir of the layer
+    patch_run_process.assert_called_once()
+    layer_dirs = list((fake_root_dir / ".aws-sam" / "layers").iterdir())
+    assert len(layer_dirs) == 1
+    assert (layer_dirs[0] / "python" / "yaml").exists()
+    assert "unchanged, reusing the installed layer" in second_run.io.fetch_output()
+    # test: the built template attaches the layer to both lambdas
+    template = yaml.safe_load((fake_root_dir / SAM_BUILD_DIR_NAME / "template.yaml").read_text())
+    layer_name = "PoetrySamDependenciesLayerX8664Py311"
+    assert template["Resources"][layer_name]["Properties"]["ContentUri"] == f"../layers/{layer_dirs[0].name}"
+    assert template["Resources"]["Two"]["Properties"]["Layers"] == [{"Ref": layer_name}]
+
+
+def test_execute_as_layer_slim(mocker, fake_root_dir):
+    """
+    Test that the layer is slimmed with the rules shared by its lambdas
+
+    Parameters:
+    - as-layer and slim-rules set
+    - two lambdas, the second one with fewer rules in its PoetrySam metadata
+    """
+    # Given
+    aws_lambda_one = AwsLambda(name="One", path=Path("app"), runtime="python3.11")
+    aws_lambda_two = AwsLambda(
+        name="Two", path=Path("app"), runtime="python3.11", metadata={"PoetrySam": {"Slim": ["pycache"]}}
+    )
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [aws_lambda_one, aws_lambda_two]
+
+    def fake_sam_build(build_dir, params):
+        Path(build_dir).mkdir(parents=True, exist_ok=True)
+        (Path(build_dir) / "template.yaml").write_text(
+            "Resources:\n"
+            "  One:\n    Type: AWS::Serverless::Function\n    Properties:\n      CodeUri: One\n"
+            "  Two:\n    Type: AWS::Serverless::Function\n    Properties:\n      CodeUri: Two\n"
+        )
+        return MagicMock(returncode=0)
+
+    patch_sam.return_value.invoke_sam_build.side_effect = fake_sam_build
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    def fake_run_process(args, **kwargs):
+        package_dir = Path(args[args.index("-t") + 1], "yaml")
+        (package_dir / "__pycache__").mkdir(parents=True)
+        (package_dir / "__pycache__" / "__init__.cpython-311.pyc").write_bytes(b"x" * 100)
+        (package_dir / "tests").mkdir()
+        (package_dir / "tests" / "test_yaml.py").write_text("")
+
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_run_process)
+
+    application = Application()
+    application.add(SamCommand())
+    command = application.find("sam")
+
+    # When
+    command_tester = CommandTester(command)
+    command_tester.execute("--as-layer --slim-rules pycache,tests")
+
+    # Then
+    # test: the layer was slimmed with the pycache rule of both lambdas only
+    package_dir = next((fake_root_dir / ".aws-sam" / "layers").iterdir()) / "python" / "yaml"
+    assert not (package_dir / "__pycache__").exists()
+    assert (package_dir / "tests" / "test_yaml.py").exists()
+    assert "slimmed" in command_tester.io.fetch_output()
+
+
+def test_execute_native_staging(mocker, fake_root_dir):
+    """
+    Test a build with --native-staging, which does not need the SAM CLI
+
+    Parameters:
+    - native-staging set
+    - one lambda from a template
+    """
+    # Given
+    (fake_root_dir / "one" / "app").mkdir(parents=True)
+    (fake_root_dir / "one" / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+    (fake_root_dir / SAM_TEMPLATE_TXT).write_text("""
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: one
+      Handler: app.handler.handler
+      Runtime: python3.11
+""")
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    patch_sam_build = mocker.patch("poetry_aws_sam.sam.Sam.invoke_sam_build")
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+    command_tester = CommandTester(application.find("sam"))
+    command_tester.execute("--native-staging")
+
+    # Then
+    # test: the SAM CLI is not called
+    patch_sam_build.assert_not_called()
+    # test: the code is in the build dir before the dependencies are installed
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "One" / "app" / "handler.py").exists()
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "template.yaml").exists()
+    assert patch_build_lambda.call_args.kwargs["aws_lambda"].name == "One"
+
+
+def test_execute_timings(mocker, fake_root_dir):
+    """
+    Test the --timings summary and the --trace-file
+
+    Parameters:
+    - --timings --trace-file
+    - one lambda
+    """
+    # Given
+    trace_file = fake_root_dir / "trace.json"
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    _ = mocker.patch("poetry_aws_sam.sam.run_process")
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute(f"--timings --trace-file {trace_file}")
+
+    # Then
+    output = command_tester.io.fetch_output()
+    # test: the summary lists the stages and the function
+    assert "Timings:" in output
+    for stage in ["template parse", "sam build", "export", "pip install", "build lambda"]:
+        assert f"  {stage} " in output
+    # test: the trace file holds the stages of the function
+    trace = json.loads(trace_file.read_text())
+    functions = {event["name"]: event["args"]["function"] for event in trace["traceEvents"]}
+    assert functions["pip install"] == "1"
+    assert functions["template parse"] is None
+
+
+def test_execute_prefetch_overlaps_sam_build(mocker, fake_root_dir, tmp_path):
+    """
+    Test that the wheels are downloaded while 'sam build' is running
+
+    Parameters:
+    - wheelhouse with an empty wheelhouse dir
+    - one lambda
+    """
+    # Given
+    downloaded = threading.Event()
+    overlapped = []
+
+    def fake_sam_build(build_dir, params):
+        # 'sam build' only returns once the download has started
+        overlapped.append(downloaded.wait(timeout=10))
+        return MagicMock(returncode=0)
+
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.side_effect = fake_sam_build
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+    patch_export_lock.return_value.cache_key.return_value = "key"
+
+    def fake_run_process(args, **kwargs):
+        if "download" in args:
+            tag_dir = Path(args[args.index("-d") + 1])
+            tag_dir.mkdir(parents=True, exist_ok=True)
+            (tag_dir / "PyYAML-6.0.1-cp311-cp311-manylinux2014_x86_64.whl").touch()
+            downloaded.set()
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_run_process)
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute(f"--wheelhouse --wheelhouse-dir {tmp_path}")
+
+    # Then
+    # test: the download ran during 'sam build'
+    assert overlapped == [True]
+    # test: the export ran once and the install used the prefetched wheelhouse
+    assert patch_export_lock.return_value.handle.call_count == 1
+    assert [call.args[0][3] for call in patch_run_process.call_args_list] == ["download", "install"]
+    assert "--no-index" in patch_run_process.call_args_list[1].args[0]
+
+
+def test_execute_prefetch_failure_cancels_sam_build(mocker, fake_root_dir, tmp_path):
+    """
+    Test that a failing download terminates the running 'sam build'
+
+    Parameters:
+    - offline with an empty wheelhouse
+    - one lambda
+    """
+    # Given
+    cancelled = threading.Event()
+
+    def fake_sam_build(build_dir, params):
+        cancelled.wait(timeout=10)
+        return MagicMock(returncode=-15, stderr="terminated")
+
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.side_effect = fake_sam_build
+    patch_sam.return_value.cancel_sam_build.side_effect = cancelled.set
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    with pytest.raises(SystemExit) as wrapped_exit:
+        command_tester.execute(f"--offline --wheelhouse-dir {tmp_path}")
+
+    # Then
+    # test: 'sam build' was cancelled and no lambda was built
+    assert cancelled.is_set()
+    patch_build_lambda.assert_not_called()
+    assert wrapped_exit.value.code == 1
+    # test: the download failure is reported rather than the cancelled 'sam build'
+    error = command_tester.io.fetch_error()
+    assert "Fetching the dependencies failed: Wheels missing from the wheelhouse" in error
+    assert "SAM build failed!" not in error
+
+
+def test_execute_watch(mocker, fake_root_dir, tmp_path):
+    """
+    Test that a code change is copied into the build dir and a poetry.lock change rebuilds
+
+    Parameters:
+    - watch
+    - one lambda
+    """
+    # Given
+    code_dir = tmp_path / "one"
+    (code_dir / "app").mkdir(parents=True)
+    (code_dir / "app" / "handler.py").write_text("def handler(event, context): return 1\n")
+    aws_lambda = AwsLambda(name="One", path=Path("app"), handler="app.handler.handler")
+
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [aws_lambda]
+    patch_sam.return_value.code_dir.return_value = code_dir
+    patch_sam.return_value.template_path = tmp_path / "template.yaml"
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    patch_factory = mocker.patch("poetry_aws_sam.sam.Factory")
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock")
+
+    patch_watcher = mocker.patch("poetry_aws_sam.sam.PollingWatcher")
+    patch_watcher.return_value.wait.side_effect = [
+        {"One": {"app/handler.py"}},
+        {"poetry.lock": {"."}},
+        KeyboardInterrupt(),
+    ]
+    build_dir = fake_root_dir / SAM_BUILD_DIR_NAME / "One"
+    (build_dir / "app").mkdir(parents=True)
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute("--watch")
+
+    # Then
+    output = command_tester.io.fetch_output()
+    # test: the template was parsed once and the function's code dir is watched
+    patch_sam.assert_called_once()
+    roots = patch_watcher.call_args.args[0]
+    assert roots["One"] == code_dir
+    # test: the code change only copied the changed file
+    assert (build_dir / "app" / "handler.py").read_text() == "def handler(event, context): return 1\n"
+    assert "One: 1 file(s) copied, 0 removed" in output
+    # test: the poetry.lock change reloaded the project and rebuilt the dependencies
+    patch_factory.return_value.create_poetry.assert_called_once_with(fake_root_dir)
+    assert patch_build_lambda.call_count == 2
+    assert patch_sam.return_value.invoke_sam_build.call_count == 2
+    assert "Stopped watching" in output
+
+
+def test_execute_watch_invalid_template(mocker, fake_root_dir, tmp_path):
+    """
+    Test that a half-edited template is reported and the watch goes on
+
+    Parameters:
+    - watch
+    - a template saved with a yaml error, then fixed
+    """
+    # Given
+    aws_lambda = AwsLambda(name="One", path=Path("app"), handler="app.handler.handler")
+    sam = MagicMock()
+    sam.lambdas = [aws_lambda]
+    sam.code_dir.return_value = tmp_path
+    sam.template_path = tmp_path / "template.yaml"
+    sam.invoke_sam_build.return_value.returncode = 0
+    patch_sam = mocker.patch(
+        "poetry_aws_sam.sam.Sam", side_effect=[sam, yaml.parser.ParserError("expected <block end>"), sam]
+    )
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock")
+
+    patch_watcher = mocker.patch("poetry_aws_sam.sam.PollingWatcher")
+    patch_watcher.return_value.wait.side_effect = [{"template": {"."}}, {"template": {"."}}, KeyboardInterrupt()]
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    status = command_tester.execute("--watch")
+
+    # Then
+    # test: the yaml error was reported without stopping the watch
+    assert status == 0
+    error = command_tester.io.fetch_error()
+    assert "The template could not be read: expected <block end>" in error
+    assert "Build failed, fix the error and save to rebuild" in error
+    # test: the fixed template was built again
+    assert patch_sam.call_count == 3
+    assert patch_build_lambda.call_count == 2
+    assert "Stopped watching" in command_tester.io.fetch_output()
+
+
+def test_execute_watch_root_code_uri(mocker, fake_root_dir):
+    """
+    Test that a pyproject.toml change of a function whose code is the root project reloads it
+
+    Parameters:
+    - watch
+    - one lambda with the CodeUri "."
+    """
+    # Given
+    aws_lambda = AwsLambda(name="One", path=Path("app"), handler="app.handler.handler")
+
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [aws_lambda]
+    patch_sam.return_value.code_dir.return_value = fake_root_dir
+    patch_sam.return_value.template_path = fake_root_dir / "template.yaml"
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    patch_build_lambda = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    patch_factory = mocker.patch("poetry_aws_sam.sam.Factory")
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock")
+
+    patch_watcher = mocker.patch("poetry_aws_sam.sam.PollingWatcher")
+    patch_watcher.return_value.wait.side_effect = [{"One": {"pyproject.toml"}}, KeyboardInterrupt()]
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute("--watch")
+
+    # Then
+    output = command_tester.io.fetch_output()
+    # test: the root project was reloaded and the dependencies rebuilt with it
+    assert "A function's Poetry project changed" in output
+    patch_factory.return_value.create_poetry.assert_called_once_with(fake_root_dir)
+    assert patch_build_lambda.call_count == 2
+    assert patch_sam.return_value.invoke_sam_build.call_count == 2
+
+
+def test_execute_watch_s3_code_uri(mocker, fake_root_dir):
+    """
+    Test that a change is synced while the template also has a function whose code is in S3
+
+    Parameters:
+    - watch
+    - a template with a local function and an S3 {Bucket, Key} function
+    """
+    # Given
+    (fake_root_dir / "local" / "app").mkdir(parents=True)
+    (fake_root_dir / "local" / "app" / "handler.py").write_text("def handler(event, context): return 1\n")
+    (fake_root_dir / SAM_TEMPLATE_TXT).write_text("""
+Globals:
+  Function:
+    Runtime: python3.11
+Resources:
+  Local:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: local
+      Handler: app.handler.handler
+  Remote:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri:
+        Bucket: artifacts
+        Key: remote.zip
+      Handler: app.handler.handler
+""")
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    _ = mocker.patch("poetry_aws_sam.sam.Sam.invoke_sam_build", return_value=MagicMock(returncode=0))
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.build_lambda")
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_watcher = mocker.patch("poetry_aws_sam.sam.PollingWatcher")
+    patch_watcher.return_value.wait.side_effect = [{"Local": {"app/handler.py"}}, KeyboardInterrupt()]
+    (fake_root_dir / SAM_BUILD_DIR_NAME / "Local" / "app").mkdir(parents=True)
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute("--watch")
+
+    # Then
+    # test: only the local function is watched and its change was copied
+    assert set(patch_watcher.call_args.args[0]) == {"Local", "poetry.lock", "template"}
+    output = command_tester.io.fetch_output()
+    assert "Local: 1 file(s) copied, 0 removed" in output
+    assert "Stopped watching" in output
+
+
+def test_execute_function_projects(mocker, fake_root_dir):
+    """
+    Test that the functions with their own Poetry project are installed from their lock
+    and the others from the root lock
+
+    Parameters:
+    - jobs set to 3
+    - two lambdas of one function project, one lambda of the root project
+    """
+    # Given
+    project_dir = fake_root_dir / "services" / "orders"
+    project_dir.mkdir(parents=True)
+    (project_dir / "pyproject.toml").write_text(
+        '[tool.poetry]\nname = "orders"\nversion = "0.1.0"\ndescription = ""\nauthors = []\n\n'
+        '[tool.poetry.dependencies]\npython = "^3.10"\n'
+    )
+    (project_dir / "poetry.lock").write_text("")
+    aws_lambdas = [
+        AwsLambda(name="Orders", path=Path("app"), project_dir=project_dir),
+        AwsLambda(name="OrdersQueue", path=Path("app"), project_dir=project_dir),
+        AwsLambda(name="Root", path=Path("app")),
+    ]
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = aws_lambdas
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    exported = []
+
+    def fake_export_lock(options, poetry, io):
+        name = poetry.package.name
+
+        def fake_handle(requirements_file):
+            exported.append(name)
+            requirements_file.write_text(f"{name}==1.0\n", encoding="utf-8")
+            return 0
+
+        export_lock = MagicMock()
+        export_lock.cache_key.return_value = name
+        export_lock.handle.side_effect = fake_handle
+        return export_lock
+
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock", side_effect=fake_export_lock)
+
+    installed = {}
+
+    def fake_run_process(args, **kwargs):
+        requirements_file = Path(args[args.index("-r") + 1])
+        installed[requirements_file.parts[-3]] = requirements_file.read_text()
+
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_run_process)
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute("--jobs 3")
+
+    # Then
+    # test: each lock was exported once
+    assert sorted(exported) == sorted(["orders", application.poetry.package.name])
+    # test: the functions got the requirements of their project
+    assert installed == {
+        "Orders": "orders==1.0\n",
+        "OrdersQueue": "orders==1.0\n",
+        "Root": f"{application.poetry.package.name}==1.0\n",
+    }
+    assert "Orders: installing the poetry.lock of services/orders" in command_tester.io.fetch_output()
+
+
+def test_execute_tree_cache(mocker, fake_root_dir, tmp_path):
+    """
+    Test that the installed dependencies are reused from the tree cache by a second build
+    and that the cache commands list and remove them
+
+    Parameters:
+    - tree-cache with a tree cache dir
+    - one lambda, built twice
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("pyyaml==6.0.1\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    def fake_run_process(args, **kwargs):
+        Path(args[args.index("-t") + 1], "yaml").mkdir(parents=True)
+        Path(args[args.index("-t") + 1], "yaml", "__init__.py").write_text("")
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_run_process)
+
+    application = Application()
+    application.add(SamCommand())
+    application.add(TreeCacheStatsCommand())
+    application.add(TreeCacheClearCommand())
+    tree_cache_dir = tmp_path / "trees"
+
+    # When
+    CommandTester(application.find("sam")).execute(f"--tree-cache --tree-cache-dir {tree_cache_dir}")
+    shutil.rmtree(fake_root_dir / SAM_BUILD_DIR_NAME)
+    second_run = CommandTester(application.find("sam"))
+    second_run.execute(f"--tree-cache --tree-cache-dir {tree_cache_dir}")
+    stats = CommandTester(application.find("sam cache stats"))
+    stats.execute(f"--tree-cache-dir {tree_cache_dir}")
+    clear = CommandTester(application.find("sam cache clear"))
+    clear.execute(f"--tree-cache-dir {tree_cache_dir}")
+
+    # Then
+    # test: pip ran for the first build only
+    patch_run_process.assert_called_once()
+    assert "1: linked dependencies from the tree cache" in second_run.io.fetch_output()
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "1" / "yaml" / "__init__.py").exists()
+    # test: the cache commands see the tree
+    assert f"1 tree(s), 0 B in {tree_cache_dir}" in stats.io.fetch_output()
+    assert f"1 tree(s), 0 B removed from {tree_cache_dir}" in clear.io.fetch_output()
+
+
+def test_execute_pip_output(mocker, fake_root_dir):
+    """
+    Test that pip's output is streamed at -vv, logged per function with --logs
+    and its last lines are shown when it fails
+
+    Parameters:
+    - logs, very verbose
+    - one lambda, with a failing pip
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+    _ = mocker.patch("poetry_aws_sam.sam.ExportLock")
+
+    failing_pip = "print('Collecting pyyaml==6.0.1'); print('ERROR: No matching distribution'); raise SystemExit(1)"
+
+    def fake_pip(args, **kwargs):
+        return run_process([sys.executable, "-c", failing_pip], **kwargs)
+
+    _ = mocker.patch("poetry_aws_sam.sam.run_process", side_effect=fake_pip)
+
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    with pytest.raises(SystemExit):
+        command_tester.execute("--logs", verbosity=Verbosity.VERY_VERBOSE)
+
+    # Then
+    # test: the output was streamed with the function's name
+    assert "1: Collecting pyyaml==6.0.1" in command_tester.io.fetch_output()
+    # test: the failure shows the last lines of pip's output
+    assert "ERROR: No matching distribution" in command_tester.io.fetch_error()
+    # test: the full output is in the function's log
+    log = (fake_root_dir / ".aws-sam" / "logs" / "1.log").read_text()
+    assert "Collecting pyyaml==6.0.1\nERROR: No matching distribution\n" in log
+
+
+def test_execute_installer_unpack(mocker, fake_root_dir, tmp_path):
+    """
+    Test that the unpack installer extracts the wheels of the wheelhouse without running pip
+
+    Parameters:
+    - installer set to unpack, without --wheelhouse
+    - one lambda, its wheel already in the wheelhouse
+    """
+    # Given
+    patch_sam = mocker.patch("poetry_aws_sam.sam.Sam", return_value=MagicMock())
+    patch_sam.return_value.lambdas = [fake_aws_lambda_one]
+    patch_sam.return_value.invoke_sam_build.return_value.returncode = 0
+
+    _ = mocker.patch("poetry_aws_sam.sam.AwsBuilder.root_dir", new_callable=PropertyMock(return_value=fake_root_dir))
+
+    def fake_handle(requirements_file):
+        requirements_file.write_text("tinypkg==1.0\n", encoding="utf-8")
+        return 0
+
+    patch_export_lock = mocker.patch("poetry_aws_sam.sam.ExportLock")
+    patch_export_lock.return_value.handle.side_effect = fake_handle
+
+    tag_dir = Wheelhouse(tmp_path).tag_dir(InstallTarget())
+    tag_dir.mkdir(parents=True)
+    with zipfile.ZipFile(tag_dir / "tinypkg-1.0-py3-none-any.whl", "w") as wheel:
+        wheel.writestr("tinypkg/__init__.py", "VALUE = 1\n")
+        wheel.writestr("tinypkg-1.0.dist-info/METADATA", "Metadata-Version: 2.1\nName: tinypkg\nVersion: 1.0\n")
+
+    patch_run_process = mocker.patch("poetry_aws_sam.sam.run_process")
+    # When
+    application = Application()
+    application.add(SamCommand())
+
+    command = application.find("sam")
+    command_tester = CommandTester(command)
+    command_tester.execute(f"--installer unpack --wheelhouse-dir {tmp_path} --timings")
+
+    # Then
+    # test: neither pip download nor pip install ran
+    patch_run_process.assert_not_called()
+    # test: the wheel was extracted into the function
+    assert (fake_root_dir / SAM_BUILD_DIR_NAME / "1" / "tinypkg" / "__init__.py").read_text() == "VALUE = 1\n"
+    assert "unpack" in command_tester.io.fetch_output()
+
+
+def test_execute_wheelhouse_prune(tmp_path):
+    """
+    Test that only an explicit wheelhouse dir is pruned
+
+    Parameters:
+    - without --wheelhouse-dir, then with one holding a wheel outside the locks
+    - a template with a function that has its own Poetry project
+    """
+    # Given
+    application = Application()
+    application.add(WheelhousePruneCommand())
+    wheelhouse_dir = tmp_path / "wheelhouse"
+    tag_dir = wheelhouse_dir / "manylinux2014_x86_64-cp311"
+    tag_dir.mkdir(parents=True)
+    (tag_dir / "not_locked-1.0-py3-none-any.whl").touch()
+    (tag_dir / "orders_only-2.0-py3-none-any.whl").touch()
+    project_dir = tmp_path / "orders"
+    (project_dir / "app").mkdir(parents=True)
+    (project_dir / "pyproject.toml").write_text(
+        '[tool.poetry]\nname = "orders"\nversion = "0.1.0"\ndescription = ""\nauthors = []\n\n'
+        '[tool.poetry.dependencies]\npython = "^3.10"\n'
+    )
+    (project_dir / "poetry.lock").write_text(
+        '[[package]]\nname = "orders-only"\nversion = "2.0"\ndescription = ""\noptional = false\n'
+        'python-versions = "*"\nfiles = []\n\n'
+        '[metadata]\nlock-version = "2.0"\npython-versions = "^3.10"\ncontent-hash = ""\n'
+    )
+    template = tmp_path / "template.yaml"
+    template.write_text(
+        "Resources:\n  Orders:\n    Type: AWS::Serverless::Function\n    Properties:\n"
+        "      CodeUri: orders\n      Handler: app.handler.handler\n      Runtime: python3.11\n"
+    )
+
+    # When
+    default = CommandTester(application.find("sam wheelhouse prune"))
+    default_status = default.execute()
+    explicit = CommandTester(application.find("sam wheelhouse prune"))
+    explicit_status = explicit.execute(f"--wheelhouse-dir {wheelhouse_dir} --sam-template {template}")
+
+    # Then
+    # test: the shared default wheelhouse is left alone
+    assert default_status == 1
+    assert "shared by every project" in default.io.fetch_error()
+    # test: the wheel outside the lock is removed from the explicit one
+    assert explicit_status == 0
+    output = explicit.io.fetch_output()
+    assert "Removed not_locked-1.0-py3-none-any.whl" in output
+    # test: the wheels locked by the function's own project are kept
+    assert "Keeping the wheels of" in output
+    assert [wheel.name for wheel in tag_dir.iterdir()] == ["orders_only-2.0-py3-none-any.whl"]
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+from poetry_aws_sam.imports import find_imports, prune_unused
+
+
+def fake_distribution(target: Path, name: str, version: str, module: str, top_level: str = "") -> None:
+    (target / module).mkdir(parents=True)
+    (target / module / "__init__.py").write_text("")
+    dist_info = target / f"{name}-{version}.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+    (dist_info / "RECORD").write_text(
+        f"{module}/__init__.py,,\n{dist_info.name}/METADATA,,\n{dist_info.name}/RECORD,,\n"
+    )
+    if top_level:
+        (dist_info / "top_level.txt").write_text(f"{top_level}\n")
+
+
+def test_find_imports(tmp_path):
+    """
+    Test that imports are followed through local modules, including relative imports
+    """
+    # Given
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "__init__.py").write_text("")
+    (tmp_path / "app" / "handler.py").write_text("import json\nfrom .service import run\n")
+    (tmp_path / "app" / "service.py").write_text("def run():\n    import requests\n")
+
+    # When
+    imports = find_imports(tmp_path, "app.handler", ignore=set())
+
+    # Then
+    assert imports == {"json", "requests"}
+
+
+def test_prune_unused(tmp_path):
+    """
+    Test that packages outside the closure of the handler's imports are removed
+
+    Parameters:
+    - handler imports requests, which depends on urllib3
+    - numpy is installed but not imported
+    - pandas is kept through the allowlist
+    """
+    # Given
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "handler.py").write_text("import requests\n")
+    fake_distribution(tmp_path, "requests", "2.31.0", "requests")
+    fake_distribution(tmp_path, "urllib3", "2.1.0", "urllib3")
+    fake_distribution(tmp_path, "numpy", "1.26.0", "numpy")
+    fake_distribution(tmp_path, "pandas", "2.1.0", "pandas")
+    lock_data = {
+        "package": [
+            {"name": "requests", "dependencies": {"urllib3": ">=1.21"}},
+            {"name": "urllib3"},
+            {"name": "numpy"},
+            {"name": "pandas", "dependencies": {"numpy": ">=1.22"}},
+        ]
+    }
+
+    # When
+    removed_with_keep = prune_unused(tmp_path, "app.handler.handler", lock_data, keep=["pandas"])
+
+    # Then
+    # test: pandas and its numpy dependency are kept through the allowlist
+    assert removed_with_keep == []
+
+    # When
+    removed = prune_unused(tmp_path, "app.handler.handler", lock_data)
+
+    # Then
+    # test: the packages not imported are removed with their files
+    assert removed == ["numpy", "pandas"]
+    assert not (tmp_path / "numpy").exists()
+    assert not (tmp_path / "numpy-1.26.0.dist-info").exists()
+    # test: the imported package and its dependency are left
+    assert (tmp_path / "requests" / "__init__.py").exists()
+    assert (tmp_path / "urllib3" / "__init__.py").exists()
+
+
+def test_prune_unused_namespace_packages(tmp_path):
+    """
+    Test that the distributions sharing an imported namespace package are kept
+
+    Parameters:
+    - protobuf and google-cloud-storage both with the top level google
+    - the handler imports google.cloud.storage
+    """
+    # Given
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "handler.py").write_text("from google.cloud import storage\n")
+    fake_distribution(tmp_path, "google-cloud-storage", "2.14.0", "google/cloud/storage", top_level="google")
+    fake_distribution(tmp_path, "protobuf", "4.25.1", "google/protobuf", top_level="google")
+    fake_distribution(tmp_path, "numpy", "1.26.0", "numpy")
+    lock_data = {"package": [{"name": "google-cloud-storage"}, {"name": "protobuf"}, {"name": "numpy"}]}
+
+    # When
+    removed = prune_unused(tmp_path, "app.handler.handler", lock_data)
+
+    # Then
+    # test: every distribution of the namespace is kept
+    assert removed == ["numpy"]
+    assert (tmp_path / "google" / "cloud" / "storage" / "__init__.py").exists()
+    assert (tmp_path / "google-cloud-storage-2.14.0.dist-info").exists()
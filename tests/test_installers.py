@@ -0,0 +1,184 @@
+import hashlib
+import os
+import shutil
+import stat
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from poetry_aws_sam.installers import (
+    Installer,
+    InstallerError,
+    PipInstaller,
+    UnpackInstaller,
+    UvInstaller,
+    create_installer,
+)
+from poetry_aws_sam.platforms import HOST_PYTHON_VERSION, InstallTarget
+from poetry_aws_sam.process import run_process
+
+# metadata that each installer writes its own way
+INSTALLER_METADATA = {"INSTALLER", "RECORD", "REQUESTED", "direct_url.json"}
+
+
+def make_wheel(wheel_dir: Path, name: str, version: str, tag: str, files: dict) -> Path:
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        **files,
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        f"{dist_info}/WHEEL": f"Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: {tag}\n",
+    }
+    records = [f"{path},,\n" for path in files] + [f"{dist_info}/RECORD,,\n"]
+    wheel = wheel_dir / f"{name}-{version}-{tag}.whl"
+    with zipfile.ZipFile(wheel, "w") as archive:
+        for path, content in files.items():
+            info = zipfile.ZipInfo(path)
+            info.external_attr = (stat.S_IFREG | (0o755 if "/scripts/" in path else 0o644)) << 16
+            archive.writestr(info, content)
+        archive.writestr(f"{dist_info}/RECORD", "".join(records))
+    return wheel
+
+
+def sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@pytest.fixture
+def wheelhouse(tmp_path):
+    """
+    A pure wheel with data and scripts, and a package with both a manylinux and a pure wheel.
+    """
+    wheel_dir = tmp_path / "wheels"
+    wheel_dir.mkdir()
+    tiny = make_wheel(
+        wheel_dir,
+        "tinypkg",
+        "1.0",
+        "py3-none-any",
+        {
+            "tinypkg/__init__.py": "VALUE = 1\n",
+            "tinypkg/data.json": "{}\n",
+            "tinypkg-1.0.data/purelib/tinypkg_extra.py": "EXTRA = 1\n",
+            "tinypkg-1.0.data/scripts/tinytool": "#!python\nimport tinypkg\n",
+        },
+    )
+    platform_tag = f"cp{HOST_PYTHON_VERSION}-cp{HOST_PYTHON_VERSION}-manylinux_2_17_x86_64.manylinux2014_x86_64"
+    native = make_wheel(wheel_dir, "tinynative", "2.0", platform_tag, {"tinynative/__init__.py": "NATIVE = True\n"})
+    pure = make_wheel(wheel_dir, "tinynative", "2.0", "py3-none-any", {"tinynative/__init__.py": "NATIVE = False\n"})
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text(
+        f"tinypkg==1.0 ; python_version >= '3.8' \\\n    --hash=sha256:{sha256(tiny)}\n"
+        f"tinynative==2.0 \\\n    --hash=sha256:{sha256(native)} \\\n    --hash=sha256:{sha256(pure)}\n"
+        f"tinywin==1.0 ; sys_platform == 'win32' \\\n    --hash=sha256:{'0' * 64}\n"
+    )
+    return wheel_dir, requirements
+
+
+def tree(path: Path) -> dict:
+    """
+    The files of an installed tree with their content, the compiled modules by name only.
+    """
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            file_path = Path(root) / name
+            relative = file_path.relative_to(path).as_posix()
+            if name in INSTALLER_METADATA and ".dist-info/" in relative:
+                continue
+            if name.endswith(".pyc"):
+                files[relative] = None
+            else:
+                files[relative] = (file_path.read_bytes(), os.access(file_path, os.X_OK))
+    return files
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "unpack",
+        pytest.param("uv", marks=pytest.mark.skipif(shutil.which("uv") is None, reason="uv is not on PATH")),
+    ],
+)
+def test_same_trees(tmp_path, wheelhouse, name):
+    """
+    Test that an installer lays out the same tree as pip
+
+    Parameters:
+    - the unpack installer, and uv when it is on PATH
+    - pure, platform, data and script files, a requirement excluded by its marker
+    """
+    # Given
+    wheel_dir, requirements = wheelhouse
+    install = InstallTarget()
+
+    def run(args):
+        run_process(args)
+
+    # When
+    PipInstaller(run).install(requirements, tmp_path / "pip", install, find_links=wheel_dir)
+    create_installer(name, run).install(requirements, tmp_path / name, install, find_links=wheel_dir)
+
+    # Then
+    # test: the trees have the same files, content and modes
+    pip_tree = tree(tmp_path / "pip")
+    assert tree(tmp_path / name) == pip_tree
+    # test: the platform wheel was preferred and the data and scripts were installed
+    assert pip_tree["tinynative/__init__.py"][0] == b"NATIVE = True\n"
+    assert "tinypkg_extra.py" in pip_tree
+    assert pip_tree["bin/tinytool"][1]
+    assert not any(path.startswith("tinywin") for path in pip_tree)
+
+
+def test_unpack_errors(tmp_path, wheelhouse):
+    """
+    Test that the unpack installer fails on a missing wheel, a hash mismatch and without a wheelhouse
+    """
+    # Given
+    wheel_dir, requirements = wheelhouse
+    installer = UnpackInstaller()
+    missing = tmp_path / "missing.txt"
+    missing.write_text("tinypkg==1.1\n")
+    mismatch = tmp_path / "mismatch.txt"
+    mismatch.write_text(f"tinypkg==1.0 --hash=sha256:{'0' * 64}\n")
+
+    # When, Then
+    # test: no wheel of the pinned version
+    with pytest.raises(InstallerError, match="No wheel of tinypkg==1.1"):
+        installer.install(missing, tmp_path / "target", InstallTarget(), find_links=wheel_dir)
+    # test: the wheel does not have the required hash
+    with pytest.raises(InstallerError, match="hash of tinypkg-1.0-py3-none-any.whl"):
+        installer.install(mismatch, tmp_path / "target", InstallTarget(), find_links=wheel_dir)
+    # test: the pure wheel is installed on arm64, which the platform wheel is not for
+    assert [wheel.name for wheel, _ in installer.wheels("tinynative==2.0\n", InstallTarget("arm64"), wheel_dir)] == [
+        "tinynative-2.0-py3-none-any.whl"
+    ]
+    # test: there is no wheelhouse to install from
+    with pytest.raises(InstallerError, match="only installs from the wheelhouse"):
+        installer.install(requirements, tmp_path / "target", InstallTarget())
+
+
+def test_uv_args(mocker):
+    """
+    Test the uv command of a lambda, the fallback to pip when uv is not on PATH and the installer base class
+    """
+    # Given
+    install = InstallTarget(architecture="arm64", python_version="312")
+    _ = mocker.patch("poetry_aws_sam.installers.shutil.which", return_value=None)
+
+    # When
+    args = UvInstaller(print, "/bin/uv").args(Path("r.txt"), Path("build"), install, find_links=Path("wheels"))
+
+    # Then
+    # test: uv gets the platform and python version of the lambda
+    assert args[:3] == ["/bin/uv", "pip", "install"]
+    assert args[args.index("--python-platform") + 1] == "aarch64-manylinux_2_28"
+    assert args[args.index("--python-version") + 1] == "3.12"
+    assert args[-3:] == ["--no-index", "--find-links", "wheels"]
+    # test: without uv, pip installs
+    assert isinstance(create_installer("uv", print), PipInstaller)
+    with pytest.raises(InstallerError, match="Unknown installer 'poetry'"):
+        create_installer("poetry", print)
+    # test: an installer has to implement install
+    with pytest.raises(TypeError, match="abstract method install"):
+        Installer()
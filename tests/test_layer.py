@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from poetry_aws_sam.aws import AwsLambda
+from poetry_aws_sam.layer import attach_layer, dependency_layers
+from poetry_aws_sam.platforms import InstallTarget
+from poetry_aws_sam.template import read_template
+
+
+def test_attach_layer(tmp_path):
+    """
+    Test that the layer is added to the template and referenced by the python lambdas,
+    keeping the intrinsic functions of the template
+    """
+    # Given
+    template_file = tmp_path / "template.yaml"
+    template_file.write_text("""
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      Handler: app.handler.handler
+      Runtime: python3.11
+      Layers:
+        - !Ref OtherLayer
+      Role: !GetAtt Role.Arn
+  Node:
+    Type: AWS::Serverless::Function
+    Properties:
+      Handler: index.handler
+      Runtime: nodejs20.x
+""")
+    aws_lambdas = [AwsLambda(name="One", path=Path("app"), runtime="python3.11")]
+
+    # When
+    template = attach_layer(
+        read_template(template_file), aws_lambdas, InstallTarget("x86_64", "311"), Path("../layers/abc")
+    )
+
+    # Then
+    # test: the layer resource points at the installed layer
+    layer = template["Resources"]["PoetrySamDependenciesLayerX8664Py311"]
+    assert layer["Type"] == "AWS::Serverless::LayerVersion"
+    assert layer["Properties"]["ContentUri"] == "../layers/abc"
+    assert layer["Properties"]["CompatibleRuntimes"] == ["python3.11"]
+    assert layer["Properties"]["CompatibleArchitectures"] == ["x86_64"]
+    # test: the python lambda references the layer after its own layers
+    properties = template["Resources"]["One"]["Properties"]
+    assert properties["Layers"] == [{"Ref": "OtherLayer"}, {"Ref": "PoetrySamDependenciesLayerX8664Py311"}]
+    assert properties["Role"] == {"Fn::GetAtt": ["Role", "Arn"]}
+    assert dependency_layers(template, "One") == ["PoetrySamDependenciesLayerX8664Py311"]
+    # test: other lambdas are untouched
+    assert "Layers" not in template["Resources"]["Node"]["Properties"]
+
+
+def test_attach_layer_of_project():
+    """
+    Test that the layer of a function's own Poetry project gets a resource of its own
+    """
+    # Given
+    template = {"Resources": {"Orders": {"Type": "AWS::Serverless::Function", "Properties": {}}}}
+    aws_lambdas = [AwsLambda(name="Orders", path=Path("app"), runtime="python3.12")]
+
+    # When
+    template = attach_layer(
+        template, aws_lambdas, InstallTarget("arm64", "312"), Path("../layers/abc"), project="services/orders"
+    )
+
+    # Then
+    layer_name = "PoetrySamDependenciesLayerServicesOrdersArm64Py312"
+    assert template["Resources"][layer_name]["Properties"]["Description"].endswith("services/orders/poetry.lock")
+    assert template["Resources"]["Orders"]["Properties"]["Layers"] == [{"Ref": layer_name}]
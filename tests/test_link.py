@@ -0,0 +1,35 @@
+import os
+
+from poetry_aws_sam.link import COPY, HARDLINK, REFLINK, link_tree
+
+
+def test_link_tree(tmp_path):
+    """
+    Test that a staged tree is mirrored byte for byte into a build dir
+    that already holds the function code
+    """
+    # Given
+    staging = tmp_path / "staging"
+    (staging / "pkg").mkdir(parents=True)
+    (staging / "pkg" / "__init__.py").write_text("VALUE = 1\n")
+    (staging / "pkg" / "data.bin").write_bytes(b"\x00\x01")
+    build = tmp_path / "build"
+    (build / "pkg").mkdir(parents=True)
+    (build / "pkg" / "__init__.py").write_text("stale\n")
+    (build / "app.py").write_text("handler\n")
+
+    # When
+    methods = link_tree(staging, build)
+
+    # Then
+    # test: every staged file was placed with one of the methods
+    assert sum(methods.values()) == 2
+    assert set(methods) <= {REFLINK, HARDLINK, COPY}
+    # test: content is identical and stale files are replaced
+    assert (build / "pkg" / "__init__.py").read_text() == "VALUE = 1\n"
+    assert (build / "pkg" / "data.bin").read_bytes() == b"\x00\x01"
+    # test: the function code is untouched
+    assert (build / "app.py").read_text() == "handler\n"
+    # test: hard links share the inode with the staged file
+    if methods[HARDLINK]:
+        assert os.path.samefile(staging / "pkg" / "data.bin", build / "pkg" / "data.bin")
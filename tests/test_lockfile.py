@@ -0,0 +1,208 @@
+from pathlib import Path
+
+import pytest
+import tomlkit
+from cleo.io.buffered_io import BufferedIO
+from cleo.io.null_io import NullIO
+from poetry.factory import Factory
+from poetry_plugin_export.exporter import Exporter
+
+from poetry_aws_sam.lockfile import UnsupportedLock, clear_lock_cache, fast_export
+
+HASH = "sha256:" + "a" * 64
+
+PYPROJECT = """\
+[tool.poetry]
+name = "lock-project"
+version = "0.1.0"
+description = ""
+authors = []
+packages = []
+
+[tool.poetry.dependencies]
+python = "{python}"
+{dependencies}
+
+[tool.poetry.group.dev.dependencies]
+{dev_dependencies}
+"""
+
+
+def write_project(root, packages, dependencies, dev_dependencies="", python="^3.10"):
+    """
+    Write a pyproject.toml and a fresh poetry.lock holding `packages`.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "pyproject.toml").write_text(
+        PYPROJECT.format(python=python, dependencies=dependencies, dev_dependencies=dev_dependencies)
+    )
+    lock = tomlkit.document()
+    lock["package"] = packages
+    lock["metadata"] = {
+        "lock-version": "2.0",
+        "python-versions": python,
+        "content-hash": Factory().create_poetry(root).locker._get_content_hash(),
+    }
+    (root / "poetry.lock").write_text(tomlkit.dumps(lock))
+    clear_lock_cache()
+    return Factory().create_poetry(root)
+
+
+def package(name, version, python="*", dependencies=None, optional=False, files=None):
+    locked = {
+        "name": name,
+        "version": version,
+        "description": "",
+        "optional": optional,
+        "python-versions": python,
+        "files": files if files is not None else [{"file": f"{name}-{version}-py3-none-any.whl", "hash": HASH}],
+    }
+    if dependencies:
+        locked["dependencies"] = dependencies
+    return locked
+
+
+def exporter_output(poetry, groups, with_hashes=True):
+    exporter = Exporter(poetry, NullIO())
+    exporter.only_groups(groups)
+    exporter.with_hashes(with_hashes)
+    output = BufferedIO()
+    exporter.export("requirements.txt", Path.cwd(), output)
+    return output.fetch_output()
+
+
+PROJECTS = {
+    "chain": dict(
+        packages=[
+            package("alpha", "1.0.0", dependencies={"beta": ">=1.0"}),
+            package("beta", "2.1.0", dependencies={"gamma": "*"}),
+            package("gamma", "0.3.0", python=">=3.8"),
+        ],
+        dependencies='alpha = "^1.0"',
+    ),
+    "markers": dict(
+        packages=[
+            package(
+                "app-lib",
+                "1.2.0",
+                python=">=3.7,<4.0",
+                dependencies={
+                    "colorama": {"version": "*", "markers": 'sys_platform == "win32"'},
+                    "tomli": {"version": ">=1.1.0", "python": "<3.11"},
+                    "typing-extensions": {"version": ">=4", "markers": 'python_version < "3.12"'},
+                    "shared": "*",
+                },
+            ),
+            package("colorama", "0.4.6", python=">=2.7,!=3.0.*,!=3.1.*"),
+            package("tomli", "2.0.1", python=">=3.7"),
+            package(
+                "typing-extensions",
+                "4.12.2",
+                python=">=3.8",
+                files=[
+                    {"file": "typing_extensions-4.12.2.tar.gz", "hash": "sha256:" + "b" * 64},
+                    {"file": "typing_extensions-4.12.2-py3-none-any.whl", "hash": "md5:" + "c" * 32},
+                ],
+            ),
+            package(
+                "other-lib",
+                "3.0.0",
+                dependencies={"shared": {"version": "*", "markers": 'platform_machine == "aarch64"'}},
+            ),
+            package("shared", "1.0.0", python=">=3.9"),
+        ],
+        dependencies='app-lib = "^1.2"\nother-lib = {version = "^3.0", markers = "sys_platform == \'linux\'"}',
+    ),
+    "extras of dependencies": dict(
+        packages=[
+            dict(
+                package(
+                    "cachecontrol",
+                    "0.14.1",
+                    dependencies={
+                        "msgpack": ">=0.5.2,<2.0.0",
+                        "filelock": {"version": ">=3.8.0", "optional": True},
+                        "redis": {"version": ">=2.10.5", "optional": True},
+                    },
+                ),
+                extras={"filecache": ["filelock (>=3.8.0)"], "redis": ["redis (>=2.10.5)"]},
+            ),
+            package("client", "1.0.0", dependencies={"cachecontrol": {"version": "*", "extras": ["filecache"]}}),
+            package("msgpack", "1.1.0", python=">=3.8"),
+            package("filelock", "3.16.1", python=">=3.8"),
+            package("redis", "5.0.0", optional=True),
+        ],
+        dependencies='client = "*"\ncachecontrol = "*"',
+    ),
+    "groups and optional": dict(
+        packages=[
+            package("alpha", "1.0.0"),
+            package("pytest", "8.0.0", dependencies={"pluggy": ">=1"}),
+            package("pluggy", "1.5.0", python=">=3.8"),
+            package("boto3", "1.34.0", optional=True),
+        ],
+        dependencies='alpha = "*"\nboto3 = {version = "*", optional = true}\n\n[tool.poetry.extras]\naws = ["boto3"]',
+        dev_dependencies='pytest = "^8"',
+    ),
+}
+
+
+@pytest.mark.parametrize("name", sorted(PROJECTS))
+@pytest.mark.parametrize("groups", [["main"], ["main", "dev"]])
+@pytest.mark.parametrize("with_hashes", [True, False])
+def test_fast_export_matches_exporter(tmp_path, name, groups, with_hashes):
+    """
+    Test that the fast export writes the same requirements as the Exporter
+    """
+    # Given
+    poetry = write_project(tmp_path / "project", **PROJECTS[name])
+
+    # When
+    fast = fast_export(poetry, groups, [], with_hashes=with_hashes)
+
+    # Then
+    assert fast == exporter_output(poetry, groups, with_hashes)
+
+
+@pytest.mark.parametrize("groups", [["main"], ["main", "dev"]])
+def test_fast_export_matches_exporter_on_this_project(groups):
+    """
+    Test the fast export against the Exporter on the lock of this repository
+    """
+    # Given
+    poetry = Factory().create_poetry(Path(__file__).parents[1])
+    if not poetry.locker.is_fresh():
+        pytest.skip("poetry.lock is not fresh")
+
+    # When
+    fast = fast_export(poetry, groups, [], with_hashes=True)
+
+    # Then
+    assert fast == exporter_output(poetry, groups)
+
+
+def test_fast_export_unsupported(tmp_path):
+    """
+    Test that the locks and options the fast export does not handle are left to the Exporter
+    """
+    # Given
+    git_package = package("alpha", "1.0.0", files=[])
+    git_package["source"] = {"type": "git", "url": "https://example.com/alpha.git", "reference": "main"}
+    poetry = write_project(tmp_path / "git", [git_package], 'alpha = {git = "https://example.com/alpha.git"}')
+
+    # When / Then
+    with pytest.raises(UnsupportedLock, match="git"):
+        fast_export(poetry, ["main"], [], with_hashes=True)
+    with pytest.raises(UnsupportedLock, match="extras"):
+        fast_export(poetry, ["main"], ["aws"], with_hashes=True)
+
+    # Given
+    poetry = write_project(tmp_path / "stale", [package("alpha", "1.0.0")], 'alpha = "*"')
+    (tmp_path / "stale" / "pyproject.toml").write_text(
+        (tmp_path / "stale" / "pyproject.toml").read_text().replace('alpha = "*"', 'alpha = "^2.0"')
+    )
+    poetry = Factory().create_poetry(tmp_path / "stale")
+
+    # When / Then
+    with pytest.raises(UnsupportedLock, match="not consistent"):
+        fast_export(poetry, ["main"], [], with_hashes=True)
@@ -0,0 +1,78 @@
+from pathlib import Path
+
+from poetry_aws_sam.aws import AwsLambda
+from poetry_aws_sam.platforms import HOST_PYTHON_VERSION, InstallTarget, group_by_target, install_target, runs_on_host
+
+
+def test_install_target():
+    """
+    Test the platform tags and python version used for the pip install of a lambda
+    """
+    # Given
+    arm_lambda = AwsLambda(name="Arm", path=Path("app"), runtime="python3.12", architectures=["arm64"])
+    x86_lambda = AwsLambda(name="X86", path=Path("app"), runtime="python3.10")
+
+    # When
+    arm_target = install_target(arm_lambda)
+    x86_target = install_target(x86_lambda)
+
+    # Then
+    # test: arm64 lambdas get aarch64 wheels, with manylinux_2_28 from python 3.12 on
+    assert arm_target == InstallTarget(architecture="arm64", python_version="312")
+    assert arm_target.pip_args() == [
+        "--platform",
+        "manylinux2014_aarch64",
+        "--platform",
+        "manylinux_2_28_aarch64",
+        "--python-version",
+        "3.12",
+        "--implementation",
+        "cp",
+        "--abi",
+        "cp312",
+    ]
+    # test: the default architecture is x86_64
+    assert x86_target.platforms == ["manylinux2014_x86_64"]
+    assert x86_target.python_version == "310"
+
+
+def test_group_by_target():
+    """
+    Test that lambdas sharing an architecture and runtime are installed together
+    """
+    # Given
+    aws_lambdas = [
+        AwsLambda(name="One", path=Path("app"), runtime="python3.12", architectures=["arm64"]),
+        AwsLambda(name="Two", path=Path("app"), runtime="python3.12"),
+        AwsLambda(name="Three", path=Path("app"), runtime="python3.12", architectures=["arm64"]),
+    ]
+
+    # When
+    groups = group_by_target(aws_lambdas)
+
+    # Then
+    assert {target.key: [aws_lambda.name for aws_lambda in group] for target, group in groups.items()} == {
+        "arm64-cp312": ["One", "Three"],
+        "x86_64-cp312": ["Two"],
+    }
+
+
+def test_runs_on_host(mocker):
+    """
+    Test that the packages of a lambda are importable on a host of the same machine and python version
+
+    Parameters:
+    - an x86_64 host, then an arm64 Mac
+    """
+    # Given
+    patch_machine = mocker.patch("poetry_aws_sam.platforms.platform.machine", return_value="x86_64")
+
+    # When, Then
+    # test: the host's python version and machine
+    assert runs_on_host(InstallTarget("x86_64", HOST_PYTHON_VERSION))
+    # test: another machine or python version
+    assert not runs_on_host(InstallTarget("arm64", HOST_PYTHON_VERSION))
+    assert not runs_on_host(InstallTarget("x86_64", "27"))
+    # test: the machine names of the Macs
+    patch_machine.return_value = "arm64"
+    assert runs_on_host(InstallTarget("arm64", HOST_PYTHON_VERSION))
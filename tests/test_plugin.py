@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import poetry_aws_sam
+
+# cumulative import time of the plugin entry point, in ms, on top of the poetry modules loaded before plugins
+PLUGIN_IMPORT_BUDGET_MS = 50
+PRELOADED = "import poetry.console.application, poetry.plugins.application_plugin"
+HEAVY_MODULES = ["poetry_aws_sam.sam", "poetry_aws_sam.aws", "poetry_aws_sam.export", "poetry_plugin_export", "yaml"]
+
+
+def import_plugin():
+    script = (
+        f"{PRELOADED}; import sys; loaded = set(sys.modules); import poetry_aws_sam.plugin;"
+        f" print(','.join(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules and name not in loaded)))"
+    )
+    env = dict(os.environ, PYTHONPATH=str(Path(poetry_aws_sam.__file__).parent.parent))
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script], capture_output=True, text=True, check=True, env=env
+    )
+
+
+def cumulative_import_ms(importtime: str, module: str) -> float:
+    for line in importtime.splitlines():
+        _, _, timing = line.partition("import time:")
+        columns = [column.strip() for column in timing.split("|")]
+        if len(columns) == 3 and columns[2] == module:
+            return int(columns[1]) / 1000
+    raise AssertionError(f"{module} not in the -X importtime output")
+
+
+def test_plugin_import_is_lazy():
+    """
+    Test that loading the plugin entry point does not import the build modules
+    """
+    # When
+    result = import_plugin()
+
+    # Then
+    assert result.stdout.strip() == ""
+
+
+def test_plugin_import_time_budget():
+    """
+    Test that the plugin entry point imports within the budget
+    """
+    # When
+    result = import_plugin()
+
+    # Then
+    assert cumulative_import_ms(result.stderr, "poetry_aws_sam.plugin") < PLUGIN_IMPORT_BUDGET_MS
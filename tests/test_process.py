@@ -0,0 +1,60 @@
+import sys
+
+import pytest
+
+from poetry_aws_sam.process import ProcessError, run_process
+
+# writes more than a pipe buffer to both streams, then fails
+CHATTY_SCRIPT = """
+import sys
+for index in range(5000):
+    print(f"line {index} " + "x" * 40)
+    print(f"warning {index}", file=sys.stderr)
+sys.exit(3)
+"""
+
+
+def test_run_process_streams_and_keeps_the_tail(tmp_path):
+    """
+    Test that the output of a chatty process is streamed and logged while only its last lines are kept
+    """
+    # Given
+    streamed = []
+    log_file = tmp_path / "logs" / "One.log"
+
+    # When
+    with pytest.raises(ProcessError) as error:
+        run_process(
+            [sys.executable, "-u", "-c", CHATTY_SCRIPT], output=streamed.append, log_file=log_file, tail_lines=4
+        )
+
+    # Then
+    # test: every line of both streams was streamed
+    assert len(streamed) == 10000
+    assert streamed[0] == "line 0 " + "x" * 40
+    # test: the error holds the exit code and the last lines only
+    assert error.value.returncode == 3
+    assert error.value.result.tail == [
+        "line 4998 " + "x" * 40,
+        "warning 4998",
+        "line 4999 " + "x" * 40,
+        "warning 4999",
+    ]
+    assert "exited with 3" in str(error.value)
+    assert str(error.value).endswith("warning 4999")
+    # test: the log has the command and the full output
+    log = log_file.read_text().splitlines()
+    assert log[0].startswith(f"$ {sys.executable} -u -c")
+    assert len(log) == 1 + len(CHATTY_SCRIPT.splitlines()) + 10000
+
+
+def test_run_process_without_check():
+    """
+    Test that a failure is returned instead of raised without check
+    """
+    # When
+    result = run_process([sys.executable, "-c", "print('done'); raise SystemExit(1)"], check=False)
+
+    # Then
+    assert result.returncode == 1
+    assert result.output == "done"
@@ -0,0 +1,100 @@
+import json
+
+from poetry_aws_sam.report import function_report, parse_importtime, render_table, write_report
+
+
+def test_parse_importtime():
+    """
+    Test the parsing of the -X importtime output
+    """
+    # Given
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:        80 |        200 | json\n"
+        "Traceback (most recent call last):\n"
+    )
+
+    # When / Then
+    assert parse_importtime(output) == [("json.decoder", 120, 120), ("json", 80, 200)]
+
+
+def test_function_report(tmp_path):
+    """
+    Test the report of a built function: sizes, largest packages and handler import time
+    """
+    # Given
+    build_dir = tmp_path / "One"
+    (build_dir / "app").mkdir(parents=True)
+    (build_dir / "app" / "__init__.py").write_text("")
+    (build_dir / "app" / "handler.py").write_text("import bigpkg\n\ndef handler(event, context): ...\n")
+    (build_dir / "bigpkg").mkdir()
+    (build_dir / "bigpkg" / "__init__.py").write_text("import json\nDATA = '" + "x" * 10000 + "'\n")
+
+    # When
+    report = function_report("One", build_dir, "app.handler.handler")
+
+    # Then
+    # test: the zip is smaller than the files and the largest package comes first
+    assert 0 < report.zipped_size < report.unzipped_size
+    assert report.largest_packages[0][0] == "bigpkg"
+    # test: the handler was imported in a separate interpreter
+    assert report.import_error is None
+    assert report.import_time_us > 0
+    assert report.slowest_imports
+    # test: the table has a header and a row per function
+    assert render_table([report])[1].startswith("One ")
+    # test: the json report is machine readable
+    write_report(tmp_path / "report.json", [report])
+    data = json.loads((tmp_path / "report.json").read_text())
+    assert data["functions"][0]["name"] == "One"
+
+
+def test_function_report_import_error(tmp_path):
+    """
+    Test that a handler that fails to import is reported with the error
+    """
+    # Given
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "handler.py").write_text("import missing_package_for_report_test\n")
+
+    # When
+    report = function_report("One", tmp_path, "app.handler.handler")
+
+    # Then
+    assert report.import_time_us is None
+    assert "ModuleNotFoundError" in report.import_error
+
+
+def test_function_report_layer(tmp_path):
+    """
+    Test that the handler imports its packages from the dependencies layer, which counts
+    towards the size, without writing bytecode into the build dir
+
+    Parameters:
+    - a function built with its dependencies in a layer, then a function built for another host
+    """
+    # Given
+    build_dir = tmp_path / "One"
+    (build_dir / "app").mkdir(parents=True)
+    (build_dir / "app" / "handler.py").write_text("import layerpkg\n\ndef handler(event, context): ...\n")
+    layer_dir = tmp_path / "layers" / "x86_64-cp311-abc" / "python"
+    (layer_dir / "layerpkg").mkdir(parents=True)
+    (layer_dir / "layerpkg" / "__init__.py").write_text("DATA = '" + "x" * 10000 + "'\n")
+
+    # When
+    report = function_report("One", build_dir, "app.handler.handler", layer_dirs=[layer_dir])
+    skipped = function_report("One", build_dir, "app.handler.handler", skip_import="built for arm64-cp311")
+
+    # Then
+    # test: the layer is on sys.path after the code, the handler imports from it, and in the size
+    assert report.import_error is None
+    assert report.layer_size > 10000
+    assert report.total_size == report.unzipped_size + report.layer_size
+    # test: no __pycache__ was written into the build dir or the layer
+    assert not list(tmp_path.rglob("__pycache__"))
+    # test: the import is skipped and shown as such, not as an error
+    assert skipped.import_time_us is None
+    assert skipped.import_error is None
+    assert skipped.import_skipped == "built for arm64-cp311"
+    assert "skipped" in render_table([skipped])[1]
@@ -0,0 +1,58 @@
+import sys
+
+import pytest
+
+from poetry_aws_sam.platforms import InstallTarget
+from poetry_aws_sam.slim import DEFAULT_SLIM_RULES, SlimError, slim, slim_rules
+
+HOST_TARGET = InstallTarget(python_version=f"{sys.version_info.major}{sys.version_info.minor}")
+
+
+def test_slim(tmp_path):
+    """
+    Test that the default rules and precompile only remove what the runtime
+    does not need from the installed packages
+    """
+    # Given
+    (tmp_path / "app" / "tests").mkdir(parents=True)
+    (tmp_path / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+    (tmp_path / "pkg" / "tests").mkdir(parents=True)
+    (tmp_path / "pkg" / "__pycache__").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("VALUE = 1\n")
+    (tmp_path / "pkg" / "__init__.pyi").write_text("VALUE: int\n")
+    (tmp_path / "pkg" / "tests" / "test_pkg.py").write_text("def test(): ...\n")
+    (tmp_path / "pkg" / "__pycache__" / "__init__.cpython-39.pyc").write_bytes(b"0" * 100)
+    dist_info = tmp_path / "pkg-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text("Metadata-Version: 2.1\nName: pkg\nVersion: 1.0\n")
+    (dist_info / "RECORD").write_text("pkg/__init__.py,,\npkg/__init__.pyi,,\npkg/tests/test_pkg.py,,\n")
+    (dist_info / "top_level.txt").write_text("pkg\n")
+
+    # When
+    result = slim(tmp_path, list(DEFAULT_SLIM_RULES) + ["precompile"], HOST_TARGET)
+
+    # Then
+    # test: tests, stubs, host pycache and installer metadata are removed
+    assert not (tmp_path / "pkg" / "tests").exists()
+    assert not (tmp_path / "pkg" / "__init__.pyi").exists()
+    assert not (tmp_path / "pkg" / "__pycache__" / "__init__.cpython-39.pyc").exists()
+    assert not (dist_info / "RECORD").exists()
+    # test: runtime files and the function's own code are kept
+    assert (dist_info / "METADATA").exists()
+    assert (tmp_path / "app" / "tests").exists()
+    # test: pycs are compiled for the target runtime
+    assert list((tmp_path / "app" / "__pycache__").glob(f"handler.cpython-{HOST_TARGET.python_version}.pyc"))
+    assert result.before > 0 and result.after > 0
+
+
+def test_slim_rules_from_metadata():
+    """
+    Test that a function's template Metadata overrides the command line rules
+    """
+    # When / Then
+    assert slim_rules(["pycache"], {}) == ["pycache"]
+    assert slim_rules(["pycache"], {"PoetrySam": {"Slim": ["strip"]}}) == ["strip"]
+    assert slim_rules(["pycache"], {"PoetrySam": {"Slim": False}}) == []
+    assert slim_rules([], {"PoetrySam": {"Slim": True}}) == list(DEFAULT_SLIM_RULES)
+    with pytest.raises(SlimError):
+        slim_rules(["unknown"], {})
@@ -0,0 +1,150 @@
+import subprocess
+import zipfile
+
+import pytest
+
+from poetry_aws_sam.source_wheels import SourceWheels, source_of
+
+# an in-tree PEP 517 backend, so that building the wheel needs no index
+BACKEND = """
+import zipfile
+from pathlib import Path
+
+
+def build_wheel(wheel_directory, config_settings=None, metadata_directory=None):
+    version = Path("VERSION").read_text().strip()
+    dist_info = f"internal_lib-{version}.dist-info"
+    wheel_name = f"internal_lib-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(Path(wheel_directory) / wheel_name, "w") as wheel:
+        wheel.write("internal_lib.py")
+        wheel.writestr(f"{dist_info}/METADATA", f"Metadata-Version: 2.1\\nName: internal-lib\\nVersion: {version}\\n")
+        wheel.writestr(f"{dist_info}/WHEEL", "Wheel-Version: 1.0\\nRoot-Is-Purelib: true\\nTag: py3-none-any\\n")
+        wheel.writestr(f"{dist_info}/RECORD", "")
+    return wheel_name
+"""
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def write_project(project_dir, version, value):
+    project_dir.mkdir(parents=True, exist_ok=True)
+    (project_dir / "pyproject.toml").write_text(
+        '[build-system]\nrequires = []\nbuild-backend = "backend"\nbackend-path = ["."]\n'
+    )
+    (project_dir / "backend.py").write_text(BACKEND)
+    (project_dir / "VERSION").write_text(f"{version}\n")
+    (project_dir / "internal_lib.py").write_text(f"VALUE = {value}\n")
+
+
+@pytest.fixture
+def bare_repo(tmp_path):
+    """
+    A bare git repo of an internal package, with the working copy its commits are pushed from.
+    """
+    work_dir = tmp_path / "work"
+    write_project(work_dir, "1.0", 1)
+    git(work_dir, "init", "-q")
+    git(work_dir, "add", ".")
+    git(work_dir, "commit", "-q", "-m", "first")
+    git(tmp_path, "clone", "-q", "--bare", str(work_dir), str(tmp_path / "internal_lib.git"))
+    git(work_dir, "remote", "add", "origin", str(tmp_path / "internal_lib.git"))
+    return work_dir, f"git+file://localhost{(tmp_path / 'internal_lib.git').as_posix()}"
+
+
+def wheel_module(wheel_uri):
+    with zipfile.ZipFile(wheel_uri.split(" @ file://", 1)[1].split(" ", 1)[0]) as wheel:
+        return wheel.read("internal_lib.py").decode()
+
+
+def test_git_dependency_built_once_per_commit(bare_repo, tmp_path):
+    """
+    Test that a git dependency is built once per commit and then reused by later builds
+    """
+    # Given
+    work_dir, url = bare_repo
+    first_commit = git(work_dir, "rev-parse", "HEAD")
+    requirements = (
+        f'internal-lib @ {url}@{first_commit} ; python_version >= "3.8"\n' "pyyaml==6.0.1 \\\n    --hash=sha256:abc\n"
+    )
+
+    # When
+    first_text, first_built = SourceWheels(tmp_path / "cache").rewrite(requirements)
+    second_text, second_built = SourceWheels(tmp_path / "cache").rewrite(requirements)
+    write_project(work_dir, "1.1", 2)
+    git(work_dir, "commit", "-q", "-a", "-m", "second")
+    git(work_dir, "push", "-q", "origin", "HEAD")
+    second_commit = git(work_dir, "rev-parse", "HEAD")
+    third_text, third_built = SourceWheels(tmp_path / "cache").rewrite(
+        requirements.replace(first_commit, second_commit)
+    )
+
+    # Then
+    # test: the wheel of the first commit is built once
+    assert first_built == ["internal_lib-1.0-py3-none-any.whl"]
+    assert second_built == []
+    assert first_text == second_text
+    # test: the git line points at the wheel, with its marker and hash as the other lines have hashes
+    git_line, pin_line = first_text.splitlines()
+    assert git_line.startswith("internal-lib @ file://")
+    assert 'python_version >= "3.8"' in git_line
+    assert " --hash=sha256:" in git_line
+    assert pin_line == "pyyaml==6.0.1 --hash=sha256:abc"
+    assert wheel_module(git_line) == "VALUE = 1\n"
+    # test: a new commit gets a wheel of its own
+    assert third_built == ["internal_lib-1.1-py3-none-any.whl"]
+    assert wheel_module(third_text.splitlines()[0]) == "VALUE = 2\n"
+
+
+def test_path_dependency_built_once_per_source(tmp_path):
+    """
+    Test that a path dependency is rebuilt only when its source changes
+    """
+    # Given
+    project_dir = tmp_path / "libs" / "internal_lib"
+    write_project(project_dir, "1.0", 1)
+    requirements = f"internal-lib @ {project_dir.as_uri()}\n"
+    source_wheels = SourceWheels(tmp_path / "cache")
+
+    # When
+    _, first_built = source_wheels.rewrite(requirements)
+    (project_dir / "build").mkdir()
+    (project_dir / "build" / "output.txt").write_text("build output\n")
+    _, second_built = source_wheels.rewrite(requirements)
+    (project_dir / "internal_lib.py").write_text("VALUE = 2\n")
+    text, third_built = source_wheels.rewrite(requirements)
+
+    # Then
+    assert first_built == ["internal_lib-1.0-py3-none-any.whl"]
+    # test: build outputs in the source tree do not cause a rebuild
+    assert second_built == []
+    # test: a changed source does
+    assert third_built == ["internal_lib-1.0-py3-none-any.whl"]
+    assert wheel_module(text.splitlines()[0]) == "VALUE = 2\n"
+
+
+def test_source_of_other_requirements():
+    """
+    Test that only git dependencies pinned to a commit and local path dependencies are built
+    """
+    # Given
+    lines = [
+        "pyyaml==6.0.1",
+        "internal-lib @ git+https://github.com/org/internal-lib.git@main",
+        "internal-lib @ https://example.com/internal_lib-1.0.tar.gz",
+        "internal-lib @ file:///does/not/exist",
+        "--extra-index-url https://example.com/simple",
+    ]
+
+    # When
+    sources = [source_of(line) for line in lines]
+
+    # Then
+    assert sources == [None] * len(lines)
@@ -0,0 +1,146 @@
+import yaml
+
+from poetry_aws_sam.staging import NativeStaging
+
+TEMPLATE = """
+Globals:
+  Function:
+    Runtime: python3.11
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: one
+      Handler: app.handler.handler
+      Role: !GetAtt Role.Arn
+  Two:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: two/
+      Handler: app.handler.handler
+  Api:
+    Type: AWS::Serverless::Api
+    Properties:
+      DefinitionUri: api.yaml
+"""
+
+
+def test_native_staging(tmp_path):
+    """
+    Test that function code is copied into the build dir without excluded files
+    and that the built template points at the copies
+    """
+    # Given
+    for name in ("one", "two"):
+        (tmp_path / name / "app" / "__pycache__").mkdir(parents=True)
+        (tmp_path / name / "app" / "handler.py").write_text("def handler(event, context): ...\n")
+        (tmp_path / name / "app" / "__pycache__" / "handler.cpython-311.pyc").write_bytes(b"")
+        (tmp_path / name / "tests").mkdir()
+    (tmp_path / "api.yaml").write_text("openapi: 3.0.1\n")
+    (tmp_path / "template.yaml").write_text(TEMPLATE)
+    build_dir = tmp_path / ".aws-sam" / "build"
+    staging = NativeStaging(tmp_path / "template.yaml", build_dir, excludes=["tests"])
+
+    # When
+    reasons = staging.unsupported()
+    staging.stage(jobs=2)
+
+    # Then
+    assert reasons == []
+    # test: code is copied without the excluded files
+    assert (build_dir / "One" / "app" / "handler.py").exists()
+    assert (build_dir / "Two" / "app" / "handler.py").exists()
+    assert not (build_dir / "One" / "app" / "__pycache__").exists()
+    assert not (build_dir / "One" / "tests").exists()
+    # test: the built template points at the build dirs and keeps intrinsic functions
+    template = yaml.safe_load((build_dir / "template.yaml").read_text())
+    assert template["Resources"]["One"]["Properties"]["CodeUri"] == "One"
+    assert template["Resources"]["One"]["Properties"]["Role"] == {"Fn::GetAtt": ["Role", "Arn"]}
+    assert template["Resources"]["Api"]["Properties"]["DefinitionUri"] == "../../api.yaml"
+
+
+def test_native_staging_unsupported(tmp_path):
+    """
+    Test that templates with functions that need 'sam build' are reported
+    """
+    # Given
+    (tmp_path / "template.yaml").write_text(TEMPLATE + """
+  Node:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: node
+      Handler: index.handler
+      Runtime: nodejs20.x
+""")
+
+    # When
+    reasons = NativeStaging(tmp_path / "template.yaml", tmp_path / "build", excludes=[]).unsupported()
+
+    # Then
+    assert reasons == ["Node is not a python function"]
+
+
+def test_native_staging_unsupported_local_paths(tmp_path):
+    """
+    Test that the resources with a local path that native staging does not rewrite need 'sam build'
+
+    Parameters:
+    - local paths of a layer, a state machine, a nested stack, a GraphQL api and an AWS::Include
+    - the same properties pointing at S3 and https
+    """
+    # Given
+    (tmp_path / "template.yaml").write_text(TEMPLATE + """
+  Layer:
+    Type: AWS::Lambda::LayerVersion
+    Properties:
+      Content: layer/
+  Machine:
+    Type: AWS::StepFunctions::StateMachine
+    Properties:
+      DefinitionS3Location: machine.asl.json
+  Nested:
+    Type: AWS::CloudFormation::Stack
+    Properties:
+      TemplateURL: nested.yaml
+  GraphQL:
+    Type: AWS::Serverless::GraphQLApi
+    Properties:
+      SchemaUri: schema.graphql
+      Functions:
+        Get:
+          CodeUri: resolvers/get.js
+  RemoteLayer:
+    Type: AWS::Lambda::LayerVersion
+    Properties:
+      Content:
+        S3Bucket: artifacts
+        S3Key: layer.zip
+  RemoteStack:
+    Type: AWS::CloudFormation::Stack
+    Properties:
+      TemplateURL: https://artifacts.s3.amazonaws.com/nested.yaml
+  RemoteApi:
+    Type: AWS::ApiGateway::RestApi
+    Properties:
+      BodyS3Location: s3://artifacts/api.yaml
+Outputs:
+  Included:
+    Fn::Transform:
+      Name: AWS::Include
+      Parameters:
+        Location: include.yaml
+""")
+
+    # When
+    reasons = NativeStaging(tmp_path / "template.yaml", tmp_path / "build", excludes=[]).unsupported()
+
+    # Then
+    # test: every local path is reported, the S3 objects and urls are not
+    assert reasons == [
+        "Layer has the local path layer/",
+        "Machine has the local path machine.asl.json",
+        "Nested has the local path nested.yaml",
+        "GraphQL has the local path schema.graphql",
+        "GraphQL has the local path resolvers/get.js",
+        "AWS::Include of the local file include.yaml",
+    ]
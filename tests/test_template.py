@@ -0,0 +1,125 @@
+import os
+
+import yaml
+
+from poetry_aws_sam.aws import Sam
+from poetry_aws_sam.template import IntrinsicResolver, read_template, write_template
+
+TEMPLATE = """
+Parameters:
+  Stage:
+    Type: String
+    Default: dev
+  Runtime:
+    Type: String
+    Default: python3.11
+Mappings:
+  Code:
+    dev:
+      Uri: src/dev
+    prod:
+      Uri: src/prod
+Globals:
+  Function:
+    Runtime: !Ref Runtime
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: !FindInMap [Code, !Ref Stage, Uri]
+      Handler: !Sub "app.${Stage}.handler"
+      Role: !GetAtt Role.Arn
+"""
+
+
+def test_resolve_intrinsic_functions(tmp_path):
+    """
+    Test that CodeUri, Handler and Runtime given through intrinsic functions
+    are resolved against Parameters, overrides and Mappings
+    """
+    # Given
+    template_file = tmp_path / "template.yaml"
+    template_file.write_text(TEMPLATE)
+
+    # When
+    sam = Sam(sam_exec="sam", template=template_file)
+    sam_prod = Sam(sam_exec="sam", template=template_file, parameter_overrides={"Stage": "prod"})
+
+    # Then
+    assert sam.lambdas[0].handler == "app.dev.handler"
+    assert sam.lambdas[0].code_uri == "src/dev"
+    assert sam.lambdas[0].runtime == "python3.11"
+    assert sam_prod.lambdas[0].code_uri == "src/prod"
+    # test: references to resources are kept as structured nodes
+    assert sam.template["Resources"]["One"]["Properties"]["Role"] == {"Fn::GetAtt": ["Role", "Arn"]}
+
+
+def test_resolver_unresolved():
+    """
+    Test that values that cannot be resolved locally are returned unchanged
+    """
+    # Given
+    resolver = IntrinsicResolver({"Parameters": {"Name": {"Type": "String"}}})
+
+    # When / Then
+    assert resolver.resolve({"Ref": "Name"}) == {"Ref": "Name"}
+    assert resolver.resolve({"Fn::Sub": "${Name}-${!Literal}"}) == {"Fn::Sub": "${Name}-${!Literal}"}
+    assert resolver.resolve({"Fn::Sub": ["${Name}-${!Literal}", {"Name": "x"}]}) == "x-${Literal}"
+    assert resolver.resolve({"Fn::Join": ["-", ["a", {"Ref": "AWS::Partition"}]]}) == "a-aws"
+
+
+def test_read_template_cache(tmp_path):
+    """
+    Test that the parse is reused until the file changes and that the
+    global yaml loader is left untouched
+    """
+    # Given
+    template_file = tmp_path / "template.yaml"
+    template_file.write_text("Resources: {}\n")
+
+    # When
+    first = read_template(template_file)
+    first["Resources"]["Added"] = {}
+    second = read_template(template_file)
+    template_file.write_text("Resources: {Changed: {}}\n")
+    stat = template_file.stat()
+    os.utime(template_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    third = read_template(template_file)
+
+    # Then
+    # test: callers get their own copy of the cached template
+    assert second == {"Resources": {}}
+    # test: a changed file is parsed again
+    assert third == {"Resources": {"Changed": {}}}
+    # test: short form tags are still rejected by yaml.safe_load
+    assert "!" not in yaml.SafeLoader.yaml_multi_constructors
+
+
+def test_read_template_condition(tmp_path):
+    """
+    Test that `!Condition` is read as its long form and written back as valid CloudFormation
+    """
+    # Given
+    template_file = tmp_path / "template.yaml"
+    template_file.write_text("""
+Conditions:
+  IsProd: !Equals [!Ref Stage, prod]
+  IsProdEu: !And [!Condition IsProd, !Equals [!Ref AWS::Region, eu-west-1]]
+Resources:
+  One:
+    Type: AWS::Serverless::Function
+    Properties:
+      MemorySize: !If [IsProdEu, 1024, 128]
+""")
+
+    # When
+    template = read_template(template_file)
+    write_template(tmp_path / "built.yaml", template)
+
+    # Then
+    # test: the condition has no Fn:: prefix, the functions around it do
+    assert template["Conditions"]["IsProdEu"] == {
+        "Fn::And": [{"Condition": "IsProd"}, {"Fn::Equals": [{"Ref": "AWS::Region"}, "eu-west-1"]}]
+    }
+    # test: the written template reads back the same
+    assert read_template(tmp_path / "built.yaml") == template
@@ -0,0 +1,81 @@
+import json
+import threading
+
+from poetry_aws_sam.timings import Timings
+
+
+def test_timings_stages_and_hooks():
+    """
+    Test that stages are recorded per function and passed to the hooks
+    """
+    # Given
+    received = []
+    timings = Timings(hooks=[received.append])
+
+    # When
+    with timings.stage("template parse"):
+        pass
+    with timings.function("One"):
+        with timings.stage("export"):
+            pass
+        with timings.stage("pip install", subprocess=True):
+            pass
+
+    # Then
+    # test: every stage is recorded, in order, and given to the hook
+    assert [event.stage for event in timings.events] == ["template parse", "export", "pip install"]
+    assert received == timings.events
+    # test: stages are attributed to the function of the thread
+    assert [event.function for event in timings.events] == [None, "One", "One"]
+    assert timings.events[2].subprocess
+    assert all(event.wall >= 0 and event.cpu >= 0 for event in timings.events)
+
+
+def test_timings_function_is_per_thread():
+    """
+    Test that the current function of one thread does not leak into another
+    """
+    # Given
+    timings = Timings()
+
+    def build():
+        with timings.stage("export"):
+            pass
+
+    # When
+    with timings.function("One"):
+        thread = threading.Thread(target=build)
+        thread.start()
+        thread.join()
+
+    # Then
+    assert timings.events[0].function is None
+
+
+def test_timings_summary_and_trace(tmp_path):
+    """
+    Test the summary table and the chrome trace file
+    """
+    # Given
+    timings = Timings()
+    for name in ["One", "Two"]:
+        with timings.function(name), timings.stage("pip install", subprocess=True):
+            pass
+
+    # When
+    summary = timings.summary()
+    timings.write_trace(tmp_path / "trace.json")
+
+    # Then
+    # test: one row per stage, then one row per function
+    assert summary[0].split() == ["Stage", "Calls", "Wall", "CPU", "Slowest"]
+    assert summary[1].startswith("pip install  2 ")
+    assert [line.split()[0] for line in summary[-2:]] == ["One", "Two"]
+    # test: the trace holds complete events in microseconds
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    event = trace["traceEvents"][0]
+    assert event["ph"] == "X"
+    assert event["name"] == "pip install"
+    assert event["cat"] == "subprocess"
+    assert event["args"]["function"] == "One"
+    assert isinstance(event["ts"], int) and isinstance(event["dur"], int)
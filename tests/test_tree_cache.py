@@ -0,0 +1,124 @@
+import os
+import threading
+
+from poetry_aws_sam.platforms import InstallTarget
+from poetry_aws_sam.tree_cache import TreeCache, tree_key
+
+
+def fake_install(files):
+    """
+    An install writing `files` into the tree, counting its calls.
+    """
+    calls = []
+
+    def install(tree):
+        calls.append(tree)
+        (tree / "package").mkdir(parents=True)
+        for name, content in files.items():
+            (tree / "package" / name).write_text(content)
+
+    return install, calls
+
+
+def test_tree_cache_install_and_reuse(tmp_path):
+    """
+    Test that a tree is installed once and then linked into other targets
+    """
+    # Given
+    tree_cache = TreeCache(tmp_path / "cache")
+    key = tree_key("pyyaml==6.0.1\n", InstallTarget("x86_64", "311"), "pip")
+    install, calls = fake_install({"__init__.py": "VERSION = 1\n"})
+
+    # When
+    first = tree_cache.install(key, tmp_path / "one", install)
+    second = tree_cache.install(key, tmp_path / "two", install)
+
+    # Then
+    # test: installed on the first use only
+    assert (first, second) == (False, True)
+    assert len(calls) == 1
+    assert (tmp_path / "one" / "package" / "__init__.py").read_text() == "VERSION = 1\n"
+    assert (tmp_path / "two" / "package" / "__init__.py").read_text() == "VERSION = 1\n"
+    # test: the key depends on the install target and the installer
+    assert key != tree_key("pyyaml==6.0.1\n", InstallTarget("arm64", "311"), "pip")
+    assert key != tree_key("pyyaml==6.0.1\n", InstallTarget("x86_64", "311"), "unpack")
+    # test: no partial install is left
+    assert list((tmp_path / "cache" / "partial").iterdir()) == []
+
+
+def test_tree_cache_evicts_least_recently_used(tmp_path):
+    """
+    Test that the least recently used trees are evicted once the cache is over its size
+    """
+    # Given
+    tree_cache = TreeCache(tmp_path / "cache", max_size=250)
+    for index, key in enumerate(["a", "b"]):
+        install, _ = fake_install({"module.py": "x" * 100})
+        tree_cache.install(key, tmp_path / "target", install)
+        os.utime(tree_cache.trees_dir / f"{key}.json", (1000 + index, 1000 + index))
+    # "a" is used again, which makes "b" the least recently used
+    tree_cache.install("a", tmp_path / "target", fake_install({})[0])
+
+    # When
+    install, _ = fake_install({"module.py": "x" * 100})
+    tree_cache.install("c", tmp_path / "target", install)
+
+    # Then
+    assert [entry.key for entry in tree_cache.entries()] == ["a", "c"]
+    assert not (tree_cache.trees_dir / "b").exists()
+
+
+def test_tree_cache_parallel_installs(tmp_path):
+    """
+    Test that parallel builds of the same tree install it once
+    """
+    # Given
+    tree_cache = TreeCache(tmp_path / "cache")
+    started = threading.Event()
+    calls = []
+
+    def slow_install(tree):
+        calls.append(tree)
+        started.set()
+        (tree / "package").mkdir(parents=True)
+        (tree / "package" / "__init__.py").write_text("")
+
+    results = {}
+
+    def build(name):
+        results[name] = tree_cache.install("key", tmp_path / name, slow_install)
+
+    # When
+    threads = [threading.Thread(target=build, args=(f"target{index}",)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Then
+    assert len(calls) == 1
+    assert sorted(results.values()) == [False, True, True, True]
+    assert all((tmp_path / f"target{index}" / "package" / "__init__.py").exists() for index in range(4))
+
+
+def test_tree_cache_clear(tmp_path):
+    """
+    Test that clearing removes every tree and that a tree left half removed is not used
+    """
+    # Given
+    tree_cache = TreeCache(tmp_path / "cache")
+    tree_cache.install("a", tmp_path / "target", fake_install({"module.py": ""})[0])
+    tree_cache.install("b", tmp_path / "target", fake_install({"module.py": ""})[0])
+    # a build killed while removing "b"
+    (tree_cache.trees_dir / "b.json").unlink()
+
+    # When
+    removed = tree_cache.clear()
+
+    # Then
+    assert [entry.key for entry in removed] == ["a"]
+    assert tree_cache.entries() == []
+    # test: the half removed tree is installed again
+    install, calls = fake_install({"module.py": ""})
+    assert tree_cache.install("b", tmp_path / "other", install) is False
+    assert len(calls) == 1
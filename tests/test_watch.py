@@ -0,0 +1,82 @@
+from poetry_aws_sam.watch import PollingWatcher, snapshot, sync_files
+
+
+def test_polling_watcher_poll(tmp_path):
+    """
+    Test that added, changed and removed files are reported per root
+    """
+    # Given
+    (tmp_path / "one" / "__pycache__").mkdir(parents=True)
+    (tmp_path / "one" / "handler.py").write_text("a = 1\n")
+    (tmp_path / "one" / "old.py").write_text("")
+    (tmp_path / "poetry.lock").write_text("")
+    watcher = PollingWatcher(
+        {"One": tmp_path / "one", "poetry.lock": tmp_path / "poetry.lock"}, excludes=["__pycache__", "*.pyc"]
+    )
+
+    # When
+    (tmp_path / "one" / "handler.py").write_text("a = 22\n")
+    (tmp_path / "one" / "new.py").write_text("")
+    (tmp_path / "one" / "old.py").unlink()
+    (tmp_path / "one" / "__pycache__" / "handler.cpython-311.pyc").write_text("")
+
+    # Then
+    assert watcher.poll() == {"One": {"handler.py", "new.py", "old.py"}}
+    # test: a change is only reported once
+    assert watcher.poll() == {}
+    # test: a file root has a single entry
+    (tmp_path / "poetry.lock").write_text("changed")
+    assert watcher.poll() == {"poetry.lock": {"."}}
+
+
+def test_polling_watcher_debounce(tmp_path):
+    """
+    Test that changes are merged until nothing changes for the debounce time
+    """
+    # Given
+    now = [0.0]
+    polls = [{}, {"One": {"a.py"}}, {"One": {"b.py"}}, {}, {}, {}, {}]
+    watcher = PollingWatcher(
+        {}, excludes=[], interval=0.1, debounce=0.25, clock=lambda: now[0], sleep=lambda seconds: None
+    )
+
+    def poll():
+        now[0] += 0.1
+        return polls.pop(0)
+
+    watcher.poll = poll
+
+    # When
+    changes = watcher.wait()
+
+    # Then
+    # test: both changes come in one rebuild, after the quiet time
+    assert changes == {"One": {"a.py", "b.py"}}
+    assert polls == [{}]
+    # test: a stopped watcher returns no changes
+    assert watcher.wait(should_stop=lambda: True) == {}
+
+
+def test_sync_files(tmp_path):
+    """
+    Test that only the changed files are copied and deleted files are removed
+    """
+    # Given
+    source, target = tmp_path / "source", tmp_path / "target"
+    (source / "app").mkdir(parents=True)
+    (source / "app" / "handler.py").write_text("new")
+    (target / "app").mkdir(parents=True)
+    (target / "app" / "handler.py").write_text("old")
+    (target / "app" / "removed.py").write_text("")
+    (target / "requests").mkdir()
+
+    # When
+    result = sync_files(source, target, {"app/handler.py", "app/removed.py"})
+
+    # Then
+    assert result == (1, 1)
+    assert (target / "app" / "handler.py").read_text() == "new"
+    assert not (target / "app" / "removed.py").exists()
+    # test: the installed packages are left alone
+    assert (target / "requests").is_dir()
+    assert snapshot(target / "missing", []) == {}
@@ -0,0 +1,92 @@
+from packaging.utils import canonicalize_name
+from packaging.version import Version
+
+from poetry_aws_sam.platforms import InstallTarget
+from poetry_aws_sam.wheelhouse import Wheelhouse, parse_pins
+
+REQUIREMENTS = """pyyaml==6.0.1 ; python_version >= "3.10" and python_version < "4.0" \\
+    --hash=sha256:aaa \\
+    --hash=sha256:bbb
+click==8.1.7 ; python_version >= "3.10"
+--extra-index-url https://example.com/simple
+internal @ git+https://github.com/example/internal.git@abc123
+"""
+
+
+def test_parse_pins():
+    """
+    Test that pins are read from an exported requirements file
+    with hashes, options and url requirements
+    """
+    # When
+    pins, others = parse_pins(REQUIREMENTS)
+
+    # Then
+    # test: the pinned requirements keep their full line with hashes
+    assert [(pin.name, pin.version) for pin in pins] == [("pyyaml", "6.0.1"), ("click", "8.1.7")]
+    assert "--hash=sha256:bbb" in pins[0].line
+    # test: options and urls are not pins
+    assert others == [
+        "--extra-index-url https://example.com/simple",
+        "internal @ git+https://github.com/example/internal.git@abc123",
+    ]
+
+
+def test_wheelhouse_missing_and_prune(tmp_path):
+    """
+    Test the lookup of wheels per platform and the removal of unused wheels
+    """
+    # Given
+    wheelhouse = Wheelhouse(tmp_path)
+    target = InstallTarget(architecture="x86_64", python_version="311")
+    tag_dir = wheelhouse.tag_dir(target)
+    tag_dir.mkdir(parents=True)
+    (tag_dir / "PyYAML-6.0.1-cp311-cp311-manylinux_2_17_x86_64.manylinux2014_x86_64.whl").touch()
+    (tag_dir / "click-8.1.6-py3-none-any.whl").touch()
+    pins, _ = parse_pins(REQUIREMENTS)
+
+    # When
+    missing = wheelhouse.missing(pins, target)
+    removed = wheelhouse.prune({(canonicalize_name("pyyaml"), Version("6.0.1"))})
+
+    # Then
+    # test: only the pin without a matching wheel is missing
+    assert [pin.name for pin in missing] == ["click"]
+    # test: the wheel of a version outside the lock is pruned
+    assert [wheel.name for wheel in removed] == ["click-8.1.6-py3-none-any.whl"]
+    assert sorted(wheel.name for wheel in tag_dir.iterdir()) == [
+        "PyYAML-6.0.1-cp311-cp311-manylinux_2_17_x86_64.manylinux2014_x86_64.whl"
+    ]
+    # test: the other platforms do not share the wheels
+    assert len(wheelhouse.missing(pins, InstallTarget(architecture="arm64", python_version="311"))) == 2
+
+
+def test_wheelhouse_missing_markers(tmp_path):
+    """
+    Test that the pins excluded on lambda by their markers are never missing
+
+    Parameters:
+    - a windows only pin, as click pulls colorama
+    - a pin of aarch64 only, on both architectures
+    """
+    # Given
+    wheelhouse = Wheelhouse(tmp_path)
+    pins, _ = parse_pins(
+        'colorama==0.4.6 ; platform_system == "Windows"\n'
+        'click==8.1.7 ; python_version >= "3.8"\n'
+        'arm-only==1.0 ; platform_machine == "aarch64"\n'
+    )
+    x86_target = InstallTarget(architecture="x86_64", python_version="311")
+    tag_dir = wheelhouse.tag_dir(x86_target)
+    tag_dir.mkdir(parents=True)
+    (tag_dir / "click-8.1.7-py3-none-any.whl").touch()
+
+    # When
+    x86_missing = wheelhouse.missing(pins, x86_target)
+    arm_missing = wheelhouse.missing(pins, InstallTarget(architecture="arm64", python_version="311"))
+
+    # Then
+    # test: a warm wheelhouse has nothing missing on x86_64
+    assert x86_missing == []
+    # test: the markers are evaluated for the lambda's architecture
+    assert [pin.name for pin in arm_missing] == ["click", "arm-only"]